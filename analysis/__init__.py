@@ -0,0 +1,8 @@
+"""Trace analysis module for Salsa2 Simulator."""
+from .mrc import MissRatioCurve, compute_trace_curves, stack_distances
+from .optimal import belady_hits, compute_trace_optimal, next_use, run_optimal
+from .profile import TraceProfile, load_profile, update_profile, zipf_alpha
+
+__all__ = ['MissRatioCurve', 'TraceProfile', 'belady_hits', 'compute_trace_curves',
+           'compute_trace_optimal', 'load_profile', 'next_use', 'run_optimal',
+           'stack_distances', 'update_profile', 'zipf_alpha']
@@ -0,0 +1,210 @@
+"""Offline-optimal (Belady) baselines for Salsa2 Simulator.
+
+Belady's MIN evicts the cached object whose next use lies furthest in the
+future, which gives the highest hit count any replacement policy can
+reach for a cache capacity. The next use of every trace position is
+precomputed in one backward pass, so the replay itself is a heap walk.
+
+Two baselines are stored per trace and capacity in Trace_Optimal:
+
+* 'belady' - one cache holding the capacity of all parents together.
+  The best hit ratio reachable at all; its cost charges every hit the
+  cheapest access cost, a lower bound for any parent selection.
+* 'partitioned' - a reference, not an optimum: objects are placed as in
+  the offline simulator (parent url_id % parents), every parent runs MIN
+  over its own share, and hits pay that parent's access cost. Access
+  costs never change a decision, so a run that places objects by cost
+  can beat it, on hits and on cost.
+"""
+import heapq
+from array import array
+from datetime import datetime
+from typing import List, NamedTuple, Optional, Sequence
+from zoneinfo import ZoneInfo
+
+from prettytable import PrettyTable
+
+from config.config import MyConfig
+from database.db_access import DBAccess
+
+VARIANTS = ('belady', 'partitioned')
+
+
+class OptimalResult(NamedTuple):
+    """An optimal baseline of a trace at one capacity."""
+    variant: str
+    capacity: int       # objects per parent
+    requests: int
+    hits: int
+    cost: float
+
+
+def next_use(url_ids: Sequence[int]) -> array:
+    """Position of the next request for the same URL, for every position.
+
+    Positions whose URL is never requested again get len(url_ids).
+    """
+    count = len(url_ids)
+    following = array('q', [count]) * count
+    seen = {}
+
+    for pos in range(count - 1, -1, -1):
+        url_id = url_ids[pos]
+        following[pos] = seen.get(url_id, count)
+        seen[url_id] = pos
+
+    return following
+
+
+def belady_hits(url_ids: Sequence[int], following: Sequence[int], capacity: int,
+                positions: Optional[Sequence[int]] = None) -> int:
+    """Hits of Belady's MIN replacement at a capacity.
+
+    Objects that are never requested again, or whose next use is further
+    away than that of everything cached, are not stored at all.
+
+    Args:
+        url_ids: Trace as integer URL IDs
+        following: next_use(url_ids)
+        capacity: Objects the cache holds
+        positions: Trace positions the cache sees, in order (default: all)
+
+    Returns:
+        int: Number of hits
+    """
+    never = len(url_ids)
+    cached = {}         # url_id -> position of its next use
+    heap = []           # (-next use, url_id), with stale entries
+    hits = 0
+
+    for pos in (range(never) if positions is None else positions):
+        url_id = url_ids[pos]
+        upcoming = following[pos]
+
+        if url_id in cached:
+            hits += 1
+        elif capacity <= 0 or upcoming == never:
+            continue
+        elif len(cached) >= capacity:
+            # Drop stale entries until the top is the furthest cached object
+            while cached.get(heap[0][1]) != -heap[0][0]:
+                heapq.heappop(heap)
+
+            if -heap[0][0] < upcoming:
+                continue
+            del cached[heapq.heappop(heap)[1]]
+
+        if upcoming == never:
+            del cached[url_id]
+        else:
+            cached[url_id] = upcoming
+            heapq.heappush(heap, (-upcoming, url_id))
+
+    return hits
+
+
+def run_optimal(url_ids: Sequence[int], parents, miss_penalty: float) -> List[OptimalResult]:
+    """Both baselines of a trace, for modeled parents.
+
+    Args:
+        url_ids: Trace as integer URL IDs
+        parents: ParentModel of every parent, with its capacity and access cost
+        miss_penalty: Cost of a request no parent could serve
+
+    Returns:
+        list: The 'belady' and 'partitioned' OptimalResult
+    """
+    requests = len(url_ids)
+    following = next_use(url_ids)
+    capacity = parents[0].capacity if parents else 0
+
+    hits = belady_hits(url_ids, following, sum(parent.capacity for parent in parents))
+    cheapest = min((parent.access_cost for parent in parents), default=0)
+    results = [OptimalResult('belady', capacity, requests, hits,
+                             hits * cheapest + (requests - hits) * miss_penalty)]
+
+    # The offline simulator's placement: by URL ID, in order of first appearance
+    count = len(parents)
+    shares = [[] for _ in parents]
+    for pos, url_id in enumerate(url_ids):
+        shares[url_id % count].append(pos)
+
+    hits = 0
+    cost = 0.0
+    for parent, positions in zip(parents, shares):
+        parent_hits = belady_hits(url_ids, following, parent.capacity, positions)
+        hits += parent_hits
+        cost += parent_hits * parent.access_cost
+    cost += (requests - hits) * miss_penalty
+
+    results.append(OptimalResult('partitioned', capacity, requests, hits, cost))
+    return results
+
+
+def save_optimal(trace_id: int, results: Sequence[OptimalResult], miss_penalty: float):
+    """Store baselines in Trace_Optimal, replacing older ones at the same capacity."""
+    now = datetime.now(ZoneInfo("Asia/Jerusalem"))
+
+    DBAccess.cursor.executemany(
+        """INSERT OR REPLACE INTO Trace_Optimal(
+            'Trace_ID', 'Variant', 'Capacity', 'Requests', 'Hits', 'Cost',
+            'Miss_Penalty', 'Created')
+            VALUES (?,?,?,?,?,?,?,?)""",
+        [(trace_id, *result, miss_penalty, now) for result in results])
+    DBAccess.conn.commit()
+
+
+def print_optimal(results: Sequence[OptimalResult]):
+    table = PrettyTable()
+    table.field_names = ['Variant', 'Capacity/parent', 'Requests', 'Hits',
+                         'Hit ratio', 'Cost', 'Avg cost']
+
+    for result in results:
+        table.add_row([result.variant,
+                       result.capacity,
+                       result.requests,
+                       result.hits,
+                       f"{result.hits / result.requests:.3f}" if result.requests else '-',
+                       f"{result.cost:.2f}",
+                       f"{result.cost / result.requests:.3f}" if result.requests else '-'])
+
+    print(table)
+
+
+def compute_trace_optimal(trace_id: int, capacities: Sequence[int]) -> List[OptimalResult]:
+    """Compute and store the optimal baselines of a trace.
+
+    Parents, their access costs and the miss penalty come from the
+    configuration, as in offline runs.
+
+    Args:
+        trace_id: ID of the trace
+        capacities: Capacities to evaluate, in objects per parent
+
+    Returns:
+        list: OptimalResult of every variant and capacity
+    """
+    # Import here to avoid circular dependency
+    from simulation.offline import load_trace, parents_from_registry
+
+    try:
+        miss_penalty = float(MyConfig().get_key('miss_penalty') or 0)
+    except (TypeError, ValueError):
+        miss_penalty = 0.0
+
+    trace, url_ids = load_trace(trace_id)
+    results = []
+
+    with trace:
+        for capacity in capacities:
+            parents = parents_from_registry(capacity)
+            if not parents:
+                print("No parent caches found in squid.conf - nothing to evaluate.")
+                return []
+
+            results.extend(run_optimal(url_ids, parents, miss_penalty))
+
+    save_optimal(trace_id, results, miss_penalty)
+    print_optimal(results)
+
+    return results
@@ -0,0 +1,223 @@
+"""Single-pass trace profiles for Salsa2 Simulator.
+
+A trace profile tells the shape of a trace before it is run:
+
+* distinct URLs, and the fraction of them requested only once
+  (one-hit wonders, which no cache can ever hit)
+* a Zipf alpha estimate - the slope of the rank/frequency line on a
+  log-log scale, fitted by least squares over the URLs requested more
+  than once (the flat tail of one-hit wonders would drag it down)
+* the working set - the distinct URLs within every window of
+  `profile_window` consecutive entries, as its mean and maximum
+* the `profile_top` most requested URLs
+
+URLs are counted by canonical hash (see database.url_index) in
+Trace_URL_Counts, and the profile is stored in Trace_Stats along with the
+last entry it covers. Entries appended later are folded in by reading only
+them, plus the last window before them; a trace whose entries were
+deleted is profiled again from scratch.
+"""
+import hashlib
+import json
+import math
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from config.config import MyConfig
+from database.db_access import DBAccess
+from database.url_index import url_hash
+
+READ_BATCH = 50000
+
+
+class TraceProfile(NamedTuple):
+    """Stored profile of a trace."""
+    trace_id: int
+    entries: int
+    distinct: int
+    one_hit: int
+    alpha: Optional[float]
+    window: int
+    windows: int                  # Full windows of `window` entries
+    ws_mean: Optional[float]      # None when the trace is shorter than a window
+    ws_max: int
+    top: List[Tuple[str, int]]    # (URL, requests), most requested first
+
+    @property
+    def one_hit_fraction(self) -> float:
+        return self.one_hit / self.distinct if self.distinct else 0.0
+
+
+def _entry_hash(url: str, value: Optional[int]) -> int:
+    """URL_Hash of an entry, computed for entries stored without one."""
+    if value is not None:
+        return value
+    value = url_hash(url)
+    if value is None:
+        # Not an HTTP(S) URL - count it by its exact text
+        value = int.from_bytes(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest(),
+                               'little', signed=True)
+    return value
+
+
+def zipf_alpha(counts: List[int]) -> Optional[float]:
+    """Least-squares Zipf exponent of request counts sorted in descending
+    order, over the counts above 1. None if fewer than two remain."""
+    points = [(math.log(rank), math.log(count))
+              for rank, count in enumerate(counts, start=1) if count > 1]
+    if len(points) < 2:
+        return None
+
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+    return -slope
+
+
+def _stored(trace_id: int):
+    DBAccess.cursor.execute("""SELECT Entries, Max_ID, WS_Window, WS_Windows, WS_Sum, WS_Max
+                            FROM Trace_Stats
+                            WHERE Trace_ID = ?""", [trace_id])
+    return DBAccess.cursor.fetchone()
+
+
+def _reset(trace_id: int):
+    DBAccess.cursor.execute("DELETE FROM Trace_URL_Counts WHERE Trace_ID = ?", [trace_id])
+    DBAccess.cursor.execute("DELETE FROM Trace_Stats WHERE Trace_ID = ?", [trace_id])
+
+
+def update_profile(trace_id: int) -> Optional[TraceProfile]:
+    """Bring a trace's profile up to date and return it.
+
+    Only entries added since the last update are read, unless the trace
+    lost entries or `profile_window` changed since, in which case the
+    whole trace is profiled again.
+
+    Returns:
+        The profile, or None if the trace has no entries
+    """
+    config = MyConfig()
+    window = max(config.get_int('profile_window', 10000), 1)
+    top_k = max(config.get_int('profile_top', 10), 1)
+
+    DBAccess.cursor.execute("""SELECT COUNT(*), COALESCE(MAX(id), 0)
+                            FROM Trace_Entry
+                            WHERE Trace_ID = ?""", [trace_id])
+    entries, max_id = DBAccess.cursor.fetchone()
+    if not entries:
+        _reset(trace_id)
+        DBAccess.conn.commit()
+        return None
+
+    stored = _stored(trace_id)
+    if stored:
+        done, done_id, stored_window, windows, ws_sum, ws_max = stored
+        if done == entries and done_id == max_id:
+            return load_profile(trace_id)
+
+        DBAccess.cursor.execute("""SELECT COUNT(*) FROM Trace_Entry
+                                WHERE Trace_ID = ? AND id > ?""", [trace_id, done_id])
+        if stored_window != window or done + DBAccess.cursor.fetchone()[0] != entries:
+            stored = None
+
+    if not stored:
+        _reset(trace_id)
+        done, done_id, windows, ws_sum, ws_max = 0, 0, 0, 0, 0
+
+    # Its own cursor, as the counts are written while entries are read
+    cursor = DBAccess.conn.cursor()
+
+    # The window slides in from the entries already profiled
+    recent = deque()
+    in_window: Dict[int, int] = {}
+    if done:
+        cursor.execute("""SELECT URL, URL_Hash FROM Trace_Entry
+                       WHERE Trace_ID = ? AND id <= ?
+                       ORDER BY id DESC LIMIT ?""", [trace_id, done_id, window - 1])
+        for url, value in reversed(cursor.fetchall()):
+            value = _entry_hash(url, value)
+            recent.append(value)
+            in_window[value] = in_window.get(value, 0) + 1
+
+    counts: Dict[int, List] = {}
+    cursor.execute("""SELECT URL, URL_Hash FROM Trace_Entry
+                   WHERE Trace_ID = ? AND id > ?
+                   ORDER BY id""", [trace_id, done_id])
+    while True:
+        rows = cursor.fetchmany(READ_BATCH)
+        if not rows:
+            break
+
+        for url, value in rows:
+            value = _entry_hash(url, value)
+            counted = counts.get(value)
+            if counted:
+                counted[1] += 1
+            else:
+                counts[value] = [url, 1]
+
+            recent.append(value)
+            in_window[value] = in_window.get(value, 0) + 1
+            if len(recent) > window:
+                oldest = recent.popleft()
+                left = in_window[oldest] - 1
+                if left:
+                    in_window[oldest] = left
+                else:
+                    del in_window[oldest]
+
+            if len(recent) == window:
+                windows += 1
+                ws_sum += len(in_window)
+                ws_max = max(ws_max, len(in_window))
+
+    DBAccess.cursor.executemany(
+        """INSERT INTO Trace_URL_Counts(Trace_ID, URL_Hash, URL, Count)
+        VALUES (?,?,?,?)
+        ON CONFLICT(Trace_ID, URL_Hash) DO UPDATE SET Count = Count + excluded.Count""",
+        ((trace_id, value, url, count) for value, (url, count) in counts.items()))
+
+    DBAccess.cursor.execute("""SELECT Count FROM Trace_URL_Counts
+                            WHERE Trace_ID = ?
+                            ORDER BY Count DESC""", [trace_id])
+    frequencies = [count for (count,) in DBAccess.cursor.fetchall()]
+
+    DBAccess.cursor.execute("""SELECT URL, Count FROM Trace_URL_Counts
+                            WHERE Trace_ID = ?
+                            ORDER BY Count DESC LIMIT ?""", [trace_id, top_k])
+    top = DBAccess.cursor.fetchall()
+
+    # A trace shorter than a window has one, partial, window - all of it
+    if not windows:
+        ws_max = len(in_window)
+
+    DBAccess.cursor.execute(
+        """INSERT OR REPLACE INTO Trace_Stats(
+            'Trace_ID', 'Entries', 'Max_ID', 'Distinct_URLs', 'One_Hit', 'Alpha',
+            'WS_Window', 'WS_Windows', 'WS_Sum', 'WS_Max', 'Top', 'Updated')
+            VALUES (?,?,?,?,?,?,?,?,?,?,?,?)""",
+        [trace_id, entries, max_id, len(frequencies), frequencies.count(1),
+         zipf_alpha(frequencies), window, windows, ws_sum, ws_max, json.dumps(top),
+         datetime.now(ZoneInfo("Asia/Jerusalem"))])
+    DBAccess.conn.commit()
+
+    return load_profile(trace_id)
+
+
+def load_profile(trace_id: int) -> Optional[TraceProfile]:
+    """Stored profile of a trace, or None if it was never profiled."""
+    DBAccess.cursor.execute("""SELECT Entries, Distinct_URLs, One_Hit, Alpha, WS_Window,
+                            WS_Windows, WS_Sum, WS_Max, Top
+                            FROM Trace_Stats
+                            WHERE Trace_ID = ?""", [trace_id])
+    row = DBAccess.cursor.fetchone()
+    if row is None:
+        return None
+
+    entries, distinct, one_hit, alpha, window, windows, ws_sum, ws_max, top = row
+    return TraceProfile(trace_id, entries, distinct, one_hit, alpha, window, windows,
+                        ws_sum / windows if windows else None, ws_max,
+                        [tuple(item) for item in json.loads(top)])
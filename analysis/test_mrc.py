@@ -0,0 +1,80 @@
+"""Tests for analysis/mrc.py, against a plain LRU stack and simulation."""
+import random
+
+import pytest
+
+from analysis.mrc import compute_curves, stack_distances
+from metrics.histogram import EXACT, _bucket_of
+from simulation.offline import ParentModel, simulate
+
+
+def _naive_distances(url_ids, sizes=None):
+    """Object and byte stack distance of every warm request, by walking an
+    LRU stack (most recent first)."""
+    stack = []
+    distances = []
+    for url_id in url_ids:
+        if url_id in stack:
+            above = stack[:stack.index(url_id) + 1]
+            distances.append((len(above),
+                              sum(sizes[other] for other in above) if sizes else 0,
+                              sizes[url_id] if sizes else 0))
+            stack.remove(url_id)
+        stack.insert(0, url_id)
+    return distances
+
+
+def _random_trace(seed, distinct, length):
+    rng = random.Random(seed)
+    return [min(int(rng.paretovariate(1.0)), distinct) - 1 for _ in range(length)]
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_stack_distances(seed):
+    # Distances stay below EXACT, where buckets hold a single value
+    url_ids = _random_trace(seed, 30, 500)
+    rng = random.Random(seed)
+    sizes = [rng.randint(1, 4) for _ in range(30)]
+
+    objects, weighted = stack_distances(url_ids, sizes)
+    expected_objects = [0] * len(objects)
+    expected_bytes = [0] * len(weighted)
+    for distance, byte_distance, size in _naive_distances(url_ids, sizes):
+        assert byte_distance < EXACT
+        expected_objects[_bucket_of(distance)] += 1
+        expected_bytes[_bucket_of(byte_distance)] += size
+
+    assert list(objects) == expected_objects
+    assert list(weighted) == expected_bytes
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_curve_matches_lru_simulation(seed):
+    url_ids = _random_trace(seed, 100, 3000)
+    curve = compute_curves(url_ids)[0]
+
+    assert curve.requests == len(url_ids)
+    assert curve.cold == len(set(url_ids))
+
+    for capacity in (1, 2, 5, 10, 50, 99):
+        result = simulate(url_ids, [ParentModel('lru', 1.0, capacity)], 1.0, 'lru')
+        misses = result.requests - result.hit_count
+        assert curve.miss_ratio(capacity) == pytest.approx(misses / len(url_ids))
+
+
+def test_byte_curve_totals():
+    url_ids = [0, 1, 0, 2, 1, 0]
+    sizes = [10, 20, 30]
+    objects, nbytes = compute_curves(url_ids, sizes)
+
+    assert nbytes.total == 10 + 20 + 10 + 30 + 20 + 10
+    assert nbytes.cold == 60
+    # Every warm request hits once the cache holds all three objects
+    assert nbytes.miss_ratio(60) == pytest.approx(60 / 100)
+    assert objects.miss_ratio(3) == pytest.approx(3 / 6)
+
+
+def test_empty_trace():
+    curve = compute_curves([])[0]
+    assert curve.total == 0 and curve.points == []
+    assert curve.miss_ratio(10) == 0.0
@@ -0,0 +1,71 @@
+"""Tests for analysis/optimal.py, against an exhaustive search."""
+import random
+from functools import lru_cache
+
+import pytest
+
+from analysis.optimal import belady_hits, next_use, run_optimal
+from simulation.offline import ParentModel, simulate
+
+
+def _most_hits(url_ids, capacity):
+    """Most hits of any replacement, trying every choice on every miss."""
+    url_ids = tuple(url_ids)
+
+    @lru_cache(maxsize=None)
+    def best(pos, cached):
+        if pos == len(url_ids):
+            return 0
+
+        url_id = url_ids[pos]
+        if url_id in cached:
+            return 1 + best(pos + 1, cached)
+
+        # Not storing it is always a choice
+        options = [best(pos + 1, cached)]
+        if capacity > 0:
+            if len(cached) < capacity:
+                options.append(best(pos + 1, cached | {url_id}))
+            else:
+                options += [best(pos + 1, (cached - {evicted}) | {url_id})
+                            for evicted in cached]
+        return max(options)
+
+    return best(0, frozenset())
+
+
+def test_next_use():
+    assert list(next_use([1, 2, 1, 3, 2])) == [2, 4, 5, 5, 5]
+    assert list(next_use([])) == []
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_belady_matches_exhaustive_search(seed):
+    rng = random.Random(seed)
+    url_ids = [rng.randrange(6) for _ in range(rng.randint(0, 14))]
+    capacity = rng.randint(0, 3)
+
+    assert belady_hits(url_ids, next_use(url_ids), capacity) == _most_hits(url_ids, capacity)
+
+
+def test_belady_over_selected_positions():
+    url_ids = [0, 1, 0, 2, 1, 0]
+    # Only the positions of URL 0 - two hits with any capacity
+    assert belady_hits(url_ids, next_use(url_ids), 1, [0, 2, 5]) == 2
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_baselines_bound_the_simulator(seed):
+    rng = random.Random(seed)
+    url_ids = [min(int(rng.paretovariate(1.2)), 200) for _ in range(3000)]
+    parents = [ParentModel('near', 1.0, 20), ParentModel('far', 3.0, 20)]
+
+    belady, partitioned = run_optimal(url_ids, parents, 10.0)
+    lru = simulate(url_ids, parents, 10.0, 'lru')
+
+    assert belady.variant == 'belady' and partitioned.variant == 'partitioned'
+    # A shared cache can hold anything the per-parent ones do
+    assert belady.hits >= partitioned.hits
+    # Same placement as the simulator, so MIN there beats any policy
+    assert partitioned.hits >= lru.hit_count
+    assert belady.cost <= lru.total_cost
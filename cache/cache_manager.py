@@ -1,7 +1,9 @@
 """Cache management logic for Salsa2 Simulator."""
+import os
 import re
+import shlex
+import subprocess
 import time
-import requests
 
 DEBUG_MODE = False
 
@@ -160,7 +162,7 @@ def reset_all_caches():
         status is one of: 'ok', 'clear failed', 'restart failed',
         'unreachable after restart'.
     """
-    from http_requests.request_executor import get_proxies_for_cache
+    from http_requests.session_pool import close_sessions, get_session
     from cache.registry import get_all_caches
 
     caches = list(get_all_caches().items())
@@ -184,7 +186,8 @@ def reset_all_caches():
             break
 
         print(f"{progress} Verifying {name} ({ip}) is reachable...")
-        proxy = get_proxies_for_cache(http_host=ip)
+        # Pooled connections to this parent died with the restart
+        close_sessions(http_host=ip)
         last_error = None
         verified = False
         # Squid takes a moment to accept connections again right after a
@@ -193,10 +196,9 @@ def reset_all_caches():
             if attempt:
                 time.sleep(2)
             try:
-                response = requests.get(
+                response = get_session(http_host=ip).get(
                     "http://www.google.com",
                     headers={'X-Originally-HTTPS': '1'},
-                    proxies=proxy,
                     timeout=10,
                 )
                 if response.ok:
@@ -224,7 +226,7 @@ def is_squid_up():
     Returns:
         bool: True if all squids are up, False otherwise
     """
-    from http_requests.request_executor import get_proxies_for_cache  # Import here to avoid circular dependency
+    from http_requests.session_pool import get_session  # Import here to avoid circular dependency
     from cache.registry import get_all_caches
 
     caches_data = get_all_caches()
@@ -234,17 +236,15 @@ def is_squid_up():
     headers = {'X-Originally-HTTPS': '1'}
 
     try:
-        proxy = get_proxies_for_cache()
-        response = requests.get(URL, headers=headers, proxies=proxy, timeout=10)
+        response = get_session().get(URL, headers=headers, timeout=10)
 
         # Check if proxy OK
         if response.ok:
             # Runs on all parents to check if they also OK
             for cache in caches:
                 # For parent checks we use the parent's HTTP address
-                proxy = get_proxies_for_cache(http_host=cache[0])
                 try:
-                    response = requests.get(URL, headers=headers, proxies=proxy, timeout=10)
+                    response = get_session(http_host=cache[0]).get(URL, headers=headers, timeout=10)
 
                     if response.ok:
                         return True
@@ -363,3 +363,93 @@ def fill_caches():
         log_msg(f"Error: Configuration file not found at {config.get_key('conf_file')}")
     except Exception as e:
         log_msg(f"An unexpected error occurred: {e}")
+
+
+def _apply_param_line(line: str, params: dict) -> str:
+    """Rewrite one squid.conf line with the parameters it carries."""
+    stripped = line.strip()
+    indent = line[:len(line) - len(line.lstrip())]
+
+    if stripped.startswith("miss_penalty") and 'miss_penalty' in params:
+        return f"{indent}miss_penalty {params['miss_penalty']}\n"
+
+    if stripped.startswith("salsa2") and 'salsa2_v' in params:
+        parts = stripped.split()
+        if len(parts) >= 2:
+            parts[1] = str(params['salsa2_v'])
+            return f"{indent}{' '.join(parts)}\n"
+
+    if stripped.startswith("cache_peer "):
+        name_match = re.search(r'name=(\S+)', stripped)
+        name = name_match.group(1) if name_match else None
+        cost = params.get(f'access_cost_{name}', params.get('access_cost'))
+
+        if name and cost is not None:
+            if re.search(r'access-cost=\S+', stripped):
+                stripped = re.sub(r'access-cost=\S+', f'access-cost={cost}', stripped)
+            else:
+                stripped = f"{stripped} access-cost={cost}"
+            return f"{indent}{stripped}\n"
+
+    return line
+
+
+def write_squid_conf(params: dict) -> str:
+    """
+    Rewrite the local squid.conf with sweep parameters.
+
+    `miss_penalty` and `salsa2_v` replace their directives, `access_cost`
+    the access-cost of every cache_peer and `access_cost_<name>` that of a
+    single one. The file is replaced atomically.
+
+    Args:
+        params: Parameters to write
+
+    Returns:
+        str: The previous content of the file, for restore_squid_conf
+    """
+    conf_file = MyConfig().get_key('conf_file')
+
+    with open(conf_file, 'r') as f:
+        original = f.read()
+
+    lines = [_apply_param_line(line, params) for line in original.splitlines(True)]
+    restore_squid_conf(''.join(lines))
+
+    return original
+
+
+def restore_squid_conf(content: str) -> None:
+    """Write back squid.conf content, replacing the file atomically."""
+    conf_file = MyConfig().get_key('conf_file')
+    temp_file = f"{conf_file}.tmp"
+
+    with open(temp_file, 'w') as f:
+        f.write(content)
+    os.replace(temp_file, conf_file)
+
+
+def reconfigure_squid():
+    """
+    Make the local squid re-read its configuration, with the
+    `squid_reconfigure_cmd` command (default: sudo squid -k reconfigure),
+    and reload the cache registry from it.
+
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    command = MyConfig().get_key('squid_reconfigure_cmd') or 'sudo squid -k reconfigure'
+
+    try:
+        result = subprocess.run(shlex.split(command), capture_output=True,
+                                text=True, timeout=60)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        print(f"Failed to reconfigure squid: {e}")
+        return False
+
+    if result.returncode:
+        print(f"Failed to reconfigure squid: {result.stderr.strip()}")
+        return False
+
+    fill_caches()
+    return True
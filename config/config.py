@@ -37,6 +37,14 @@ class MyConfig:
         self._load_config()
         return self.config_mapping.get(key)
     
+    def get_int(self, key, default=0):
+        """Get a configuration value as an int, or default if missing/invalid."""
+        value = self.get_key(key)
+        try:
+            return int(value) if value is not None else default
+        except (TypeError, ValueError):
+            return default
+
     def set_key(self, key, value):
         """Set a configuration value by key."""
         self._load_config()
@@ -0,0 +1,20 @@
+"""Shared pytest fixtures for Salsa2 Simulator."""
+import pytest
+
+from config.config import MyConfig
+from database.db_access import DBAccess
+
+
+@pytest.fixture
+def database(tmp_path):
+    """DBAccess opened on an empty database in a temporary directory."""
+    config = MyConfig()
+    saved = config.config_mapping
+    config.config_mapping = {'db_file': str(tmp_path / 'test.db'),
+                             'trace_dir': str(tmp_path / 'traces')}
+    DBAccess.open()
+    try:
+        yield DBAccess
+    finally:
+        DBAccess.close()
+        config.config_mapping = saved
@@ -1,4 +1,5 @@
 """Database access module for Salsa2 Simulator."""
 from .db_access import DBAccess
+from .result_writer import ResultWriter
 
-__all__ = ['DBAccess']
+__all__ = ['DBAccess', 'ResultWriter']
@@ -1,26 +1,76 @@
 """Database access layer for Salsa2 Simulator."""
 import sqlite3
+from typing import List, Optional
+
 from config.config import MyConfig
+from database.migrations import migrate
+from database.storage import (
+    BUSY_TIMEOUT_S, DBWriter, ReadOnlyConnections, Statement, enable_wal
+)
 
 
 class DBAccess:
-    """Manages database connections and cursor for SQLite database."""
+    """Manages database connections and cursor for SQLite database.
+
+    `conn` and `cursor` belong to the main thread. Writes that happen
+    while a trace runs go through `writer`, and UI queries read through
+    `reader()`, so neither waits for the other.
+    """
     
     conn: sqlite3.Connection = None
     cursor: sqlite3.Cursor = None
+    writer: DBWriter = None
+    readers: ReadOnlyConnections = None
 
     @staticmethod
-    def open():
-        """Open a database connection if not already open."""
+    def open(db_file: Optional[str] = None):
+        """Open a database connection if not already open.
+
+        Args:
+            db_file: Database file (default: db_file config)
+        """
         if not DBAccess.conn:
             config = MyConfig()
-            DBAccess.conn = sqlite3.connect(config.get_key('db_file'))
+            db_file = db_file or config.get_key('db_file')
+            DBAccess.conn = sqlite3.connect(db_file, timeout=BUSY_TIMEOUT_S)
             DBAccess.cursor = DBAccess.conn.cursor()
+            migrate(DBAccess.conn)
+            enable_wal(DBAccess.conn, config.get_key('journal_mode') or 'wal')
+            DBAccess.writer = DBWriter(db_file, config.get_int('db_write_queue', 1000))
+            DBAccess.readers = ReadOnlyConnections(db_file)
+
+    @staticmethod
+    def reader() -> sqlite3.Connection:
+        """The calling thread's read-only connection."""
+        return DBAccess.readers.get()
+
+    @staticmethod
+    def write(statements: List[Statement], wait: bool = True):
+        """Commit statements as one transaction on the writer thread.
+
+        Args:
+            statements: Statements of the transaction
+            wait: Return only once they are committed
+
+        Returns:
+            The lastrowid of the transaction, or a Future of it if not `wait`
+        """
+        # The writer can't write while this connection holds the write lock
+        if DBAccess.conn.in_transaction:
+            DBAccess.conn.commit()
+
+        if wait:
+            return DBAccess.writer.run(statements)
+        return DBAccess.writer.submit(statements)
 
     @staticmethod
     def close():
         """Close the database connection if open."""
         if DBAccess.conn:
+            DBAccess.writer.close()
+            DBAccess.readers.close_all()
             DBAccess.conn.close()
             DBAccess.conn = None
             DBAccess.cursor = None
+            DBAccess.writer = None
+            DBAccess.readers = None
@@ -0,0 +1,110 @@
+"""Versioned schema migrations for Salsa2 Simulator.
+
+`migrate` runs on every DBAccess.open. The version a database is at is the
+highest Version in Schema_Version; the migrations above it are applied in
+order, each recorded in Schema_Version in the same transaction, so a
+failed migration leaves the database at the previous version. The
+migration runs under an immediate (write) lock, so processes opening the
+database at once - e.g. sweep workers - apply it only once.
+
+To change the schema, append a migration with the next version number.
+Migrations that have shipped are never edited.
+"""
+import sqlite3
+from datetime import datetime
+from typing import Callable, List, Tuple
+from zoneinfo import ZoneInfo
+
+from database.schema import ensure_schema
+
+# Indexes for the access paths of ui/repository.py and simulation/simulator.py.
+# The trailing columns make them covering for the aggregates run over them.
+HOT_INDEXES: List[str] = [
+    # Runs listing and totals: COUNT, AVG(elapsed_ms), AVG(download_bytes), SUM(hit)
+    """CREATE INDEX IF NOT EXISTS Requests_Run
+        ON Requests(Run_ID, elapsed_ms, download_bytes, hit, attempts)""",
+    # Resuming a run: requests at or past its checkpoint
+    "CREATE INDEX IF NOT EXISTS Requests_Run_Pos ON Requests(Run_ID, Trace_Pos)",
+    "CREATE INDEX IF NOT EXISTS Request_Failures_Run_Pos ON Request_Failures(Run_ID, Trace_Pos)",
+    # Caches of a run, and their distinct access costs
+    "CREATE INDEX IF NOT EXISTS Caches_Run ON Caches(Run_ID, Access_Cost, Name)",
+    # Entries of a trace in order (rowid follows Trace_ID), counts and exports.
+    # Not (Trace_ID, URL): a copy of every URL would slow bulk imports down
+    "CREATE INDEX IF NOT EXISTS Trace_Entry_Trace ON Trace_Entry(Trace_ID)",
+    # Runs of a sweep
+    "CREATE INDEX IF NOT EXISTS Runs_Sweep ON Runs(Sweep_ID)",
+]
+
+
+def _baseline(cursor: sqlite3.Cursor):
+    ensure_schema(cursor)
+
+
+def _hot_indexes(cursor: sqlite3.Cursor):
+    for statement in HOT_INDEXES:
+        cursor.execute(statement)
+    # Give the planner statistics for the new indexes
+    cursor.execute("ANALYZE")
+
+
+# (version, description, step)
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Cursor], None]]] = [
+    (1, 'Core and simulator tables', _baseline),
+    (2, 'Covering indexes for the hot queries', _hot_indexes),
+]
+
+LATEST = MIGRATIONS[-1][0]
+
+
+def current_version(cursor: sqlite3.Cursor) -> int:
+    """Schema version of a database, 0 if it was never migrated."""
+    cursor.execute("SELECT COALESCE(MAX(Version), 0) FROM Schema_Version")
+    return cursor.fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Apply the migrations a database is missing.
+
+    Args:
+        conn: Open database connection
+
+    Returns:
+        int: Schema version of the database
+    """
+    cursor = conn.cursor()
+    cursor.execute("""CREATE TABLE IF NOT EXISTS Schema_Version(
+        Version INTEGER PRIMARY KEY,
+        Description TEXT NOT NULL,
+        Applied TEXT)""")
+    conn.commit()
+
+    version = current_version(cursor)
+    if version > LATEST:
+        print(f"Warning: database schema version {version} is newer than this "
+              f"simulator's ({LATEST})")
+    if version >= LATEST:
+        return version
+
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        # Another process may have migrated while we waited for the lock
+        version = current_version(cursor)
+
+        for number, description, step in MIGRATIONS:
+            if number <= version:
+                continue
+
+            step(cursor)
+            cursor.execute("""INSERT INTO Schema_Version(Version, Description, Applied)
+                           VALUES (?,?,?)""",
+                           [number, description,
+                            datetime.now(ZoneInfo("Asia/Jerusalem")).strftime("%Y-%m-%d %H:%M:%S")])
+            print(f"Database migrated to version {number}: {description}")
+            version = number
+
+        conn.commit()
+    except sqlite3.DatabaseError:
+        conn.rollback()
+        raise
+
+    return version
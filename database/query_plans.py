@@ -0,0 +1,233 @@
+"""Query-plan check for the hot queries of Salsa2 Simulator.
+
+Every query of UIRepository, and the statements the simulator runs on
+every run, are explained with EXPLAIN QUERY PLAN against an empty
+database migrated to the latest schema version. The check fails if any
+of them reads one of LARGE_TABLES - tables that grow with every run or
+trace - without bounds:
+
+* a scan of the large table, instead of a search through an index
+* a search of the large table for every row of a scanned table, e.g. a
+  per-trace COUNT over Trace_Entry for all traces. Each search uses an
+  index, but together they can read the whole large table
+
+Reads that are bounded in ways a plan does not show (a LIMIT, or a MAX
+seek) are listed in ALLOWED_SCANS with the reason, and printed with
+every check. An empty database keeps the plans independent of the
+statistics of any one database.
+
+The UIRepository methods are called for real, with sample arguments, and
+the statements they run are captured, so the check follows the queries
+as they change. The simulator's statements write, so they are listed
+here and only explained.
+
+Run it after changing a query or a migration:
+
+    python3 database/query_plans.py
+"""
+import os
+import re
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+# Add project root to Python path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from prettytable import PrettyTable
+
+from database.db_access import DBAccess
+
+# Tables that grow with every run or trace, which must never be scanned
+LARGE_TABLES = ('Requests', 'Request_Failures', 'Caches', 'Trace_Entry', 'URLs',
+                'Trace_URL_Counts')
+
+# UIRepository methods and the sample arguments they are called with
+REPOSITORY_CALLS: List[Tuple[str, tuple]] = [
+    ('get_runs_by_id', (1,)),
+    ('get_runs', (10,)),
+    ('get_run_latency', ([1, 2],)),
+    ('get_trace_optimal', (1,)),
+    ('get_run_totals', (1,)),
+    ('get_run_requests', (1,)),
+    ('get_all_traces', ()),
+    ('get_trace_stats', ()),
+    ('get_trace_length', (1,)),
+    ('get_trace_url_counts', (1, 20)),
+    ('get_trace_entries', (1,)),
+    ('get_recent_requests', (10,)),
+    ('get_caches', (1,)),
+]
+
+# Statements of simulation/simulator.py (and the trace file export it
+# triggers), with sample parameters
+SIMULATOR_QUERIES: List[Tuple[str, str, tuple]] = [
+    ('trace source', """SELECT COUNT(*), COALESCE(MAX(id), 0)
+                     FROM Trace_Entry
+                     WHERE Trace_ID = ?""", (1,)),
+    ('export trace', """SELECT URL, Arrival_Time FROM Trace_Entry
+                     WHERE Trace_ID = ? AND id <= ?
+                     ORDER BY id""", (1, 1000)),
+    ('checkpoint', "UPDATE Runs SET Trace_Pos = ? WHERE id = ?", (0, 1)),
+    ('finish run', """UPDATE Runs
+                   SET End_Time = ?, Status = ?, Trace_Pos = COALESCE(?, Trace_Pos)
+                   WHERE id = ?""", ('', 'done', None, 1)),
+    ('resume requests', "DELETE FROM Requests WHERE Run_ID = ? AND Trace_Pos >= ?", (1, 0)),
+    ('resume failures', "DELETE FROM Request_Failures WHERE Run_ID = ? AND Trace_Pos >= ?",
+     (1, 0)),
+    ('resume latency', """SELECT hit, elapsed_ms, attempts
+                       FROM Requests
+                       WHERE Run_ID = ?""", (1,)),
+]
+
+# Unbounded-looking reads that are meant to be: (query, table) -> why
+ALLOWED_SCANS: Dict[Tuple[str, str], str] = {
+    ('get_recent_requests', 'Requests'): 'reads the newest rows only, in rowid order',
+    ('get_runs', 'Requests'): 'Runs is scanned newest first and stops at the LIMIT',
+    ('get_runs', 'Caches'): 'searched for the runs within the LIMIT only',
+    ('get_trace_stats', 'Trace_Entry'): 'one MAX(id) index seek per profiled trace',
+    ('get_all_traces', 'Trace_Entry'): ('one MAX(id) seek per trace, but traces that are '
+                                        'unprofiled or stale are counted in full'),
+}
+
+SQL_WORDS = {'WHERE', 'JOIN', 'LEFT', 'INNER', 'CROSS', 'ON', 'GROUP', 'ORDER',
+             'LIMIT', 'SET', 'AS', 'USING', 'NATURAL'}
+TABLE_REFERENCE = re.compile(r'\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?',
+                             re.IGNORECASE)
+SCAN = re.compile(r'^SCAN (\w+)')
+SEARCH = re.compile(r'^SEARCH (\w+)')
+
+
+def table_aliases(sql: str) -> Dict[str, str]:
+    """Table of every name a statement refers to a table by."""
+    aliases = {}
+    for table, alias in TABLE_REFERENCE.findall(sql):
+        aliases[table] = table
+        if alias and alias.upper() not in SQL_WORDS:
+            aliases[alias] = table
+    return aliases
+
+
+def _plan(conn, sql: str, params: Sequence) -> List[str]:
+    return [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", list(params))]
+
+
+def full_scans(conn, sql: str, params: Sequence = ()) -> List[Tuple[str, str]]:
+    """(table, plan step) of every large table a statement scans."""
+    aliases = table_aliases(sql)
+    scans = []
+    for detail in _plan(conn, sql, params):
+        match = SCAN.match(detail)
+        if match:
+            table = aliases.get(match.group(1), match.group(1))
+            if table in LARGE_TABLES:
+                scans.append((table, detail))
+    return scans
+
+
+def driven_searches(conn, sql: str, params: Sequence = ()) -> List[Tuple[str, str]]:
+    """(table, plan steps) of every large table a statement searches once
+    for every row of a table it scans.
+
+    Only scans of tables (not of subqueries or CTEs, which are bounded by
+    their own plan) drive searches. The plan does not tell what each
+    search reads, so a cheap seek is reported as well as a COUNT.
+    """
+    aliases = table_aliases(sql)
+    tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    steps = _plan(conn, sql, params)
+
+    driving = []
+    for detail in steps:
+        match = SCAN.match(detail)
+        if match:
+            table = aliases.get(match.group(1))
+            if table in tables and table not in LARGE_TABLES:
+                driving.append(detail)
+    if not driving:
+        return []
+
+    searches = []
+    for detail in steps:
+        match = SEARCH.match(detail)
+        if match:
+            table = aliases.get(match.group(1), match.group(1))
+            if table in LARGE_TABLES and table not in [found for found, _ in searches]:
+                searches.append((table, f"{detail} for every row of {', '.join(driving)}"))
+    return searches
+
+
+def capture_repository_queries() -> List[Tuple[str, str]]:
+    """(method, statement) of every statement the UIRepository methods run."""
+    # Import here to avoid circular dependency
+    from ui.repository import UIRepository
+
+    reader = DBAccess.reader()
+    statements = []
+    for method, args in REPOSITORY_CALLS:
+        captured = []
+        reader.set_trace_callback(captured.append)
+        try:
+            getattr(UIRepository, method)(*args)
+        finally:
+            reader.set_trace_callback(None)
+
+        statements.extend((method, sql) for sql in captured
+                          if sql.lstrip().upper().startswith(('SELECT', 'WITH')))
+    return statements
+
+
+def check_plans() -> List[Tuple[str, str, str]]:
+    """Explain the hot queries against the database open in DBAccess.
+
+    Returns:
+        list: (query, table, plan step) of every disallowed full scan
+    """
+    queries = [(method, sql, ()) for method, sql in capture_repository_queries()]
+    queries += SIMULATOR_QUERIES
+
+    problems = []
+    for name, sql, params in queries:
+        reads = (full_scans(DBAccess.conn, sql, params) +
+                 driven_searches(DBAccess.conn, sql, params))
+        for table, detail in reads:
+            if (name, table) not in ALLOWED_SCANS:
+                problems.append((name, table, detail))
+    return problems
+
+
+def main() -> int:
+    # UIRepository reads through DBAccess, so the empty database stands in for it
+    with tempfile.TemporaryDirectory() as directory:
+        DBAccess.open(os.path.join(directory, 'plans.db'))
+        try:
+            problems = check_plans()
+        finally:
+            DBAccess.close()
+
+    allowed = PrettyTable()
+    allowed.field_names = ['Query', 'Table', 'Allowed because']
+    allowed.max_width['Allowed because'] = 60
+    for (name, table), reason in ALLOWED_SCANS.items():
+        allowed.add_row([name, table, reason])
+    print(allowed)
+
+    if not problems:
+        print(f"All {len(REPOSITORY_CALLS) + len(SIMULATOR_QUERIES)} hot queries read large "
+              f"tables through indexes, except the {len(ALLOWED_SCANS)} allowed reads above")
+        return 0
+
+    table = PrettyTable()
+    table.field_names = ['Query', 'Table', 'Plan']
+    table.max_width['Plan'] = 80
+    for problem in problems:
+        table.add_row(problem)
+    print(table)
+    print(f"{len(problems)} unbounded reads of large tables in hot queries")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""Buffered, group-committed writes for Salsa2 Simulator.
+
+Committing after every row makes sqlite sync to disk once per request.
+`ResultWriter` instead collects rows and writes them with `executemany`
+inside a single transaction once `commit_batch_size` rows are queued, or
+once `commit_interval_ms` milliseconds have passed since the last flush.
+Both are checked when a row is added - there is no timer, so while no
+request completes, queued rows wait for the next one, or for the flush
+at the end of the run.
+
+Batches are committed by the writer thread (see database.storage), so
+the caller only waits for them when it flushes explicitly. Setups where
+Squid's own update script must see each row as soon as the request
+completes can keep the old behavior with `commit_mode='sync'`.
+"""
+import time
+from typing import Callable, List, Optional, Sequence
+
+from config.config import MyConfig
+from database.db_access import DBAccess
+from database.storage import Statement
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_INTERVAL_MS = 1000
+
+
+class ResultWriter:
+    """Buffers rows for one INSERT statement and flushes them in batches."""
+
+    def __init__(self, sql: str, sync: Optional[bool] = None,
+                 batch_size: Optional[int] = None, interval_ms: Optional[int] = None,
+                 checkpoint: Optional[Callable[[], List[Statement]]] = None):
+        """
+        Args:
+            sql: Parametrized INSERT statement the rows are written with
+            sync: Commit every row on its own. Defaults to commit_mode config
+            batch_size: Rows per flush. Defaults to commit_batch_size config
+            interval_ms: Age of the last flush at which an added row
+                flushes the batch. Defaults to commit_interval_ms config
+            checkpoint: Called on every flush; the statements it returns
+                are committed in the same transaction as the rows
+        """
+        config = MyConfig()
+
+        self.sql = sql
+        self.sync = (sync if sync is not None
+                     else config.get_key('commit_mode') == 'sync')
+        self.batch_size = batch_size or config.get_int('commit_batch_size', DEFAULT_BATCH_SIZE)
+        self.interval = (interval_ms or
+                         config.get_int('commit_interval_ms', DEFAULT_INTERVAL_MS)) / 1000
+        self.checkpoint = checkpoint
+        self.rows: List[Sequence] = []
+        self.last_flush = time.monotonic()
+        self._pending = False
+
+    def add(self, row: Sequence):
+        """Queue a row, flushing if the batch is full or old enough."""
+        self.rows.append(row)
+
+        if (self.sync or len(self.rows) >= self.batch_size
+                or time.monotonic() - self.last_flush >= self.interval):
+            self.flush(wait=self.sync)
+
+    def flush(self, wait: bool = True):
+        """Hand all queued rows to the writer, as one transaction.
+
+        Args:
+            wait: Return only once they, and all earlier rows, are committed
+        """
+        if self.rows:
+            statements = [Statement(self.sql, self.rows, True)]
+            if self.checkpoint:
+                statements += self.checkpoint()
+            DBAccess.write(statements, wait=False)
+            self.rows = []
+            self._pending = True
+
+        if wait and self._pending:
+            self._pending = False
+            DBAccess.writer.wait()
+
+        self.last_flush = time.monotonic()
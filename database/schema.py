@@ -0,0 +1,207 @@
+"""Baseline schema of Salsa2 Simulator.
+
+The core tables used to be created by hand, so features that needed extra
+columns or tables added them here on open. This is now the first
+migration of database.migrations: every step is idempotent - existing
+tables and columns are left alone - so databases made by hand or by
+older versions are brought up to the same baseline. Later schema changes
+are new migrations, not additions to these lists.
+"""
+import sqlite3
+from typing import List, Tuple
+
+# The core tables, as the hand-made schema defines them
+CORE_TABLES: List[str] = [
+    """CREATE TABLE IF NOT EXISTS Traces(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        Name TEXT,
+        Last_Update TEXT)""",
+    """CREATE TABLE IF NOT EXISTS Trace_Entry(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        URL TEXT,
+        Trace_ID INTEGER)""",
+    """CREATE TABLE IF NOT EXISTS URLs(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        URL TEXT NOT NULL)""",
+    """CREATE TABLE IF NOT EXISTS Runs(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        Name TEXT,
+        Start_Time TEXT,
+        End_Time TEXT NOT NULL,
+        Trace_ID INTEGER,
+        salsa_v INTEGER,
+        miss_penalty INTEGER,
+        Total_Cost REAL NOT NULL)""",
+    """CREATE TABLE IF NOT EXISTS Caches(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        Run_ID INTEGER,
+        Name TEXT,
+        Access_Cost INTEGER)""",
+    """CREATE TABLE IF NOT EXISTS Requests(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        Time TEXT,
+        URL TEXT,
+        Run_ID INTEGER,
+        elapsed_ms INTEGER,
+        download_bytes INTEGER)""",
+]
+
+# (table, column, declaration) added on top of the core tables
+COLUMNS: List[Tuple[str, str, str]] = [
+    # How late an open-loop request was sent compared to its schedule
+    ('Requests', 'lag_ms', 'INTEGER'),
+    # Position of the request's entry in the trace, in replay order
+    ('Requests', 'Trace_Pos', 'INTEGER'),
+    # Per-request timing breakdown, see RequestResult
+    ('Requests', 'connect_ms', 'INTEGER'),
+    ('Requests', 'ttfb_ms', 'INTEGER'),
+    ('Requests', 'transfer_ms', 'INTEGER'),
+    ('Requests', 'total_ms', 'INTEGER'),
+    # 1 if the request was a cache HIT, 0 for a MISS
+    ('Requests', 'hit', 'INTEGER'),
+    # Attempts the request took - more than 1 when it succeeded on a retry
+    ('Requests', 'attempts', 'INTEGER DEFAULT 1'),
+    # Squid and hierarchy status of the request, from Squid's access.log
+    ('Requests', 'Squid_Status', 'TEXT'),
+    ('Requests', 'Hierarchy', 'TEXT'),
+    # 'live' for runs replayed through Squid, 'offline' for simulated ones
+    ('Runs', 'Engine', "TEXT DEFAULT 'live'"),
+    # Sweep a run is a point of, and the point's parameters as JSON
+    ('Runs', 'Sweep_ID', 'INTEGER'),
+    ('Runs', 'Params', 'TEXT'),
+    # Resumable runs: 'running', 'interrupted' or 'done', the trace position
+    # every earlier entry was recorded up to, and the requested limit
+    ('Runs', 'Status', 'TEXT'),
+    ('Runs', 'Trace_Pos', 'INTEGER'),
+    ('Runs', 'Request_Limit', 'INTEGER'),
+    # Recorded arrival time of the entry, in seconds (e.g. unix time)
+    ('Trace_Entry', 'Arrival_Time', 'REAL'),
+    # 64-bit hash of the canonical URL, see database.url_index
+    ('URLs', 'URL_Hash', 'INTEGER'),
+    ('Trace_Entry', 'URL_Hash', 'INTEGER'),
+]
+
+
+# Tables owned by the simulator itself
+TABLES: List[str] = [
+    # Latency histogram and percentiles of a run, per cache status
+    """CREATE TABLE IF NOT EXISTS Run_Latency(
+        Run_ID INTEGER NOT NULL,
+        Status TEXT NOT NULL,
+        Count INTEGER NOT NULL,
+        p50 INTEGER,
+        p90 INTEGER,
+        p99 INTEGER,
+        p999 INTEGER,
+        Max INTEGER,
+        Buckets TEXT NOT NULL,
+        PRIMARY KEY (Run_ID, Status))""",
+    # Trace entries of a run that failed on every attempt
+    """CREATE TABLE IF NOT EXISTS Request_Failures(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        Time TEXT,
+        URL TEXT NOT NULL,
+        Run_ID INTEGER NOT NULL,
+        Trace_Pos INTEGER,
+        Attempts INTEGER NOT NULL,
+        Error TEXT)""",
+    # Parameter sweeps - each point is a run tagged with Runs.Sweep_ID
+    """CREATE TABLE IF NOT EXISTS Sweeps(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        Name TEXT NOT NULL,
+        Start_Time TEXT,
+        End_Time TEXT,
+        Engine TEXT NOT NULL,
+        Trace_IDs TEXT NOT NULL,
+        Grid TEXT NOT NULL)""",
+    # Offline-optimal baselines of a trace, see analysis.optimal
+    """CREATE TABLE IF NOT EXISTS Trace_Optimal(
+        Trace_ID INTEGER NOT NULL,
+        Variant TEXT NOT NULL,
+        Capacity INTEGER NOT NULL,
+        Requests INTEGER NOT NULL,
+        Hits INTEGER NOT NULL,
+        Cost REAL NOT NULL,
+        Miss_Penalty REAL,
+        Created TEXT,
+        PRIMARY KEY (Trace_ID, Variant, Capacity))""",
+    # LRU miss-ratio curves of a trace, see analysis.mrc
+    """CREATE TABLE IF NOT EXISTS Trace_MRC(
+        Trace_ID INTEGER NOT NULL,
+        Kind TEXT NOT NULL,
+        Requests INTEGER NOT NULL,
+        Total INTEGER NOT NULL,
+        Cold INTEGER NOT NULL,
+        Points TEXT NOT NULL,
+        Created TEXT,
+        PRIMARY KEY (Trace_ID, Kind))""",
+    # Latest direct validation of a URL, see http_requests.validator
+    """CREATE TABLE IF NOT EXISTS URL_Validation(
+        URL TEXT PRIMARY KEY,
+        OK INTEGER NOT NULL,
+        Status INTEGER,
+        Error TEXT,
+        Checked REAL NOT NULL)""",
+    # Page cursor of a Common Crawl collection, see parsers.commoncrawl
+    """CREATE TABLE IF NOT EXISTS Crawl_State(
+        Index_URL TEXT NOT NULL,
+        Pattern TEXT NOT NULL,
+        Next_Page INTEGER NOT NULL,
+        Pages INTEGER,
+        Collected INTEGER NOT NULL,
+        Updated TEXT,
+        PRIMARY KEY (Index_URL, Pattern))""",
+    # Profile of a trace, up to entry Max_ID, see analysis.profile
+    """CREATE TABLE IF NOT EXISTS Trace_Stats(
+        Trace_ID INTEGER PRIMARY KEY,
+        Entries INTEGER NOT NULL,
+        Max_ID INTEGER NOT NULL,
+        Distinct_URLs INTEGER NOT NULL,
+        One_Hit INTEGER NOT NULL,
+        Alpha REAL,
+        WS_Window INTEGER NOT NULL,
+        WS_Windows INTEGER NOT NULL,
+        WS_Sum INTEGER NOT NULL,
+        WS_Max INTEGER NOT NULL,
+        Top TEXT NOT NULL,
+        Updated TEXT)""",
+    # Requests per canonical URL of a profiled trace
+    """CREATE TABLE IF NOT EXISTS Trace_URL_Counts(
+        Trace_ID INTEGER NOT NULL,
+        URL_Hash INTEGER NOT NULL,
+        URL TEXT NOT NULL,
+        Count INTEGER NOT NULL,
+        PRIMARY KEY (Trace_ID, URL_Hash)) WITHOUT ROWID""",
+]
+
+
+# (table, index statement) created once the table exists
+INDEXES: List[Tuple[str, str]] = [
+    ('URLs', "CREATE INDEX IF NOT EXISTS URLs_URL_Hash ON URLs(URL_Hash)"),
+]
+
+
+def _table_columns(cursor: sqlite3.Cursor, table: str) -> set:
+    cursor.execute(f"PRAGMA table_info({table})")
+    return {row[1] for row in cursor.fetchall()}
+
+
+def ensure_schema(cursor: sqlite3.Cursor):
+    """Create any missing tables from CORE_TABLES and TABLES, columns from
+    COLUMNS and indexes from INDEXES. Does not commit.
+
+    Args:
+        cursor: Cursor of the open database connection
+    """
+    for statement in CORE_TABLES + TABLES:
+        cursor.execute(statement)
+
+    for table, column, declaration in COLUMNS:
+        existing = _table_columns(cursor, table)
+
+        if existing and column not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+    for table, statement in INDEXES:
+        if _table_columns(cursor, table):
+            cursor.execute(statement)
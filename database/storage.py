@@ -0,0 +1,164 @@
+"""WAL journaling, a single writer thread and read-only connections.
+
+With the default rollback journal a writer locks readers out, and two
+connections writing at once fail with "database is locked". Databases
+are switched to WAL instead, where readers see the last commit while a
+write goes on, and writes are funneled through one `DBWriter`:
+
+* `DBWriter` - a thread with its own connection, fed by a queue. Each
+  job is a list of statements committed as one transaction, so the
+  replay loop hands rows over and goes on without waiting for the disk
+* `ReadOnlyConnections` - one read-only connection per thread, for UI
+  queries, which never take the write lock and so never hold up a write
+"""
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Sequence
+
+# Seconds a connection waits for a lock held by another process
+BUSY_TIMEOUT_S = 30
+DEFAULT_QUEUE_SIZE = 1000
+
+
+class Statement(NamedTuple):
+    """A statement of a write job, run with executemany if `many`."""
+    sql: str
+    params: Sequence = ()
+    many: bool = False
+
+
+def enable_wal(conn: sqlite3.Connection, journal_mode: str = 'wal') -> str:
+    """Switch a database to a journal mode (WAL by default).
+
+    WAL stays on for the database file once set. synchronous=NORMAL only
+    syncs at checkpoints, which in WAL mode can lose the last commits on
+    a power failure but never corrupts the database.
+
+    Returns:
+        str: The journal mode in effect
+    """
+    mode = conn.execute(f"PRAGMA journal_mode={journal_mode}").fetchone()[0]
+    if mode == 'wal':
+        conn.execute("PRAGMA synchronous=NORMAL")
+    return mode
+
+
+class DBWriter:
+    """Runs all write jobs of a process on one thread and connection."""
+
+    def __init__(self, db_file: str, queue_size: int = DEFAULT_QUEUE_SIZE):
+        """
+        Args:
+            db_file: Database file
+            queue_size: Jobs waiting at most - submitting more blocks until
+                the writer catches up
+        """
+        self.db_file = db_file
+        self._jobs: queue.Queue = queue.Queue(maxsize=max(queue_size, 1))
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_file, timeout=BUSY_TIMEOUT_S)
+        cursor = conn.cursor()
+
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+
+            statements, future = job
+            try:
+                for statement in statements:
+                    if statement.many:
+                        cursor.executemany(statement.sql, statement.params)
+                    else:
+                        cursor.execute(statement.sql, statement.params)
+                conn.commit()
+                future.set_result(cursor.lastrowid)
+            except Exception as e:
+                conn.rollback()
+                if self._error is None:
+                    self._error = e
+                future.set_exception(e)
+
+        conn.close()
+
+    def _raise_error(self):
+        # Failures of jobs nobody waited for surface on the next call
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def submit(self, statements: List[Statement]) -> Future:
+        """Queue statements to be committed as one transaction.
+
+        Returns:
+            Future: The lastrowid of the job, or its sqlite3.Error
+        """
+        self._raise_error()
+        future = Future()
+        self._jobs.put((list(statements), future))
+        return future
+
+    def run(self, statements: List[Statement]):
+        """Commit statements as one transaction, and wait for it.
+
+        Returns:
+            The lastrowid of the job
+
+        Raises:
+            sqlite3.Error: If the transaction, or an earlier one nobody
+                waited for, failed
+        """
+        future = self.submit(statements)
+        try:
+            return future.result()
+        except Exception as e:
+            # Reported here, so not again on the next call
+            if self._error is e:
+                self._error = None
+            raise
+
+    def wait(self):
+        """Wait until every job queued so far is committed."""
+        self.run([])
+
+    def close(self):
+        """Commit the queued jobs and stop the thread."""
+        if self._thread.is_alive():
+            self._jobs.put(None)
+            self._thread.join()
+
+
+class ReadOnlyConnections:
+    """One read-only connection to a database per thread."""
+
+    def __init__(self, db_file: str):
+        self.uri = f"{Path(db_file).resolve().as_uri()}?mode=ro"
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def get(self) -> sqlite3.Connection:
+        """The calling thread's connection, opened on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Closed by close_all from the main thread, never shared otherwise
+            conn = sqlite3.connect(self.uri, uri=True, timeout=BUSY_TIMEOUT_S,
+                                   check_same_thread=False)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close_all(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
@@ -0,0 +1,99 @@
+"""Tests for database/url_index.py."""
+import random
+
+import pytest
+
+from analysis.profile import update_profile
+from database.url_index import HashIndex, canonical_key, merge_duplicates, normalize_url, url_hash
+
+
+@pytest.mark.parametrize('url, key', [
+    ('https://WWW.Example.com/x/#top', 'example.com/x'),
+    ('http://example.com', 'example.com'),
+    ('http://example.com:80/', 'example.com'),
+    ('https://example.com:443/a', 'example.com/a'),
+    ('http://example.com:8080/a', 'example.com:8080/a'),
+    ('example.com/a/?q=1', 'example.com/a?q=1'),
+    ('  http://example.com/A  ', 'example.com/A'),
+    ('ftp://example.com/a', None),
+    ('not a url', None),
+])
+def test_canonical_key(url, key):
+    assert canonical_key(url) == key
+
+
+def test_variants_share_a_hash():
+    variants = ['http://example.com/a', 'https://www.example.com/a/',
+                'HTTPS://EXAMPLE.COM:443/a#part']
+    assert len({url_hash(url) for url in variants}) == 1
+    assert url_hash('http://example.com/b') != url_hash(variants[0])
+    assert url_hash('mailto:someone') is None
+
+
+def test_normalize_url():
+    assert normalize_url('Example.com') == 'https://example.com/'
+    assert normalize_url('HTTP://Example.com:80/a?b#c') == 'http://example.com/a?b'
+
+
+def test_hash_index_against_a_set():
+    rng = random.Random(3)
+    index = HashIndex(4)
+    expected = set()
+    # Includes 0 (stored as 1) and negative hashes, and grows past 4
+    values = [0, 1, -1] + [rng.randrange(-2 ** 63, 2 ** 63) for _ in range(5000)]
+
+    for value in values + values[:100]:
+        assert index.add(value) == ((value or 1) not in expected)
+        expected.add(value or 1)
+
+    assert len(index) == len(expected)
+    assert all(value in index for value in values)
+    absent = (rng.randrange(-2 ** 63, 2 ** 63) for _ in range(5000))
+    assert not any(value in index for value in absent if value not in expected)
+
+
+def test_merge_duplicates(database):
+    database.cursor.executemany("INSERT INTO URLs(URL) VALUES (?)",
+                                [('https://example.com/a',), ('http://www.example.com/a/',),
+                                 ('https://example.com/b',)])
+    database.cursor.execute("INSERT INTO Traces(Name) VALUES ('t')")
+    database.cursor.executemany("INSERT INTO Trace_Entry(URL, Trace_ID) VALUES (?, 1)",
+                                [('http://example.com/a',), ('https://example.com/b/',),
+                                 ('http://c.example.com/',), ('https://c.example.com',)])
+    # A trace the merge does not change
+    database.cursor.execute("INSERT INTO Traces(Name) VALUES ('u')")
+    database.cursor.execute("""INSERT INTO Trace_Entry(URL, Trace_ID)
+                            VALUES ('https://example.com/b', 2)""")
+    for trace_id in (1, 2):
+        database.cursor.execute("""INSERT INTO Trace_MRC(Trace_ID, Kind, Requests, Total,
+                                Cold, Points) VALUES (?, 'objects', 0, 0, 0, '[]')""", [trace_id])
+        database.cursor.execute("""INSERT INTO Trace_Optimal(Trace_ID, Variant, Capacity,
+                                Requests, Hits, Cost) VALUES (?, 'belady', 1, 0, 0, 0)""",
+                                [trace_id])
+    database.conn.commit()
+    update_profile(1)
+    update_profile(2)
+
+    assert merge_duplicates() == (1, 3)
+
+    # Results of the changed trace are dropped, its profile names the new URLs
+    def rows(table, trace_id):
+        return database.cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE Trace_ID = ?",
+                                       [trace_id]).fetchone()[0]
+
+    assert rows('Trace_MRC', 1) == rows('Trace_Optimal', 1) == 0
+    assert rows('Trace_MRC', 2) == rows('Trace_Optimal', 2) == 1
+    database.cursor.execute("SELECT URL FROM Trace_URL_Counts WHERE Trace_ID = 1 ORDER BY URL")
+    assert [url for (url,) in database.cursor.fetchall()] == [
+        'http://c.example.com/', 'https://example.com/a', 'https://example.com/b']
+
+    database.cursor.execute("SELECT URL FROM URLs ORDER BY id")
+    assert [url for (url,) in database.cursor.fetchall()] == ['https://example.com/a',
+                                                             'https://example.com/b']
+    # Entries take the URLs row, else the oldest entry of their key
+    database.cursor.execute("SELECT URL FROM Trace_Entry WHERE Trace_ID = 1 ORDER BY id")
+    assert [url for (url,) in database.cursor.fetchall()] == [
+        'https://example.com/a', 'https://example.com/b',
+        'http://c.example.com/', 'http://c.example.com/']
+
+    assert merge_duplicates() == (0, 0)
@@ -0,0 +1,240 @@
+"""Compact, memory-mapped trace files for Salsa2 Simulator.
+
+Reading a trace from Trace_Entry turns every entry into a Python string,
+which costs hundreds of MB for large traces and is repeated on every run.
+A trace file stores each distinct URL once, and the trace itself as an
+array of 32-bit URL IDs:
+
+    header | IDs (uint32 x entries) | offsets (uint64 x distinct + 1) | URLs
+           [| arrival times (float64 x entries)]
+
+The file is memory-mapped, so the ID array is used in place - slicing any
+[start, end) window is O(1) - and a URL is decoded only when it is asked
+for. IDs are dense (0..distinct-1, in order of first appearance), so the
+analyzers use them directly as interned URLs. Arrival times are stored
+only when every entry has one, for the 'recorded' replay schedule. Files
+live in `trace_dir` (default: a `traces` directory next to the database)
+and are re-exported when entries are added to or deleted from the trace.
+Arrays use the machine's byte order.
+
+A TraceFile holds a file descriptor and a mapping until it is closed, so
+use it as a context manager (or close it in a `finally`).
+"""
+import mmap
+import os
+import shutil
+import struct
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config.config import MyConfig
+from database.db_access import DBAccess
+
+MAGIC = b'SALSATRC'
+VERSION = 2
+# magic, version, entries, distinct, source rows, source max id, flags
+HEADER = struct.Struct('<8sIQQQQI')
+HAS_ARRIVALS = 1
+IDS_AT = 64
+WRITE_CHUNK = 65536
+
+
+def _aligned(offset: int, alignment: int = 8) -> int:
+    return -(-offset // alignment) * alignment
+
+
+class TraceFile:
+    """A read-only, memory-mapped trace."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._views: List[memoryview] = []
+
+        magic, version, entries, distinct, rows, max_id, flags = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {VERSION} trace file")
+
+        self.entries = entries
+        self.distinct = distinct
+        self.source = (rows, max_id)
+
+        view = memoryview(self._map)
+        offsets_at = _aligned(IDS_AT + 4 * entries)
+        blob_at = offsets_at + 8 * (distinct + 1)
+
+        self.ids = view[IDS_AT:IDS_AT + 4 * entries].cast('I')
+        self._offsets = view[offsets_at:blob_at].cast('Q')
+        blob_end = blob_at + self._offsets[distinct]
+        self._blob = view[blob_at:blob_end]
+        self._views += [view, self.ids, self._offsets, self._blob]
+
+        # Recorded arrival time of every entry, in seconds, or None
+        self.arrivals: Optional[memoryview] = None
+        if flags & HAS_ARRIVALS:
+            arrivals_at = _aligned(blob_end)
+            self.arrivals = view[arrivals_at:arrivals_at + 8 * entries].cast('d')
+            self._views.append(self.arrivals)
+
+    def __enter__(self) -> 'TraceFile':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.entries
+
+    def __iter__(self) -> Iterator[str]:
+        return self.urls()
+
+    def url(self, url_id: int) -> str:
+        """URL of an ID."""
+        return str(self._blob[self._offsets[url_id]:self._offsets[url_id + 1]], 'utf-8')
+
+    def slice(self, start: int = 0, end: Optional[int] = None) -> memoryview:
+        """URL IDs of the entries in [start, end), without copying.
+
+        The slice is only valid until the trace file is closed.
+        """
+        view = self.ids[start:end]
+        self._views.append(view)
+        return view
+
+    def urls(self, start: int = 0, end: Optional[int] = None) -> Iterator[str]:
+        """URLs of the entries in [start, end), decoded one at a time."""
+        for url_id in self.ids[start:end]:
+            yield self.url(url_id)
+
+    def positions(self, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+        """(trace position, URL) of the entries in [start, end)."""
+        return enumerate(self.urls(start, end), start=start)
+
+    def close(self):
+        """Release the mapping, the slices handed out and the file."""
+        for view in reversed(self._views):
+            try:
+                view.release()
+            except BufferError:
+                # Views made from it are still in use
+                pass
+        self._views = []
+
+        try:
+            self._map.close()
+        except BufferError:
+            # Kept alive by views still in use until they are collected
+            pass
+        self._file.close()
+
+
+def _trace_dir() -> str:
+    directory = MyConfig().get_key('trace_dir')
+    if not directory:
+        db_file = MyConfig().get_key('db_file') or ''
+        directory = os.path.join(os.path.dirname(os.path.abspath(db_file)), 'traces')
+    return directory
+
+
+def trace_path(trace_id: int) -> str:
+    return os.path.join(_trace_dir(), f"trace_{trace_id}.bin")
+
+
+def _source_of(trace_id: int) -> Tuple[int, int]:
+    DBAccess.cursor.execute("""SELECT COUNT(*), COALESCE(MAX(id), 0)
+                            FROM Trace_Entry
+                            WHERE Trace_ID = ?""", [trace_id])
+    return tuple(DBAccess.cursor.fetchone())
+
+
+def export_trace(trace_id: int, path: Optional[str] = None) -> str:
+    """Write a trace's entries to a trace file, streaming them from sqlite.
+
+    Args:
+        trace_id: ID of the trace
+        path: Where to write it (default: trace_path(trace_id))
+
+    Returns:
+        str: Path of the written file
+    """
+    path = path or trace_path(trace_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.tmp"
+    arrivals_path = f"{path}.arrivals.tmp"
+
+    rows, max_id = _source_of(trace_id)
+    index: Dict[str, int] = {}
+    entries = 0
+    has_arrivals = True
+
+    # A separate cursor, so callers' result sets are left alone
+    cursor = DBAccess.conn.cursor()
+    cursor.execute("""SELECT URL, Arrival_Time FROM Trace_Entry
+                   WHERE Trace_ID = ? AND id <= ?
+                   ORDER BY id""", [trace_id, max_id])
+
+    try:
+        # Arrival times go to a side file until the URLs are written
+        with open(temp_path, 'wb') as f, open(arrivals_path, 'wb') as arrivals:
+            f.write(bytes(IDS_AT))
+
+            while True:
+                chunk = cursor.fetchmany(WRITE_CHUNK)
+                if not chunk:
+                    break
+                array('I', (index.setdefault(url, len(index)) for url, _ in chunk)).tofile(f)
+                entries += len(chunk)
+
+                if has_arrivals:
+                    try:
+                        array('d', (float(arrival) for _, arrival in chunk)).tofile(arrivals)
+                    except (TypeError, ValueError):
+                        # An entry without an arrival time - the trace has none
+                        has_arrivals = False
+
+            f.write(bytes(_aligned(f.tell()) - f.tell()))
+
+            offsets = array('Q', [0])
+            blob = bytearray()
+            for url in index:
+                blob += url.encode('utf-8')
+                offsets.append(len(blob))
+
+            offsets.tofile(f)
+            f.write(blob)
+
+            has_arrivals = has_arrivals and entries > 0
+            if has_arrivals:
+                f.write(bytes(_aligned(f.tell()) - f.tell()))
+                arrivals.flush()
+                with open(arrivals_path, 'rb') as source:
+                    shutil.copyfileobj(source, f)
+
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, VERSION, entries, len(index), rows, max_id,
+                                HAS_ARRIVALS if has_arrivals else 0))
+    finally:
+        os.remove(arrivals_path)
+
+    os.replace(temp_path, path)
+    return path
+
+
+def get_trace_file(trace_id: int) -> TraceFile:
+    """The trace file of a trace, exported first if missing or out of date."""
+    path = trace_path(trace_id)
+    source = _source_of(trace_id)
+
+    if os.path.exists(path):
+        try:
+            trace = TraceFile(path)
+            if trace.source == source:
+                return trace
+            trace.close()
+        except (OSError, ValueError, struct.error):
+            pass
+
+    print(f"Exporting trace {trace_id} to {path}...")
+    return TraceFile(export_trace(trace_id, path))
@@ -0,0 +1,308 @@
+"""URL canonicalization and 64-bit hash index for Salsa2 Simulator.
+
+The same resource shows up as http and https, with and without `www.`,
+with a trailing slash or a fragment. `canonical_key` folds these variants
+into one key and `url_hash` turns it into a signed 64-bit integer, stored
+next to the URL in URLs.URL_Hash and Trace_Entry.URL_Hash.
+
+* `HashIndex` - a compact open-addressing set of hashes (16 bytes per
+  URL at most), for O(1) dedup of millions of URLs in memory
+* `UrlIndex` - the hashes of the URLs table, for importers and
+  collectors that must not store a URL twice
+* `Canonicalizer` - maps every variant of a URL to one representative
+  (the URLs table's, else the first one seen), for trace importers
+* `merge_duplicates` - one-off job merging the duplicates already stored
+"""
+import hashlib
+import os
+import re
+from array import array
+from typing import Dict, Optional, Tuple
+
+from database.db_access import DBAccess
+
+BACKFILL_BATCH = 50000
+# Per-trace results that merge_duplicates drops for the traces it changes
+DERIVED_TABLES = ('Trace_MRC', 'Trace_Optimal', 'Trace_Stats', 'Trace_URL_Counts')
+DEFAULT_PORTS = {'http': ':80', 'https': ':443'}
+# Optional scheme, host, optional port, path and query, optional fragment
+URL_PATTERN = re.compile(r'(?:([A-Za-z][A-Za-z0-9+.-]*)://)?'
+                         r'([A-Za-z0-9._-]+|\[[0-9A-Fa-f:.]+\])(:[0-9]+)?'
+                         r'([/?][^#\s]*)?(?:#\S*)?')
+
+
+def _split(url: str, scheme: str = 'http') -> Optional[Tuple[str, str, str, str]]:
+    """(scheme, host, port, path and query) of an HTTP(S) URL, normalized."""
+    match = URL_PATTERN.fullmatch(url.strip())
+    if not match:
+        return None
+
+    url_scheme, host, port, path = match.groups()
+    url_scheme = url_scheme.lower() if url_scheme else scheme
+
+    default_port = DEFAULT_PORTS.get(url_scheme)
+    if default_port is None:
+        return None
+    if port is None or port == default_port:
+        port = ''
+
+    if not path:
+        path = '/'
+    elif path[0] != '/':
+        path = '/' + path
+
+    return url_scheme, host.lower(), port, path
+
+
+def normalize_url(url: str, scheme: str = 'https') -> Optional[str]:
+    """Canonical form of a URL, or None if it is not an HTTP(S) URL.
+
+    Surrounding whitespace and the fragment are dropped, the scheme and
+    host are lower-cased, default ports are removed and an empty path
+    becomes '/'. Bare host names ('example.com/page') get `scheme`.
+    """
+    parts = _split(url, scheme)
+    if parts is None:
+        return None
+
+    url_scheme, host, port, path = parts
+    return f"{url_scheme}://{host}{port}{path}"
+
+
+def canonical_key(url: str) -> Optional[str]:
+    """Scheme-less canonical form of a URL, or None if it is not HTTP(S).
+
+    On top of normalize_url (lower-case scheme and host, no default port or
+    fragment) the scheme and a leading 'www.' are dropped, and so are
+    trailing slashes of the path: 'https://WWW.a.com/x/#top' -> 'a.com/x'.
+    """
+    parts = _split(url)
+    if parts is None:
+        return None
+
+    _, host, port, path = parts
+    if host.startswith('www.'):
+        host = host[4:]
+
+    path, mark, query = path.partition('?')
+    return f"{host}{port}{path.rstrip('/')}{mark}{query}"
+
+
+def url_hash(url: str) -> Optional[int]:
+    """Signed 64-bit hash of a URL's canonical key, or None if it has none."""
+    key = canonical_key(url)
+    if key is None:
+        return None
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(),
+                          'little', signed=True)
+
+
+class HashIndex:
+    """Set of 64-bit hashes in a flat, linearly probed array.
+
+    Kept at most half full, so membership and insertion probe about two
+    slots. 0 marks an empty slot, so the hash 0 is stored as 1.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        size = 16
+        while size < capacity * 2:
+            size *= 2
+        self._slots = array('q', bytes(8 * size))
+        self._mask = size - 1
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _find(self, value: int) -> int:
+        slot = value & self._mask
+        slots = self._slots
+        while slots[slot] and slots[slot] != value:
+            slot = (slot + 1) & self._mask
+        return slot
+
+    def __contains__(self, value: int) -> bool:
+        value = value or 1
+        return self._slots[self._find(value)] == value
+
+    def add(self, value: int) -> bool:
+        """Add a hash. Returns False if it was already present."""
+        value = value or 1
+        slot = self._find(value)
+        if self._slots[slot]:
+            return False
+
+        self._slots[slot] = value
+        self._count += 1
+        if self._count * 2 > len(self._slots):
+            self._grow()
+        return True
+
+    def _grow(self):
+        old = self._slots
+        self._slots = array('q', bytes(16 * len(old)))
+        self._mask = len(self._slots) - 1
+        for value in old:
+            if value:
+                self._slots[self._find(value)] = value
+
+
+def backfill_hashes(table: str) -> int:
+    """Compute URL_Hash for the rows of URLs or Trace_Entry that lack it.
+
+    The updates are part of the caller's transaction - committing (or
+    rolling back) is left to it, so an import building a UrlIndex stays
+    one transaction.
+
+    Returns:
+        int: Number of rows updated
+    """
+    updated = 0
+    # A separate cursor, so the updates don't reset the scan
+    cursor = DBAccess.conn.cursor()
+    cursor.execute(f"SELECT id, URL FROM {table} WHERE URL_Hash IS NULL")
+
+    while True:
+        rows = cursor.fetchmany(BACKFILL_BATCH)
+        if not rows:
+            break
+
+        DBAccess.cursor.executemany(f"UPDATE {table} SET URL_Hash = ? WHERE id = ?",
+                                    [(url_hash(url), row_id) for row_id, url in rows])
+        updated += len(rows)
+
+    return updated
+
+
+class UrlIndex:
+    """Hashes of the URLs table, to add URLs without storing one twice.
+
+    Hashes missing from the table are filled in first, uncommitted.
+    """
+
+    def __init__(self):
+        backfill_hashes('URLs')
+        DBAccess.cursor.execute("SELECT COUNT(*) FROM URLs")
+        self.hashes = HashIndex(DBAccess.cursor.fetchone()[0] + 1024)
+
+        cursor = DBAccess.conn.cursor()
+        for (value,) in cursor.execute("SELECT URL_Hash FROM URLs WHERE URL_Hash IS NOT NULL"):
+            self.hashes.add(value)
+
+    def add(self, url: str) -> Optional[int]:
+        """Hash of a URL that is not in the table yet, or None for a
+        duplicate (or a URL that is not HTTP(S))."""
+        value = url_hash(url)
+        if value is None or not self.hashes.add(value):
+            return None
+        return value
+
+
+class Canonicalizer:
+    """Maps URL variants to one representative URL.
+
+    The representative of a canonical key is its URL in the URLs table if
+    there is one, else the first variant seen. The URLs table is only
+    queried for keys its hash index holds.
+    """
+
+    def __init__(self):
+        self._representatives: Dict[int, str] = {}
+        # Variants seen so far, so repeated entries are not hashed again
+        self._known: Dict[str, Tuple[str, int]] = {}
+        self._stored = UrlIndex().hashes
+        # Its own cursor, as it is called while rows are being inserted
+        self._cursor = DBAccess.conn.cursor()
+
+    def __call__(self, url: str) -> Optional[Tuple[str, int]]:
+        """(representative URL, hash) of a URL, or None if it is not HTTP(S)."""
+        known = self._known.get(url)
+        if known:
+            return known
+
+        value = url_hash(url)
+        if value is None:
+            return None
+
+        representative = self._representatives.get(value)
+        if representative is None:
+            representative = url
+            if value in self._stored:
+                self._cursor.execute("""SELECT URL FROM URLs
+                                     WHERE URL_Hash = ? ORDER BY id LIMIT 1""", [value])
+                row = self._cursor.fetchone()
+                if row:
+                    representative = row[0]
+            self._representatives[value] = representative
+
+        known = self._known[url] = (representative, value)
+        return known
+
+
+def merge_duplicates() -> Tuple[int, int]:
+    """Merge URL variants stored in URLs and Trace_Entry, in bulk.
+
+    Every URLs row whose canonical key is already held by an older row is
+    deleted, and every trace entry is rewritten to its key's
+    representative - the oldest URLs row, else the oldest trace entry.
+    What was derived from the traces changed is dropped in the same
+    transaction - their miss-ratio curves, optimal baselines and profiles -
+    and so are their trace files, to be re-exported. Their profiles are
+    then computed again.
+
+    Returns:
+        (urls_deleted, entries_rewritten)
+    """
+    # Import here to avoid circular dependency
+    from analysis.profile import update_profile
+    from database.trace_file import trace_path
+
+    print(f"Hashed {backfill_hashes('URLs')} URLs and "
+          f"{backfill_hashes('Trace_Entry')} trace entries")
+
+    DBAccess.cursor.execute("""DELETE FROM URLs
+                            WHERE URL_Hash IS NOT NULL
+                            AND id NOT IN (SELECT MIN(id) FROM URLs GROUP BY URL_Hash)""")
+    urls_deleted = DBAccess.cursor.rowcount
+
+    DBAccess.cursor.execute("DROP TABLE IF EXISTS temp.Canonical")
+    DBAccess.cursor.execute("""CREATE TEMP TABLE Canonical(
+                            URL_Hash INTEGER PRIMARY KEY,
+                            URL TEXT NOT NULL)""")
+    DBAccess.cursor.execute("""INSERT INTO temp.Canonical(URL_Hash, URL)
+                            SELECT URL_Hash, URL FROM URLs WHERE URL_Hash IS NOT NULL""")
+    DBAccess.cursor.execute("""INSERT OR IGNORE INTO temp.Canonical(URL_Hash, URL)
+                            SELECT URL_Hash, URL FROM Trace_Entry
+                            WHERE id IN (SELECT MIN(id) FROM Trace_Entry
+                                         WHERE URL_Hash IS NOT NULL
+                                         GROUP BY URL_Hash)""")
+
+    DBAccess.cursor.execute("""SELECT DISTINCT T.Trace_ID
+                            FROM Trace_Entry T
+                            JOIN temp.Canonical C ON C.URL_Hash = T.URL_Hash
+                            WHERE T.URL != C.URL""")
+    changed_traces = [trace_id for (trace_id,) in DBAccess.cursor.fetchall()]
+
+    DBAccess.cursor.execute("""UPDATE Trace_Entry
+                            SET URL = C.URL
+                            FROM temp.Canonical C
+                            WHERE C.URL_Hash = Trace_Entry.URL_Hash
+                            AND Trace_Entry.URL != C.URL""")
+    entries_rewritten = DBAccess.cursor.rowcount
+
+    # They name the URLs as they were before the merge
+    for table in DERIVED_TABLES:
+        DBAccess.cursor.executemany(f"DELETE FROM {table} WHERE Trace_ID = ?",
+                                    [(trace_id,) for trace_id in changed_traces])
+
+    DBAccess.cursor.execute("DROP TABLE temp.Canonical")
+    DBAccess.conn.commit()
+
+    for trace_id in changed_traces:
+        path = trace_path(trace_id)
+        if os.path.exists(path):
+            os.remove(path)
+        update_profile(trace_id)
+
+    return urls_deleted, entries_rewritten
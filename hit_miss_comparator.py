@@ -10,12 +10,13 @@ cache HIT on the second (warm) run.
 """
 import os
 from datetime import datetime
-from typing import Optional
+from typing import Iterable, Optional
 
 import xlsxwriter
 from prettytable import PrettyTable
 
 from database.db_access import DBAccess
+from database.trace_file import get_trace_file
 from cache.cache_manager import fill_caches, is_squid_up, reset_all_caches
 from cache.registry import get_all_caches
 from ui.repository import UIRepository
@@ -87,7 +88,7 @@ def _select_trace() -> Optional[int]:
     return trace_id
 
 
-def _run_trace_once(urls: list, run_label: str) -> list:
+def _run_trace_once(urls: Iterable[str], run_label: str) -> list:
     """Run every URL in the trace once, in order, printing progress as it goes.
 
     Returns a list the same length as `urls`: each entry is (hit, elapsed_ms),
@@ -274,27 +275,28 @@ def run_hit_miss_comparator():
     if not trace_id:
         return
 
-    urls = [url for (url,) in UIRepository.get_trace_entries(trace_id)]
-    if not urls:
-        print("Selected trace has no requests.")
-        return
+    # Streamed from the memory-mapped trace file, not loaded into a list
+    with get_trace_file(trace_id) as urls:
+        if not len(urls):
+            print("Selected trace has no requests.")
+            return
 
-    print("\n--- Run 1 (cold) ---")
-    run1 = _run_trace_once(urls, "Run 1")
+        print("\n--- Run 1 (cold) ---")
+        run1 = _run_trace_once(urls, "Run 1")
 
-    run1_miss_total = sum(e[1] for e in run1 if e is not None and not e[0])
-    print(f"\nSum of MISS elapsed time (run 1): {run1_miss_total} ms")
+        run1_miss_total = sum(e[1] for e in run1 if e is not None and not e[0])
+        print(f"\nSum of MISS elapsed time (run 1): {run1_miss_total} ms")
 
-    print("\n--- Run 2 (warm) ---")
-    run2 = _run_trace_once(urls, "Run 2")
+        print("\n--- Run 2 (warm) ---")
+        run2 = _run_trace_once(urls, "Run 2")
 
-    matched_miss, matched_hit, unresolved = _match_previously_missed(run1, run2)
+        matched_miss, matched_hit, unresolved = _match_previously_missed(run1, run2)
 
-    print(f"\nSum of elapsed time for requests that were MISS in run 1 and are now HIT in run 2: "
-          f"{sum(matched_hit)} ms")
-    if unresolved:
-        print(f"Warning: {unresolved} request(s) were MISS in run 1 but not a HIT in run 2 "
-              f"- excluded from the ratio below.")
+        print(f"\nSum of elapsed time for requests that were MISS in run 1 and are now HIT in run 2: "
+              f"{sum(matched_hit)} ms")
+        if unresolved:
+            print(f"Warning: {unresolved} request(s) were MISS in run 1 but not a HIT in run 2 "
+                  f"- excluded from the ratio below.")
 
     print()
     count = len(matched_miss)
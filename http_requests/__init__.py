@@ -1,4 +1,15 @@
 """HTTP Request execution module for Salsa2 Simulator."""
-from .request_executor import execute_req, execute_single_req, get_proxies_for_cache
+from .request_executor import (
+    INSERT_REQUEST, RequestResult, execute_req, execute_single_req, fetch_req,
+    get_proxies_for_cache, record_req, request_row
+)
+from .resolver import get_resolver, pre_resolve
+from .session_pool import close_sessions, get_direct_session, get_session
+from .validator import validate_urls
 
-__all__ = ['execute_req', 'execute_single_req', 'get_proxies_for_cache']
+__all__ = [
+    'INSERT_REQUEST', 'RequestResult', 'execute_req', 'execute_single_req',
+    'fetch_req', 'get_proxies_for_cache', 'record_req', 'request_row',
+    'close_sessions', 'get_direct_session', 'get_session', 'get_resolver',
+    'pre_resolve', 'validate_urls'
+]
@@ -1,11 +1,17 @@
 """Request execution logic for Salsa2 Simulator."""
 import sqlite3
+import time
 from datetime import datetime
+from typing import NamedTuple, Optional
 from zoneinfo import ZoneInfo
-import requests
 
 from config.config import MyConfig
 from database.db_access import DBAccess
+from http_requests.session_pool import get_session
+from http_requests.timing import connect_time, reset_connect_time
+
+# Bytes read at a time from streamed response bodies
+STREAM_CHUNK_SIZE = 64 * 1024
 
 
 def get_proxies_for_cache(http_host: str | None = None) -> dict:
@@ -39,11 +45,39 @@ def is_hit(response):
     return cache_status and 'hit' in cache_status
 
 
-def calculate_response_size(response) -> int:
+def consume_body(response) -> int:
+    """Read a streamed response body in chunks and return its size, in bytes.
+
+    The chunks are thrown away as they arrive, so memory stays bounded by
+    STREAM_CHUNK_SIZE whatever the object size. When the body is not
+    compressed, Content-Length already equals its decompressed size, so the
+    body is only drained (to keep the connection reusable) without being
+    decoded or counted.
+
+    Args:
+        response: A requests.Response sent with stream=True
+
+    Returns:
+        int: Decompressed body size, same as len(response.content)
+    """
+    encoding = response.headers.get('Content-Encoding', 'identity').lower()
+    content_length = response.headers.get('Content-Length')
+
+    if encoding == 'identity' and content_length and content_length.isdigit():
+        for _ in response.raw.stream(STREAM_CHUNK_SIZE, decode_content=False):
+            pass
+        return int(content_length)
+
+    return sum(len(chunk) for chunk in response.iter_content(STREAM_CHUNK_SIZE))
+
+
+def calculate_response_size(response, body_size: Optional[int] = None) -> int:
     """Calculate the total size of a response (headers + body), in bytes.
 
     Args:
-        response: The requests.Response object (downloaded normally, not streamed)
+        response: The requests.Response object
+        body_size: Body size already counted by consume_body for streamed
+            responses. None reads it from response.content
 
     Returns:
         int: Approximate total size in bytes of the headers and body combined.
@@ -54,7 +88,8 @@ def calculate_response_size(response) -> int:
         for ": " and "\\r\\n", +50 for the status line.
     """
     # Use response.content for body size (decompressed, but consistent)
-    body_size = len(response.content)
+    if body_size is None:
+        body_size = len(response.content)
 
     # Approximate header size: sum of all header keys and values
     # +4 per header for ": " and "\r\n", +50 for status line
@@ -63,7 +98,8 @@ def calculate_response_size(response) -> int:
     return header_size + body_size
 
 
-def calculate_download_bytes(response) -> int:
+def calculate_download_bytes(response, body_size: Optional[int] = None,
+                             hit: Optional[bool] = None) -> int:
     """Calculate the download size for a request for comparison purposes.
 
     This function determines the data size associated with a request based on
@@ -72,7 +108,9 @@ def calculate_download_bytes(response) -> int:
     comparing different caching algorithms.
 
     Args:
-        response: The requests.Response object (downloaded normally, not streamed)
+        response: The requests.Response object
+        body_size: Body size counted by consume_body, for streamed responses
+        hit: Cache status when the caller already checked it with is_hit
 
     Returns:
         int: Download size in bytes:
@@ -93,10 +131,13 @@ def calculate_download_bytes(response) -> int:
             - Body size: decompressed content length
             - Returns: total of headers + body size
     """
-    return calculate_response_size(response) * int(not is_hit(response))
+    if hit is None:
+        hit = is_hit(response)
+
+    return calculate_response_size(response, body_size) * int(not hit)
 
 
-def send_proxied_request(url: str, timeout: int = 10):
+def send_proxied_request(url: str, timeout: int = 10, stream: bool = False):
     """Send a GET request for the given URL through the configured Squid proxy.
 
     Converts HTTPS URLs to HTTP and marks them with the 'X-Originally-HTTPS'
@@ -106,6 +147,8 @@ def send_proxied_request(url: str, timeout: int = 10):
     Args:
         url: The URL for the request (can be HTTP or HTTPS)
         timeout: Request timeout in seconds
+        stream: Return as soon as the headers arrive, leaving the body to
+            be read by the caller (e.g. with consume_body)
 
     Returns:
         requests.Response: The response from the proxy
@@ -118,9 +161,172 @@ def send_proxied_request(url: str, timeout: int = 10):
         headers['X-Originally-HTTPS'] = '1'
 
     # Disable automatic redirect following to maintain full control over what gets sent
-    # and prevent duplicate requests in Squid logs
-    PROXIES = get_proxies_for_cache()
-    return requests.get(proxied_url, headers=headers, proxies=PROXIES, timeout=timeout, allow_redirects=False)
+    # and prevent duplicate requests in Squid logs.
+    # The pooled session keeps the connection to Squid alive between requests.
+    return get_session().get(proxied_url, headers=headers, timeout=timeout,
+                             allow_redirects=False, stream=stream)
+
+
+class RequestResult(NamedTuple):
+    """Outcome of a successful request, ready to be stored in Requests."""
+    time: datetime
+    url: str
+    elapsed_ms: int
+    download_bytes: int
+    # How late an open-loop request was sent (None in closed-loop replay)
+    lag_ms: Optional[int] = None
+    # Position of the entry in its trace (None for single requests)
+    trace_pos: Optional[int] = None
+    # Breakdown of the request: opening a connection to the proxy (0 when a
+    # pooled one was reused), waiting for the response headers after that,
+    # reading the body, and wall time of the whole request
+    connect_ms: Optional[int] = None
+    ttfb_ms: Optional[int] = None
+    transfer_ms: Optional[int] = None
+    total_ms: Optional[int] = None
+    hit: Optional[bool] = None
+    # Attempts it took, more than 1 when it succeeded on a deferred retry
+    attempts: int = 1
+
+
+class RequestError(Exception):
+    """A request that did not succeed.
+
+    `retryable` is set for failures that may pass on another attempt -
+    connection errors, timeouts and 5xx answers - but not for other
+    status codes, which would come back the same. `answered` tells an
+    error status from Squid apart from getting no response at all.
+    """
+
+    def __init__(self, message: str, retryable: bool, answered: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+        self.answered = answered
+
+
+def measure_req(url: str) -> RequestResult:
+    """
+    Send request to squid proxy and measure it, without touching the DB.
+
+    Safe to call from worker threads - the results are recorded by the
+    caller's thread, which owns the sqlite connection.
+
+    Args:
+        url: The URL for the request (can be HTTP or HTTPS)
+
+    Returns:
+        RequestResult: The measured request
+
+    Raises:
+        RequestError: If the request failed
+    """
+    try:
+        stream = MyConfig().get_key('stream_responses') != '0'
+
+        reset_connect_time()
+        start = time.perf_counter()
+        response = send_proxied_request(url, stream=stream)
+
+        with response:
+            # Check if request success
+            if response.status_code < 300:
+                body_size = consume_body(response) if stream else None
+                total = time.perf_counter() - start
+
+                # response.elapsed ends when the headers are parsed, in
+                # both modes - the body is read after it
+                headers = response.elapsed.total_seconds()
+                connect = connect_time()
+                hit = bool(is_hit(response))
+
+                # Store the original URL (with https if it was HTTPS)
+                return RequestResult(
+                    datetime.now(ZoneInfo("Asia/Jerusalem")),
+                    url,
+                    int(headers * 1000),
+                    calculate_download_bytes(response, body_size, hit),
+                    connect_ms=int(connect * 1000),
+                    ttfb_ms=int(max(headers - connect, 0) * 1000),
+                    transfer_ms=int(max(total - headers, 0) * 1000),
+                    total_ms=int(total * 1000),
+                    hit=hit)
+
+        raise RequestError(str(response.status_code), response.status_code >= 500)
+
+    except RequestError:
+        raise
+    except Exception as e:
+        raise RequestError(str(e), True, answered=False) from e
+
+
+def fetch_req(url: str) -> Optional[RequestResult]:
+    """
+    Send request to squid proxy and measure it, printing any failure.
+
+    Args:
+        url: The URL for the request (can be HTTP or HTTPS)
+
+    Returns:
+        RequestResult if the request succeeded, None otherwise
+    """
+    try:
+        return measure_req(url)
+    except RequestError as e:
+        print(f"Request {url} error - {e}")
+        return None
+
+
+INSERT_REQUEST = """INSERT INTO Requests(
+    'Time', 
+    'URL', 
+    'Run_ID', 
+    'elapsed_ms', 
+    'download_bytes',
+    'lag_ms',
+    'Trace_Pos',
+    'connect_ms',
+    'ttfb_ms',
+    'transfer_ms',
+    'total_ms',
+    'hit',
+    'attempts')
+    VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)"""
+
+
+def request_row(result: RequestResult, run_id: int) -> tuple:
+    """Build the Requests row for a result, matching INSERT_REQUEST.
+
+    Args:
+        result: The measured request
+        run_id: The ID of the run associated with the request
+    """
+    return (result.time,
+            result.url,
+            run_id,
+            result.elapsed_ms,
+            result.download_bytes,
+            result.lag_ms,
+            result.trace_pos,
+            result.connect_ms,
+            result.ttfb_ms,
+            result.transfer_ms,
+            result.total_ms,
+            result.hit,
+            result.attempts)
+
+
+def record_req(result: RequestResult, run_id: int):
+    """
+    Insert request's data into requests table and commit it right away.
+
+    Args:
+        result: The measured request
+        run_id: The ID of the run associated with the request
+    """
+    DBAccess.cursor.execute(INSERT_REQUEST, request_row(result, run_id))
+    
+    # Need to close connection before continuing because squid needs to update DB
+    DBAccess.conn.commit()
 
 
 def execute_req(url: str, run_id: int):
@@ -134,46 +340,15 @@ def execute_req(url: str, run_id: int):
     Returns:
         bool: Indication for request success
     """
+    result = fetch_req(url)
+    if not result:
+        return False
+
     try:
-        # Store the original URL (with https if it was HTTPS) for logging
-        original_url = url
-        response = send_proxied_request(url)
-
-        # Check if request success
-        if response.status_code < 300:
-            download_bytes = calculate_download_bytes(response)
-            elapsed_time_ms = int(response.elapsed.total_seconds() * 1000)
-            jerusalem_time = datetime.now(ZoneInfo("Asia/Jerusalem"))
-
-            # Insert request's data into requests table
-            # Store the original URL (with https if it was HTTPS)
-            DBAccess.cursor.execute(
-                """INSERT INTO Requests(
-                    'Time', 
-                    'URL', 
-                    'Run_ID', 
-                    'elapsed_ms', 
-                    'download_bytes')
-                    VALUES (?,?,?,?,?)""", [
-                        jerusalem_time, 
-                        original_url, 
-                        run_id, 
-                        elapsed_time_ms, 
-                        download_bytes])
-            
-            # Need to close connection before continuing because squid needs to update DB
-            DBAccess.conn.commit()
-
-            return True
-            
-        else:    
-            print(f"Request {url} error - {response.status_code}")
-            
-            return False
-        
-    except Exception as e:
-        print(f"Request {url} error - {e}")             
-        
+        record_req(result, run_id)
+        return True
+    except sqlite3.DatabaseError as e:
+        print(f"Request {url} error - {e}")
         return False
 
 
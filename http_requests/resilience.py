@@ -0,0 +1,149 @@
+"""Retry policy and circuit breakers for trace replay.
+
+When an origin or the proxy hangs, every request that depends on it
+would otherwise wait for the full request timeout, one after another.
+A `CircuitBreaker` counts consecutive failures per origin host and per
+proxy endpoint; once a key fails `breaker_threshold` times in a row it
+is opened for `breaker_cooldown_s` seconds, and requests for it fail
+fast instead of being sent. The replay loop defers such entries, and
+entries that failed in a retryable way, to retry rounds at the end of
+the run, spaced by the `RetryPolicy` backoff.
+"""
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional
+from urllib.parse import urlsplit
+from zoneinfo import ZoneInfo
+
+from config.config import MyConfig
+
+
+class RequestFailure(NamedTuple):
+    """A trace entry whose request failed, ready for Request_Failures."""
+    url: str
+    trace_pos: Optional[int]
+    error: str
+    retryable: bool
+    attempts: int = 1
+
+
+INSERT_FAILURE = """INSERT INTO Request_Failures(
+    'Time',
+    'URL',
+    'Run_ID',
+    'Trace_Pos',
+    'Attempts',
+    'Error')
+    VALUES (?,?,?,?,?,?)"""
+
+
+def failure_row(failure: RequestFailure, run_id: int) -> tuple:
+    """Build the Request_Failures row for a failure, matching INSERT_FAILURE."""
+    return (datetime.now(ZoneInfo("Asia/Jerusalem")),
+            failure.url,
+            run_id,
+            failure.trace_pos,
+            failure.attempts,
+            failure.error)
+
+
+class RetryPolicy:
+    """How many times failed entries are tried, and how far apart."""
+
+    def __init__(self, max_attempts: int = 3, backoff_ms: int = 1000,
+                 backoff_factor: float = 2.0):
+        self.max_attempts = max(max_attempts, 1)
+        self.backoff_ms = backoff_ms
+        self.backoff_factor = backoff_factor
+
+    @classmethod
+    def from_config(cls) -> 'RetryPolicy':
+        config = MyConfig()
+        try:
+            factor = float(config.get_key('retry_backoff_factor') or 2)
+        except ValueError:
+            factor = 2.0
+
+        return cls(config.get_int('retry_attempts', 3),
+                   config.get_int('retry_backoff_ms', 1000),
+                   factor)
+
+    def should_retry(self, failure: RequestFailure) -> bool:
+        return failure.retryable and failure.attempts < self.max_attempts
+
+    def backoff(self, attempt: int) -> float:
+        """Seconds to wait before the given attempt (2 = first retry)."""
+        return self.backoff_ms * self.backoff_factor ** max(attempt - 2, 0) / 1000
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker over arbitrary string keys.
+
+    Thread safe - replay workers share one breaker per process.
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30.0):
+        self.threshold = max(threshold, 1)
+        self.cooldown = cooldown
+        self._failures: Dict[str, int] = {}
+        self._open_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key: str) -> bool:
+        """False while the key is open. After the cooldown requests are let
+        through again; a single further failure re-opens it."""
+        with self._lock:
+            return time.monotonic() >= self._open_until.get(key, 0.0)
+
+    def reopens_in(self, key: str) -> float:
+        """Seconds until an open key lets requests through (0 if closed)."""
+        with self._lock:
+            return max(self._open_until.get(key, 0.0) - time.monotonic(), 0.0)
+
+    def success(self, key: str):
+        with self._lock:
+            self._failures.pop(key, None)
+            self._open_until.pop(key, None)
+
+    def failure(self, key: str):
+        with self._lock:
+            failures = self._failures.get(key, 0) + 1
+            self._failures[key] = failures
+
+            if failures >= self.threshold:
+                now = time.monotonic()
+                if now >= self._open_until.get(key, 0.0):
+                    print(f"Circuit open for {key} after {failures} failures")
+                self._open_until[key] = now + self.cooldown
+
+
+_breaker: Optional[CircuitBreaker] = None
+
+
+def get_breaker() -> CircuitBreaker:
+    """The process-wide breaker, configured on first use."""
+    global _breaker
+
+    if _breaker is None:
+        config = MyConfig()
+        _breaker = CircuitBreaker(config.get_int('breaker_threshold', 5),
+                                  config.get_int('breaker_cooldown_s', 30))
+    return _breaker
+
+
+def breaker_keys(url: str, answered: bool = False) -> List[str]:
+    """Breaker keys a request depends on: its origin host and the proxy.
+
+    Parents are picked by Squid, not by the simulator, so a hanging parent
+    is seen - and gated - through the proxy endpoint in front of it. An
+    error status that Squid did answer with only counts against the origin.
+
+    Args:
+        url: The requested URL
+        answered: The failure was an error status returned by Squid
+    """
+    keys = [f"origin:{urlsplit(url).hostname}"]
+    if not answered:
+        keys.append("proxy")
+    return keys
@@ -0,0 +1,175 @@
+"""Trace-wide DNS pre-resolution for direct-to-origin requests.
+
+Traces built from URL lists can hold tens of thousands of distinct hosts,
+and every direct request would otherwise pay its own DNS lookup. The
+`Resolver` resolves all hostnames of a trace concurrently up front and
+caches the answers for `dns_ttl_s` seconds (failures for
+`dns_negative_ttl_s`). Direct sessions (see `get_direct_session`) mount
+`ResolvingHTTPAdapter`, which connects to the cached address while
+keeping the hostname for the Host header, SNI and certificate checks.
+"""
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.parse import urlsplit
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from config.config import MyConfig
+
+
+class Resolver:
+    """Thread-safe hostname -> address cache with TTLs."""
+
+    def __init__(self, ttl: float = 300, negative_ttl: float = 60):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # host -> (address or None, error or None, expires)
+        self._cache: Dict[str, Tuple[Optional[str], Optional[str], float]] = {}
+        self._lock = threading.Lock()
+
+    def _cached(self, host: str):
+        with self._lock:
+            entry = self._cache.get(host)
+
+        if entry and entry[2] > time.monotonic():
+            return entry
+        return None
+
+    def resolve(self, host: str) -> Tuple[Optional[str], Optional[str]]:
+        """Resolve a host, using the cache while its entry is fresh.
+
+        Returns:
+            (address, None) on success, (None, error) on failure
+        """
+        entry = self._cached(host)
+        if entry:
+            return entry[0], entry[1]
+
+        try:
+            infos = socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+            address, error = infos[0][4][0], None
+            expires = time.monotonic() + self.ttl
+        except (OSError, UnicodeError, IndexError) as e:
+            address, error = None, str(e)
+            expires = time.monotonic() + self.negative_ttl
+
+        with self._lock:
+            self._cache[host] = (address, error, expires)
+
+        return address, error
+
+    def lookup(self, host: str) -> Optional[str]:
+        """Address to connect to for host, or None to let the OS resolve it."""
+        return self.resolve(host)[0]
+
+    def resolve_all(self, hosts: Iterable[str], workers: int = 32) -> Dict[str, str]:
+        """Resolve many hosts concurrently, filling the cache.
+
+        Args:
+            hosts: Hostnames to resolve (duplicates are resolved once)
+            workers: Lookups run at the same time
+
+        Returns:
+            dict: host -> error, for every host that failed to resolve
+        """
+        distinct = [host for host in set(hosts) if host]
+
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            answers = dict(zip(distinct, executor.map(self.resolve, distinct)))
+
+        return {host: error for host, (_, error) in answers.items() if error}
+
+
+_resolver: Optional[Resolver] = None
+
+
+def get_resolver() -> Resolver:
+    """The process-wide resolver, configured on first use."""
+    global _resolver
+
+    if _resolver is None:
+        config = MyConfig()
+        _resolver = Resolver(config.get_int('dns_ttl_s', 300),
+                             config.get_int('dns_negative_ttl_s', 60))
+    return _resolver
+
+
+def hostname_of(url: str) -> Optional[str]:
+    try:
+        return urlsplit(url).hostname
+    except ValueError:
+        return None
+
+
+def pre_resolve(urls: Iterable[str]) -> Dict[str, str]:
+    """Resolve the hosts of all URLs up front and report the failures.
+
+    Args:
+        urls: URLs about to be requested directly
+
+    Returns:
+        dict: host -> error, for every host that failed to resolve
+    """
+    hosts = {hostname_of(url) for url in urls}
+    hosts.discard(None)
+
+    print(f"Resolving {len(hosts)} hosts...")
+    failed = get_resolver().resolve_all(
+        hosts, MyConfig().get_int('dns_workers', 32))
+
+    for host, error in sorted(failed.items()):
+        print(f"Unresolvable host {host}: {error}")
+    print(f"{len(hosts) - len(failed)}/{len(hosts)} hosts resolved")
+
+    return failed
+
+
+class _ResolvingConnectionMixin:
+    """Connects to the resolver's cached address instead of looking it up.
+
+    Only the socket connect uses the address - `host` is restored right
+    after, so TLS SNI and certificate checks still see the hostname.
+    """
+
+    def _new_conn(self):
+        original = self._dns_host
+        address = get_resolver().lookup(self.host)
+        if address:
+            self._dns_host = address
+
+        try:
+            return super()._new_conn()
+        finally:
+            self._dns_host = original
+
+
+class ResolvingHTTPConnection(_ResolvingConnectionMixin, HTTPConnection):
+    pass
+
+
+class ResolvingHTTPSConnection(_ResolvingConnectionMixin, HTTPSConnection):
+    pass
+
+
+class ResolvingHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = ResolvingHTTPConnection
+
+
+class ResolvingHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = ResolvingHTTPSConnection
+
+
+class ResolvingHTTPAdapter(HTTPAdapter):
+    """Adapter for direct requests that resolves through the cache."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': ResolvingHTTPConnectionPool,
+            'https': ResolvingHTTPSConnectionPool,
+        }
@@ -0,0 +1,113 @@
+"""Pooled keep-alive sessions for Salsa2 Simulator.
+
+One `requests.Session` is kept per proxy endpoint (the local child Squid
+and each parent from the registry), so consecutive requests through the
+same Squid reuse its TCP connections instead of paying a new handshake
+every time. The pool of each session is sized to the replay concurrency,
+letting every in-flight request hold its own connection.
+"""
+import threading
+from typing import Dict, Optional
+
+import requests
+from config.config import MyConfig
+from http_requests.resolver import ResolvingHTTPAdapter
+from http_requests.timing import TimedHTTPAdapter
+
+# Keyed by cache host, None being the configured child proxy
+_sessions: Dict[Optional[str], requests.Session] = {}
+_lock = threading.Lock()
+
+# Session for requests sent straight to origins, bypassing Squid
+_direct_session: Optional[requests.Session] = None
+
+# Distinct origin hosts kept with open pools in the direct session
+DIRECT_POOLS = 256
+
+
+def _pool_size() -> int:
+    """Connections kept per proxy - one for each request in flight."""
+    return max(MyConfig().get_int('replay_concurrency', 1), 1)
+
+
+def _create_session(http_host: Optional[str]) -> requests.Session:
+    """Create a session that sends plain HTTP through the given proxy."""
+    # Local import - request_executor imports this module
+    from http_requests.request_executor import get_proxies_for_cache
+
+    session = requests.Session()
+    session.proxies = get_proxies_for_cache(http_host)
+
+    size = _pool_size()
+    adapter = TimedHTTPAdapter(pool_connections=1, pool_maxsize=size)
+    session.mount('http://', adapter)
+
+    return session
+
+
+def get_session(http_host: Optional[str] = None) -> requests.Session:
+    """Return the pooled session for a proxy endpoint, creating it once.
+
+    Args:
+        http_host: Optional cache host, as in `get_proxies_for_cache`.
+            None selects the configured child proxy.
+
+    Returns:
+        requests.Session: Session whose requests go through that proxy
+    """
+    # Proxies are resolved once, when the session is created
+    session = _sessions.get(http_host)
+    if session:
+        return session
+
+    with _lock:
+        session = _sessions.get(http_host)
+        if not session:
+            session = _create_session(http_host)
+            _sessions[http_host] = session
+
+    return session
+
+
+def get_direct_session() -> requests.Session:
+    """Return the pooled session for direct-to-origin requests.
+
+    Its connections resolve hosts through the trace-wide resolver cache,
+    so call `pre_resolve` on a trace's URLs before validating them.
+    """
+    global _direct_session
+
+    with _lock:
+        if not _direct_session:
+            session = requests.Session()
+            adapter = ResolvingHTTPAdapter(
+                pool_connections=DIRECT_POOLS,
+                pool_maxsize=max(MyConfig().get_int('dns_workers', 32), 1))
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _direct_session = session
+
+    return _direct_session
+
+
+def close_sessions(http_host: Optional[str] = None, all_proxies: bool = False):
+    """Drop pooled connections, e.g. after the Squid behind them restarted.
+
+    Args:
+        http_host: Cache host whose session to close (None = child proxy)
+        all_proxies: Close every session, the direct one included,
+            ignoring http_host
+    """
+    global _direct_session
+
+    with _lock:
+        if all_proxies and _direct_session:
+            _direct_session.close()
+            _direct_session = None
+
+        hosts = list(_sessions) if all_proxies else [http_host]
+
+        for host in hosts:
+            session = _sessions.pop(host, None)
+            if session:
+                session.close()
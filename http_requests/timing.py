@@ -0,0 +1,64 @@
+"""Per-request timing instrumentation for Salsa2 Simulator.
+
+`requests` only reports `response.elapsed` - the time until the response
+headers were parsed. To tell connection setup apart from server think
+time, pooled sessions mount `TimedHTTPAdapter`, whose connections note
+how long each `connect()` took (name resolution of the proxy included)
+in a thread-local, read back by the thread that sent the request.
+"""
+import threading
+import time
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool
+
+_local = threading.local()
+
+
+def reset_connect_time():
+    """Start measuring connection setup for this thread's next request."""
+    _local.connect_s = 0.0
+
+
+def connect_time() -> float:
+    """Seconds spent opening connections since reset_connect_time, on this thread.
+
+    0 when the request reused a pooled keep-alive connection.
+    """
+    return getattr(_local, 'connect_s', 0.0)
+
+
+class TimedHTTPConnection(HTTPConnection):
+    """HTTP connection that records how long connecting took."""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _local.connect_s = connect_time() + time.perf_counter() - start
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """Adapter whose plain HTTP pools - direct or through a proxy - are timed."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self._use_timed_pools(self.poolmanager)
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        self._use_timed_pools(manager)
+        return manager
+
+    @staticmethod
+    def _use_timed_pools(manager):
+        manager.pool_classes_by_scheme = {
+            **manager.pool_classes_by_scheme,
+            'http': TimedHTTPConnectionPool,
+        }
@@ -0,0 +1,192 @@
+"""Concurrent, polite URL validation with a persistent result cache.
+
+Cleaning a trace means checking that each of its distinct URLs still
+answers directly (status < 300, redirects not followed). `validate_urls`
+checks them `validate_workers` at a time, while a `HostLimiter` keeps at
+most `validate_per_host` requests in flight per origin host, spaced at
+least `validate_host_delay_ms` apart. URLs are queued round-robin over
+their hosts, so workers are not all stuck waiting on one large site.
+
+Results are kept in URL_Validation, and URLs checked within the last
+`validation_ttl_h` hours are not checked again.
+"""
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+import requests
+
+from config.config import MyConfig
+from database.db_access import DBAccess
+from database.result_writer import ResultWriter
+from http_requests.resolver import hostname_of, pre_resolve
+from http_requests.session_pool import get_direct_session
+
+DEFAULT_CA_BUNDLE = '/etc/ssl/certs/ca-certificates.crt'
+
+INSERT_VALIDATION = """INSERT OR REPLACE INTO URL_Validation(
+    'URL',
+    'OK',
+    'Status',
+    'Error',
+    'Checked')
+    VALUES (?,?,?,?,?)"""
+
+
+class ValidationResult(NamedTuple):
+    """Outcome of checking one URL."""
+    url: str
+    ok: bool
+    status: Optional[int]
+    error: Optional[str]
+
+
+class HostLimiter:
+    """Per-host cap on requests in flight, and minimum spacing between them."""
+
+    def __init__(self, per_host: int = 2, delay_ms: int = 0):
+        self.per_host = max(per_host, 1)
+        self.delay = delay_ms / 1000
+        self._slots: Dict[str, threading.Semaphore] = {}
+        self._next_send: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, host: str):
+        with self._lock:
+            slots = self._slots.setdefault(host, threading.Semaphore(self.per_host))
+        slots.acquire()
+
+        if self.delay:
+            with self._lock:
+                now = time.monotonic()
+                send_at = max(now, self._next_send.get(host, now))
+                self._next_send[host] = send_at + self.delay
+            time.sleep(send_at - now)
+
+    def release(self, host: str):
+        self._slots[host].release()
+
+
+def check_url(url: str, limiter: HostLimiter, timeout: float = 5,
+              ca_bundle: Optional[str] = None) -> ValidationResult:
+    """Request a URL directly and tell whether it answers with status < 300."""
+    host = hostname_of(url) or ''
+    limiter.acquire(host)
+
+    try:
+        # The body is not needed - don't download it
+        with get_direct_session().get(url, timeout=timeout, stream=True,
+                                      verify=ca_bundle or DEFAULT_CA_BUNDLE,
+                                      allow_redirects=False) as response:
+            status = response.status_code
+        return ValidationResult(url, status < 300, status, None)
+
+    except requests.RequestException as e:
+        return ValidationResult(url, False, None, type(e).__name__)
+    finally:
+        limiter.release(host)
+
+
+def interleave_hosts(urls: Iterable[str]) -> List[str]:
+    """URLs ordered round-robin over their hosts."""
+    by_host = defaultdict(deque)
+    for url in urls:
+        by_host[hostname_of(url)].append(url)
+
+    ordered = []
+    queues = deque(by_host.values())
+    while queues:
+        queue = queues.popleft()
+        ordered.append(queue.popleft())
+        if queue:
+            queues.append(queue)
+
+    return ordered
+
+
+def cached_results(urls: Iterable[str], ttl_h: float) -> Dict[str, ValidationResult]:
+    """Results in URL_Validation that are younger than ttl_h hours."""
+    fresh_since = time.time() - ttl_h * 3600
+    cached = {}
+
+    urls = list(urls)
+    for start in range(0, len(urls), 500):
+        chunk = urls[start:start + 500]
+        DBAccess.cursor.execute(f"""SELECT URL, OK, Status, Error
+                                FROM URL_Validation
+                                WHERE Checked >= ? AND URL IN ({','.join('?' * len(chunk))})""",
+                                [fresh_since, *chunk])
+        for url, ok, status, error in DBAccess.cursor.fetchall():
+            cached[url] = ValidationResult(url, bool(ok), status, error)
+
+    return cached
+
+
+def validate_urls(urls: Iterable[str]) -> Dict[str, ValidationResult]:
+    """Validate URLs concurrently, reusing recent results.
+
+    Hosts are resolved up front; URLs of hosts that don't resolve fail
+    without a request. New results are stored in URL_Validation as they
+    come in, so an interrupted validation keeps its progress.
+
+    Args:
+        urls: Distinct URLs to check
+
+    Returns:
+        dict: url -> ValidationResult, for every URL
+    """
+    config = MyConfig()
+    urls = list(urls)
+
+    results = cached_results(urls, float(config.get_key('validation_ttl_h') or 24))
+    pending = [url for url in urls if url not in results]
+    print(f"{len(results)}/{len(urls)} URLs validated recently, checking {len(pending)}")
+
+    if not pending:
+        return results
+
+    writer = ResultWriter(INSERT_VALIDATION, sync=False)
+
+    def store(result: ValidationResult):
+        results[result.url] = result
+        writer.add((result.url, int(result.ok), result.status, result.error, time.time()))
+
+    failed_hosts = pre_resolve(pending)
+    reachable = []
+    for url in pending:
+        host = hostname_of(url)
+        if host is None or host in failed_hosts:
+            store(ValidationResult(url, False, None, failed_hosts.get(host, 'Invalid URL')))
+        else:
+            reachable.append(url)
+
+    limiter = HostLimiter(config.get_int('validate_per_host', 2),
+                          config.get_int('validate_host_delay_ms', 0))
+    timeout = config.get_int('validate_timeout_s', 5)
+    ca_bundle = config.get_key('ca_bundle')
+    workers = max(config.get_int('validate_workers', config.get_int('dns_workers', 32)), 1)
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = [executor.submit(check_url, url, limiter, timeout, ca_bundle)
+                   for url in interleave_hosts(reachable)]
+
+        for checked, future in enumerate(as_completed(futures), start=1):
+            result = future.result()
+            store(result)
+            if not result.ok:
+                print(f"{result.url} failed: {result.status or result.error}")
+            if checked % 100 == 0:
+                print(f"Checked ({checked}/{len(reachable)})")
+
+    except KeyboardInterrupt:
+        # Drop the queued checks instead of waiting for all of them
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    finally:
+        executor.shutdown()
+        writer.flush()
+
+    return results
@@ -0,0 +1,4 @@
+"""Performance metrics module for Salsa2 Simulator."""
+from .histogram import LatencyHistogram, RunLatency
+
+__all__ = ['LatencyHistogram', 'RunLatency']
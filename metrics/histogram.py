@@ -0,0 +1,122 @@
+"""Fixed-memory latency histograms for Salsa2 Simulator.
+
+`LatencyHistogram` is a log-linear (HDR-style) histogram over integer
+milliseconds: values below 128 get a bucket each, and every power of two
+above that is split into 64 buckets, so any recorded value is reported
+within about 1.6% of its true value. The bucket array has a fixed size
+whatever the number of samples, so a run keeps one histogram per cache
+status and updates it live, and percentiles never need a pass over the
+Requests table.
+"""
+import json
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from database.storage import Statement
+
+SUB_BITS = 7
+EXACT = 1 << SUB_BITS          # values below this have a bucket each
+HALF = EXACT >> 1              # buckets per power of two above EXACT
+MAX_SHIFT = 30                 # largest tracked value is about 2^37 ms
+BUCKETS = EXACT + HALF * MAX_SHIFT
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def _bucket_of(value: int) -> int:
+    if value < EXACT:
+        return max(value, 0)
+
+    shift = min(value.bit_length() - SUB_BITS, MAX_SHIFT)
+    mantissa = min(value >> shift, EXACT - 1)
+    return EXACT + (shift - 1) * HALF + (mantissa - HALF)
+
+
+def _bucket_top(index: int) -> int:
+    """Largest value that falls in a bucket."""
+    if index < EXACT:
+        return index
+
+    shift = (index - EXACT) // HALF + 1
+    mantissa = (index - EXACT) % HALF + HALF
+    return ((mantissa + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """Log-linear histogram of latencies, in milliseconds."""
+
+    def __init__(self):
+        self.counts = array('q', bytes(8 * BUCKETS))
+        self.count = 0
+        self.max = 0
+
+    def add(self, value_ms: int):
+        """Record one latency sample."""
+        self.counts[_bucket_of(value_ms)] += 1
+        self.count += 1
+        self.max = max(self.max, value_ms)
+
+    def percentile(self, percent: float) -> Optional[int]:
+        """Value at or below which `percent` of the samples fall.
+
+        Returns the top of the matching bucket (never above the recorded
+        max), or None for an empty histogram.
+        """
+        if not self.count:
+            return None
+
+        # Rank of the sample, 1-based, rounded up
+        rank = max(-(-self.count * percent // 100), 1)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(_bucket_top(index), self.max)
+
+        return self.max
+
+    def summary(self) -> Tuple:
+        """(count, p50, p90, p99, p99.9, max)."""
+        return (self.count,
+                *(self.percentile(percent) for percent in PERCENTILES),
+                self.max if self.count else None)
+
+    def to_json(self) -> str:
+        """Non-empty buckets only, as {bucket: count}."""
+        return json.dumps({index: count
+                           for index, count in enumerate(self.counts) if count})
+
+    @classmethod
+    def from_json(cls, data: str, max_ms: int = 0) -> 'LatencyHistogram':
+        histogram = cls()
+        for index, count in json.loads(data).items():
+            histogram.counts[int(index)] = count
+            histogram.count += count
+        histogram.max = max_ms
+        return histogram
+
+
+class RunLatency:
+    """Separate HIT and MISS latency histograms of one run."""
+
+    STATUSES = ('HIT', 'MISS')
+
+    def __init__(self):
+        self.histograms: Dict[str, LatencyHistogram] = {
+            status: LatencyHistogram() for status in self.STATUSES}
+
+    def add(self, hit: bool, elapsed_ms: int):
+        self.histograms['HIT' if hit else 'MISS'].add(elapsed_ms)
+
+    def statements(self, run_id: int) -> List[Statement]:
+        """Statements storing the run's histograms and their percentiles in
+        Run_Latency, replacing anything saved earlier for the run."""
+        rows: List[Tuple] = []
+        for status, histogram in self.histograms.items():
+            if histogram.count:
+                rows.append((run_id, status, *histogram.summary(), histogram.to_json()))
+
+        return [Statement("DELETE FROM Run_Latency WHERE Run_ID = ?", [run_id]),
+                Statement("""INSERT INTO Run_Latency(
+                    Run_ID, Status, Count, p50, p90, p99, p999, Max, Buckets)
+                    VALUES (?,?,?,?,?,?,?,?,?)""", rows, True)]
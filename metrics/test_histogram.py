@@ -0,0 +1,68 @@
+"""Tests for metrics/histogram.py."""
+import random
+
+from metrics.histogram import BUCKETS, LatencyHistogram, _bucket_of, _bucket_top
+
+
+def _exact_percentile(values, percent):
+    ordered = sorted(values)
+    rank = max(-(-len(ordered) * percent // 100), 1)
+    return ordered[int(rank) - 1]
+
+
+def test_buckets_cover_their_values():
+    previous = -1
+    for value in list(range(0, 5000)) + [2 ** 20 + 7, 2 ** 33]:
+        index = _bucket_of(value)
+        assert 0 <= index < BUCKETS
+        assert index >= previous
+        assert value <= _bucket_top(index)
+        # Within about 1.6% of the value
+        assert _bucket_top(index) - value <= max(value // 63, 0)
+        previous = index
+
+
+def test_small_values_are_exact():
+    histogram = LatencyHistogram()
+    for value in [5, 1, 3, 2, 4]:
+        histogram.add(value)
+
+    assert histogram.summary() == (5, 3, 5, 5, 5, 5)
+
+
+def test_percentiles_against_sorted_samples():
+    rng = random.Random(7)
+    values = [int(rng.lognormvariate(5, 1.5)) for _ in range(20000)]
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.add(value)
+
+    for percent in (1, 50, 90, 99, 99.9, 100):
+        exact = _exact_percentile(values, percent)
+        reported = histogram.percentile(percent)
+        assert exact <= reported <= exact + exact // 63 + 1
+
+    assert histogram.count == len(values)
+    assert histogram.max == max(values)
+
+
+def test_percentile_never_exceeds_the_max():
+    histogram = LatencyHistogram()
+    histogram.add(1000)
+    assert histogram.percentile(50) == 1000
+
+
+def test_empty_histogram():
+    histogram = LatencyHistogram()
+    assert histogram.percentile(50) is None
+    assert histogram.summary() == (0, None, None, None, None, None)
+
+
+def test_json_round_trip():
+    histogram = LatencyHistogram()
+    for value in [0, 7, 130, 131, 5000, 5000]:
+        histogram.add(value)
+
+    restored = LatencyHistogram.from_json(histogram.to_json(), histogram.max)
+    assert restored.counts == histogram.counts
+    assert restored.summary() == histogram.summary()
@@ -1,106 +1,297 @@
-import requests
+"""Common Crawl URL collector for Salsa2 Simulator.
+
+Collects URLs matching SEARCH_PATTERN from a Common Crawl CDX index into
+the URLs table, until MAX_URLS_TO_COLLECT are stored:
+
+* `cc_workers` index pages are fetched at once, within a budget of
+  `cc_rate` page requests per second; failed pages are retried with the
+  `retry_*` backoff
+* pages are stored in order, and the next page to fetch is saved in
+  Crawl_State with every page, so a restart continues where it stopped
+* URLs are deduplicated on the fly by a Bloom filter of their canonical
+  keys (see database.url_index), seeded with the URLs already in the
+  table, so duplicates - URL variants included - never reach the database
+
+The index is taken from `cc_index_url`, so a local stand-in index server
+serving the same `?url=&output=json&page=N` and `showNumPages` API can be
+used instead of index.commoncrawl.org.
+"""
+import hashlib
 import json
-import time
+import math
 import sqlite3
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, List, Optional
+from zoneinfo import ZoneInfo
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Add project root to Python path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from config.config import MyConfig
+from database.db_access import DBAccess
+from http_requests.resilience import RetryPolicy
+from http_requests.validator import HostLimiter
+from database.url_index import canonical_key, normalize_url, url_hash
 
 # ================= CONFIGURATION =================
-DB_FILE = "salsa2.db"
+INDEX_URL = "http://index.commoncrawl.org/CC-MAIN-2024-51-index"
 MAX_URLS_TO_COLLECT = 1000000
 SEARCH_PATTERN = "*.net"
 # =================================================
 
-def setup_database():
-    """Drops the old table and creates a fresh one."""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    # 1. DROP the table to clear all data and reset the ID counter
-    cursor.execute("DROP TABLE IF EXISTS URLs")
-    
-    # 2. CREATE the table fresh
-    cursor.execute("""
-        CREATE TABLE URLs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT, 
-            URL TEXT NOT NULL
-        );
-    """)
-    conn.commit()
-    return conn
-
-def get_urls():
-    # Connect and clean DB
-    conn = setup_database()
-    cursor = conn.cursor()
-    
-    index_url = "http://index.commoncrawl.org/CC-MAIN-2024-51-index"
-    current_page = 0
-    collected_count = 0
-    
-    print(f"--- Starting New Run (Table Cleared) ---")
-    print(f"Target: {MAX_URLS_TO_COLLECT} URLs")
-    print(f"Saving to SQLite DB: {DB_FILE}")
-    
+BLOOM_ERROR_RATE = 0.001
+
+
+class BloomFilter:
+    """Compact set of strings that may report false positives, never false negatives.
+
+    Holds `capacity` items at about `error_rate` false positives in
+    -capacity * ln(error_rate) / ln(2)^2 bits - under 2 MB for 1M URLs at
+    0.1%, instead of ~100 MB for a Python set of the URLs.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = BLOOM_ERROR_RATE):
+        capacity = max(capacity, 1)
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(round(self.size / capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, item: str) -> bool:
+        """Add an item. Returns False if it was (probably) already present."""
+        added = False
+        for position in self._positions(item):
+            byte, bit = divmod(position, 8)
+            if not self.bits[byte] >> bit & 1:
+                self.bits[byte] |= 1 << bit
+                added = True
+        return added
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position // 8] >> position % 8 & 1
+                   for position in self._positions(item))
+
+
+def load_state(index_url: str, pattern: str):
+    """(next page, total pages or None, URLs collected) saved for a crawl."""
+    DBAccess.cursor.execute("""SELECT Next_Page, Pages, Collected
+                            FROM Crawl_State
+                            WHERE Index_URL = ? AND Pattern = ?""", [index_url, pattern])
+    return DBAccess.cursor.fetchone() or (0, None, 0)
+
+
+def save_state(index_url: str, pattern: str, next_page: int,
+               pages: Optional[int], collected: int):
+    DBAccess.cursor.execute("""INSERT OR REPLACE INTO Crawl_State(
+                            Index_URL, Pattern, Next_Page, Pages, Collected, Updated)
+                            VALUES (?,?,?,?,?,?)""",
+                            [index_url, pattern, next_page, pages, collected,
+                             datetime.now(ZoneInfo("Asia/Jerusalem"))])
+
+
+def _get(session: requests.Session, index_url: str, params: dict,
+         limiter: HostLimiter, policy: RetryPolicy) -> requests.Response:
+    """GET from the index within the rate budget, retrying failures."""
+    for attempt in range(1, policy.max_attempts + 1):
+        if attempt > 1:
+            time.sleep(policy.backoff(attempt))
+
+        limiter.acquire('index')
+        try:
+            response = session.get(index_url, params=params, timeout=30)
+            if response.status_code < 500 and response.status_code != 429:
+                return response
+            error = f"Server Error {response.status_code}"
+        except requests.RequestException as e:
+            error = str(e)
+        finally:
+            limiter.release('index')
+
+        print(f"\n[!] Page {params.get('page')}: {error} (attempt {attempt})")
+
+    raise requests.RequestException(f"Page {params.get('page')} failed {policy.max_attempts} times")
+
+
+def count_pages(session, index_url: str, pattern: str, limiter, policy) -> Optional[int]:
+    """Number of index pages for the pattern, or None if the index won't tell."""
     try:
-        while collected_count < MAX_URLS_TO_COLLECT:
-            print(f"Fetching Page {current_page}...", end=" ", flush=True)
-            
-            params = {
-                'url': SEARCH_PATTERN,
-                'output': 'json',
-                'filter': 'status:200',
-                'page': current_page
-            }
-
-            try:
-                response = requests.get(index_url, params=params, timeout=30)
-                
-                if response.status_code != 200:
-                    print(f"\n[!] Server Error {response.status_code}. Retrying in 5s...")
-                    time.sleep(5)
-                    continue
-
-                lines = response.text.strip().splitlines()
-                if not lines:
-                    print("\n[!] No more results found.")
-                    break
+        response = _get(session, index_url, {'url': pattern, 'showNumPages': 'true'},
+                        limiter, policy)
+        return int(response.json()['pages'])
+    except (requests.RequestException, ValueError, KeyError, TypeError):
+        return None
+
+
+def fetch_page(session, index_url: str, pattern: str, page: int,
+               limiter, policy) -> Optional[List[str]]:
+    """URLs of one index page, or None past the last page."""
+    params = {
+        'url': pattern,
+        'output': 'json',
+        'filter': 'status:200',
+        'page': page
+    }
+    response = _get(session, index_url, params, limiter, policy)
+
+    # The CDX server answers 400/404 for pages past the end
+    if response.status_code != 200:
+        return None
 
-                batch_data = [] 
-                
-                for line in lines:
-                    if collected_count >= MAX_URLS_TO_COLLECT:
-                        break
-                    
-                    try:
-                        data = json.loads(line)
-                        url = data.get('url')
-                        
-                        if url:
-                            batch_data.append((url,))
-                            collected_count += 1
-                    except ValueError:
-                        continue
-                
-                # Bulk insert
-                if batch_data:
-                    cursor.executemany("INSERT INTO URLs (URL) VALUES (?)", batch_data)
-                    conn.commit()
-                
-                print(f"Inserted {len(batch_data)} URLs. (Total: {collected_count}/{MAX_URLS_TO_COLLECT})")
-                
-                if collected_count >= MAX_URLS_TO_COLLECT:
-                    print("--- Limit Reached. Stopping. ---")
+    urls = []
+    for line in response.text.splitlines():
+        try:
+            url = json.loads(line).get('url')
+        except (ValueError, AttributeError):
+            continue
+        if url:
+            urls.append(url)
+
+    return urls
+
+
+def seed_filter(seen: BloomFilter, urls: Iterable[str]) -> int:
+    count = 0
+    for url in urls:
+        seen.add(url)
+        count += 1
+    return count
+
+
+def get_urls(index_url: Optional[str] = None, pattern: Optional[str] = None,
+             max_urls: Optional[int] = None) -> int:
+    """Collect URLs from the index into the URLs table, resuming a previous crawl.
+
+    Args:
+        index_url: CDX index endpoint (default: cc_index_url config, then INDEX_URL)
+        pattern: URL pattern to search (default: cc_pattern config, then SEARCH_PATTERN)
+        max_urls: Stop once the URLs table holds this many URLs
+            (default: cc_max_urls config, then MAX_URLS_TO_COLLECT)
+
+    Returns:
+        int: Number of new URLs stored by this call
+    """
+    config = MyConfig()
+    index_url = index_url or config.get_key('cc_index_url') or INDEX_URL
+    pattern = pattern or config.get_key('cc_pattern') or SEARCH_PATTERN
+    max_urls = max_urls or config.get_int('cc_max_urls', MAX_URLS_TO_COLLECT)
+    workers = max(config.get_int('cc_workers', 4), 1)
+    try:
+        rate = float(config.get_key('cc_rate') or 2)
+    except ValueError:
+        rate = 2.0
+
+    next_page, pages, collected = load_state(index_url, pattern)
+
+    DBAccess.cursor.execute("SELECT COUNT(*) FROM URLs")
+    existing = DBAccess.cursor.fetchone()[0]
+
+    # Seed the filter with the stored URLs, on a separate cursor
+    seen = BloomFilter(max(max_urls, existing) * 2)
+    seed_filter(seen, (canonical_key(url) or url
+                       for (url,) in DBAccess.conn.cursor().execute("SELECT URL FROM URLs")))
+
+    print(f"Target: {max_urls} URLs, {existing} already stored")
+    print(f"Index {index_url}, pattern {pattern}, starting at page {next_page}")
+
+    limiter = HostLimiter(workers, int(1000 / rate) if rate > 0 else 0)
+    policy = RetryPolicy.from_config()
+    session = requests.Session()
+    session.mount('http://', HTTPAdapter(pool_maxsize=workers))
+    session.mount('https://', HTTPAdapter(pool_maxsize=workers))
+
+    if pages is None:
+        pages = count_pages(session, index_url, pattern, limiter, policy)
+        if pages is not None:
+            print(f"Index has {pages} pages")
+
+    stored = 0
+    duplicates = 0
+    upcoming = deque()
+    executor = ThreadPoolExecutor(max_workers=workers)
+
+    def submit(page):
+        upcoming.append((page, executor.submit(fetch_page, session, index_url,
+                                               pattern, page, limiter, policy)))
+
+    try:
+        page = next_page
+        while existing + stored < max_urls:
+            # Keep `workers` pages in flight, consumed in page order
+            while len(upcoming) < workers and (pages is None or page < pages):
+                submit(page)
+                page += 1
+
+            if not upcoming:
+                print("--- No more pages. ---")
+                break
+
+            current, future = upcoming.popleft()
+            urls = future.result()
+            if urls is None:
+                print(f"--- No more results after page {current}. ---")
+                next_page = current
+                break
+
+            batch = []
+            complete = True
+            for url in urls:
+                if existing + stored + len(batch) >= max_urls:
+                    complete = False
                     break
 
-                current_page += 1
-                time.sleep(0.5)
+                url = normalize_url(url, 'http')
+                key = canonical_key(url) if url else None
+                if key and seen.add(key):
+                    batch.append((url, url_hash(url)))
+                elif key:
+                    duplicates += 1
+
+            # URLs and cursor in one transaction, so a restart is exact. A page
+            # cut short by the limit is fetched again, its stored URLs skipped
+            DBAccess.cursor.executemany("INSERT INTO URLs (URL, URL_Hash) VALUES (?,?)", batch)
+            stored += len(batch)
+            next_page = current + 1 if complete else current
+            save_state(index_url, pattern, next_page, pages, collected + stored)
+            DBAccess.conn.commit()
+
+            print(f"Page {current}: inserted {len(batch)} URLs, {duplicates} duplicates so far "
+                  f"(Total: {existing + stored}/{max_urls})")
+
+        else:
+            print("--- Limit Reached. Stopping. ---")
 
-            except Exception as e:
-                print(f"\n[!] Error: {e}")
-                time.sleep(2)
-                
+    except KeyboardInterrupt:
+        print(f"\n--- Stopped. Next run continues at page {next_page}. ---")
+    except (requests.RequestException, sqlite3.DatabaseError) as e:
+        print(f"\n[!] Error: {e}. Next run continues at page {next_page}.")
     finally:
-        conn.close()
-        print("Database connection closed.")
+        executor.shutdown(wait=False, cancel_futures=True)
+        session.close()
+
+    return stored
+
 
 if __name__ == "__main__":
-    get_urls()
\ No newline at end of file
+    sqlite3.register_adapter(datetime, lambda dt: dt.strftime("%Y-%m-%d %H:%M:%S"))
+
+    DBAccess.open()
+    try:
+        get_urls()
+    finally:
+        DBAccess.close()
+        print("Database connection closed.")
@@ -0,0 +1,286 @@
+"""Bulk trace importer for Salsa2 Simulator.
+
+Streams a URL list into the database - a new or existing trace's
+Trace_Entry rows, or the URLs table the generators draw from - in one
+pass over the file, instead of one INSERT per line like MajestaParser.py
+and httpParser.py. Supported inputs, optionally gzip-compressed:
+
+* 'text'  - one URL per line; empty lines and '#' comments are skipped
+* 'csv'   - the URL is taken from one column, by index or header name
+* 'jsonl' - one JSON object per line, the URL is taken from one field
+
+URLs are normalized and canonicalized (see database.url_index), so the
+URLs table gets no duplicates and traces no URL variants, and inserted
+with `executemany` in batches of IMPORT_BATCH rows, all inside a single
+transaction, so a failed import leaves the database untouched.
+"""
+import csv
+import gzip
+import io
+import json
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, TextIO, Tuple, Union
+from zoneinfo import ZoneInfo
+
+# Add project root to Python path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from analysis.profile import update_profile
+from database.db_access import DBAccess
+from database.url_index import Canonicalizer, UrlIndex, normalize_url
+
+FORMATS = ('text', 'csv', 'jsonl')
+TARGETS = ('trace', 'urls')
+IMPORT_BATCH = 100000
+
+
+def open_input(path: str) -> TextIO:
+    """Open a text file for streaming, decompressing it if it is gzipped."""
+    with open(path, 'rb') as f:
+        gzipped = f.read(2) == b'\x1f\x8b'
+
+    if gzipped:
+        return io.TextIOWrapper(gzip.open(path, 'rb'), encoding='utf-8',
+                                errors='replace', newline='')
+    return open(path, 'r', encoding='utf-8', errors='replace', newline='')
+
+
+def detect_format(path: str) -> str:
+    """Input format implied by a file name, ignoring a .gz suffix."""
+    suffixes = [suffix.lower() for suffix in Path(path).suffixes if suffix.lower() != '.gz']
+    suffix = suffixes[-1] if suffixes else ''
+
+    if suffix == '.csv':
+        return 'csv'
+    if suffix in ('.jsonl', '.ndjson', '.json'):
+        return 'jsonl'
+    return 'text'
+
+
+def read_urls(lines: Iterable[str], fmt: str,
+              column: Union[int, str] = 0, field: str = 'url') -> Iterator[str]:
+    """Raw URLs of an input stream.
+
+    Args:
+        lines: Lines of the input
+        fmt: 'text', 'csv' or 'jsonl'
+        column: CSV column of the URL - an index, or a header name (the
+            first row is then taken as the header)
+        field: JSONL field of the URL, looked up as given and lower-cased
+
+    Returns:
+        Iterator of the URLs, in input order
+    """
+    if fmt == 'csv':
+        rows = csv.reader(lines)
+        if isinstance(column, str):
+            header = next(rows, [])
+            try:
+                column = [name.strip() for name in header].index(column)
+            except ValueError:
+                print(f"Error: No column named '{column}' in the CSV header.")
+                return
+
+        for row in rows:
+            if len(row) > column:
+                yield row[column]
+
+    elif fmt == 'jsonl':
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+            if isinstance(record, dict):
+                url = record.get(field) or record.get(field.lower())
+                if isinstance(url, str):
+                    yield url
+            elif isinstance(record, str):
+                yield record
+
+    else:
+        for line in lines:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line
+
+
+def import_urls(urls: Iterable[str], target: str = 'trace',
+                trace_id: Optional[int] = None, scheme: str = 'https') -> Tuple[int, int, int]:
+    """Normalize and insert URLs in batches, in one transaction.
+
+    Trace entries are stored as their canonical representative, so URL
+    variants (http/https, www., trailing slash) become one URL. The URLs
+    table receives each canonical URL once, duplicates of stored or
+    earlier URLs being skipped.
+
+    Args:
+        urls: Raw URLs, see read_urls
+        target: 'trace' to append to a trace's entries, 'urls' for the URLs table
+        trace_id: ID of the trace, for the 'trace' target
+        scheme: Scheme of bare host names
+
+    Returns:
+        (inserted, skipped, duplicates): Number of rows inserted, of invalid
+        URLs skipped, and of duplicates not inserted into URLs
+    """
+    if target == 'trace':
+        sql = "INSERT INTO Trace_Entry(URL, Trace_ID, URL_Hash) VALUES (?,?,?)"
+        canonical = Canonicalizer()
+    else:
+        sql = "INSERT INTO URLs(URL, URL_Hash) VALUES (?,?)"
+        index = UrlIndex()
+
+    inserted = 0
+    skipped = 0
+    duplicates = 0
+    start = time.monotonic()
+
+    def rows(batch):
+        nonlocal skipped, duplicates
+        for url in batch:
+            url = normalize_url(url, scheme)
+            if url is None:
+                skipped += 1
+            elif target == 'trace':
+                representative, value = canonical(url)
+                yield (representative, trace_id, value)
+            else:
+                value = index.add(url)
+                if value is None:
+                    duplicates += 1
+                else:
+                    yield (url, value)
+
+    urls = iter(urls)
+    while True:
+        batch = list(islice(urls, IMPORT_BATCH))
+        if not batch:
+            break
+
+        before = DBAccess.conn.total_changes
+        DBAccess.cursor.executemany(sql, rows(batch))
+        inserted += DBAccess.conn.total_changes - before
+
+        elapsed = time.monotonic() - start
+        print(f"Imported {inserted} rows ({inserted / elapsed if elapsed else 0:,.0f} rows/sec)")
+
+    return inserted, skipped, duplicates
+
+
+def import_file(path: str, target: str = 'trace', name: Optional[str] = None,
+                trace_id: Optional[int] = None, fmt: Optional[str] = None,
+                column: Union[int, str] = 0, field: str = 'url',
+                scheme: str = 'https') -> Optional[int]:
+    """Import a URL list file.
+
+    Args:
+        path: Input file, optionally gzipped
+        target: 'trace' or 'urls'
+        name: Name of a new trace, for the 'trace' target
+        trace_id: ID of an existing trace to append to, instead of `name`
+        fmt: 'text', 'csv' or 'jsonl' (default: by file name)
+        column: CSV column of the URL
+        field: JSONL field of the URL
+        scheme: Scheme of bare host names
+
+    Returns:
+        Number of rows inserted, or None on failure
+    """
+    fmt = fmt or detect_format(path)
+    start = time.monotonic()
+
+    try:
+        with open_input(path) as lines:
+            if target == 'trace' and trace_id is None:
+                DBAccess.cursor.execute("INSERT INTO Traces(Name) VALUES (?)", [name])
+                trace_id = DBAccess.cursor.lastrowid
+
+            inserted, skipped, duplicates = import_urls(read_urls(lines, fmt, column, field),
+                                            target, trace_id, scheme)
+
+            if target == 'trace':
+                DBAccess.cursor.execute("UPDATE Traces SET Last_Update=? WHERE id=?",
+                                        [datetime.now(ZoneInfo("Asia/Jerusalem")), trace_id])
+            DBAccess.conn.commit()
+
+    except (OSError, EOFError, csv.Error, sqlite3.DatabaseError) as e:
+        DBAccess.conn.rollback()
+        print(f"Import failed: {e}")
+        return None
+
+    elapsed = time.monotonic() - start
+    print(f"Imported {inserted} rows in {elapsed:.1f}s "
+          f"({inserted / elapsed if elapsed else 0:,.0f} rows/sec), "
+          f"skipped {skipped} invalid URLs" +
+          (f" and {duplicates} duplicates" if duplicates else ""))
+    if target == 'trace':
+        print(f"Trace ID: {trace_id}")
+        update_profile(trace_id)
+
+    return inserted
+
+
+def main():
+    sqlite3.register_adapter(datetime, lambda dt: dt.strftime("%Y-%m-%d %H:%M:%S"))
+
+    print("################ Welcome to trace importer ####################")
+
+    path = input("Insert file path: ").strip()
+    if not Path(path).is_file():
+        print(f"Error: File '{path}' not found.")
+        return
+
+    fmt = input(f"Format ({', '.join(FORMATS)}) [{detect_format(path)}]: ").strip().lower()
+    fmt = fmt or detect_format(path)
+    if fmt not in FORMATS:
+        print(f"Error: Unknown format '{fmt}'.")
+        return
+
+    column, field = 0, 'url'
+    if fmt == 'csv':
+        answer = input("URL column, as index or header name [0]: ").strip() or '0'
+        column = int(answer) if answer.isdigit() else answer
+    elif fmt == 'jsonl':
+        field = input("URL field [url]: ").strip() or 'url'
+
+    target = input(f"Import into ({', '.join(TARGETS)}) [trace]: ").strip().lower() or 'trace'
+    if target not in TARGETS:
+        print(f"Error: Unknown target '{target}'.")
+        return
+
+    name, trace_id = None, None
+    if target == 'trace':
+        answer = input("Insert trace name, or an existing trace ID to append to: ").strip()
+        if not answer:
+            print("Error: Trace name cannot be empty.")
+            return
+        if answer.isdigit():
+            trace_id = int(answer)
+        else:
+            name = answer
+
+    DBAccess.open()
+    try:
+        if trace_id is not None:
+            DBAccess.cursor.execute("SELECT id FROM Traces WHERE id = ?", [trace_id])
+            if not DBAccess.cursor.fetchone():
+                print(f"Error: Trace ID {trace_id} does not exist.")
+                return
+
+        import_file(path, target, name, trace_id, fmt, column, field)
+    finally:
+        DBAccess.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Merge duplicate URLs for Salsa2 Simulator.
+
+One-off job for databases filled before URLs were canonicalized: hashes
+every stored URL, deletes URLs rows that are variants (http/https, www.,
+trailing slash, fragment) of an older row, and rewrites trace entries to
+one representative URL per canonical key. See database.url_index.
+"""
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+# Add project root to Python path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from database.db_access import DBAccess
+from database.url_index import merge_duplicates
+
+
+def main():
+    print("################ Welcome to URL merge ####################")
+
+    answer = input("Merge duplicate URLs in URLs and all traces? (y/N): ").strip().lower()
+    if answer != 'y':
+        print("Cancelled.")
+        return
+
+    DBAccess.open()
+    try:
+        start = time.monotonic()
+        urls_deleted, entries_rewritten = merge_duplicates()
+        print(f"Deleted {urls_deleted} duplicate URLs and rewrote {entries_rewritten} "
+              f"trace entries in {time.monotonic() - start:.1f}s")
+    except sqlite3.DatabaseError as e:
+        DBAccess.conn.rollback()
+        print(f"Merge failed: {e}")
+    finally:
+        DBAccess.close()
+
+
+if __name__ == "__main__":
+    main()
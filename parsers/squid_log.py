@@ -0,0 +1,393 @@
+"""Squid access.log ingestion for Salsa2 Simulator.
+
+Turns the access log of the local Squid (the `log_file` config key) into
+traces that keep each request's logged time as Trace_Entry.Arrival_Time,
+so the 'recorded' open-loop schedule replays production traffic with its
+own timing. The log is read line by line - and, in follow mode, tailed as
+it grows, across rotations - so memory stays bounded whatever its size.
+
+Lines are parsed by the log's own Squid `logformat`: the `log_format`
+config key holds either a predefined format name ('squid', 'common',
+'combined') or a custom format string with Squid's % codes, e.g.
+
+    %ts.%03tu %6tr %>a %Ss/%03>Hs %<st %rm %ru %[un %Sh/%<a %mt
+
+The Squid and hierarchy status of each line (e.g. TCP_MISS/200 and
+CD_PARENT_HIT/10.0.0.2) can also be attached to the Requests rows of a
+run replayed through that Squid, matched by URL within the run's time
+window.
+"""
+import os
+import re
+import sqlite3
+import sys
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional, Pattern, Sequence
+from zoneinfo import ZoneInfo
+
+# Add project root to Python path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from analysis.profile import update_profile
+from config.config import MyConfig
+from database.db_access import DBAccess
+from database.result_writer import ResultWriter
+from database.url_index import Canonicalizer, canonical_key, normalize_url
+from parsers.importer import IMPORT_BATCH, open_input
+
+# Squid's predefined logformats
+FORMATS = {
+    'squid': '%ts.%03tu %6tr %>a %Ss/%03>Hs %<st %rm %ru %[un %Sh/%<a %mt',
+    'common': '%>a %[ui %[un [%tl] "%rm %ru HTTP/%rv" %>Hs %<st %Ss:%Sh',
+    'combined': ('%>a %[ui %[un [%tl] "%rm %ru HTTP/%rv" %>Hs %<st '
+                 '"%{Referer}>h" "%{User-Agent}>h" %Ss:%Sh'),
+}
+
+# Format codes the parser uses, and the LogEntry field each one fills
+FIELDS = {
+    'ts': 'ts', 'tu': 'tu', 'tl': 'tl', 'tg': 'tl', 'tr': 'elapsed_ms',
+    '>a': 'client', 'Ss': 'squid_status', '>Hs': 'http_status', 'Hs': 'http_status',
+    '<st': 'bytes', 'st': 'bytes', 'rm': 'method', '>rm': 'method',
+    'ru': 'url', '>ru': 'url', 'Sh': 'hierarchy', '<a': 'peer', '<A': 'peer',
+}
+
+# A format code: modifiers, width, {argument} and the code itself
+CODE_PATTERN = re.compile(r'%[-"\'\[#/+&]*[0-9]*(?:\.[0-9]+)?(?:\{[^}]*\})?'
+                          r'(>Hs|<Hs|<st|>st|>rm|>ru|<a|<A|>a|>A|>h|<h|'
+                          r'[<>]?[A-Za-z]{1,2})')
+
+POLL_INTERVAL = 1.0
+
+
+class LogEntry(NamedTuple):
+    """A parsed access.log line. Fields missing from the format are None."""
+    time: Optional[float]         # unix time the line was logged at
+    elapsed_ms: Optional[int]
+    client: Optional[str]
+    method: Optional[str]
+    url: str
+    squid_status: Optional[str]   # e.g. TCP_MISS/200
+    hierarchy: Optional[str]      # e.g. CD_PARENT_HIT/10.0.0.2
+    bytes: Optional[int]
+
+
+def compile_format(log_format: str) -> Pattern:
+    """Compile a Squid logformat (or a predefined format name) into a regex.
+
+    Every code becomes a group running up to the next literal character of
+    the format, so quoted and bracketed fields may contain spaces. Codes
+    the parser does not use are matched and ignored.
+    """
+    log_format = FORMATS.get(log_format, log_format)
+    pattern = [r'\s*']
+    used = set()
+    position = 0
+
+    for match in CODE_PATTERN.finditer(log_format):
+        pattern.append(_literal(log_format[position:match.start()]))
+        position = match.end()
+
+        following = log_format[position:position + 1]
+        if following and not following.isspace():
+            value = f"[^\\s{re.escape(following)}]*" if following not in '"]' \
+                else f"[^{re.escape(following)}]*"
+        else:
+            value = r'\S*'
+
+        name = FIELDS.get(match.group(1))
+        if name and name not in used:
+            used.add(name)
+            pattern.append(f"(?P<{name}>{value})")
+        else:
+            pattern.append(value)
+
+    pattern.append(_literal(log_format[position:]))
+
+    if 'url' not in used:
+        raise ValueError(f"Log format has no URL (%ru) field: {log_format}")
+
+    return re.compile(''.join(pattern) + r'\s*')
+
+
+def _literal(text: str) -> str:
+    return r'\s+'.join(re.escape(part) for part in re.split(r'\s+', text))
+
+
+def _number(value: Optional[str]):
+    if not value or value == '-':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _text(value: Optional[str]) -> Optional[str]:
+    return value if value and value != '-' else None
+
+
+def parse_line(pattern: Pattern, line: str) -> Optional[LogEntry]:
+    """Parse an access.log line, or None if it does not match the format."""
+    match = pattern.fullmatch(line.rstrip('\r\n'))
+    if not match:
+        return None
+    fields = match.groupdict()
+
+    logged = _number(fields.get('ts'))
+    if logged is not None:
+        logged += (_number(fields.get('tu')) or 0) / 1000
+    elif fields.get('tl'):
+        try:
+            logged = datetime.strptime(fields['tl'], "%d/%b/%Y:%H:%M:%S %z").timestamp()
+        except ValueError:
+            logged = None
+
+    squid_status = _text(fields.get('squid_status'))
+    http_status = _text(fields.get('http_status'))
+    if squid_status and http_status and '/' not in squid_status:
+        squid_status = f"{squid_status}/{http_status}"
+
+    hierarchy = _text(fields.get('hierarchy'))
+    peer = _text(fields.get('peer'))
+    if hierarchy and peer and '/' not in hierarchy:
+        hierarchy = f"{hierarchy}/{peer}"
+
+    elapsed = _number(fields.get('elapsed_ms'))
+    size = _number(fields.get('bytes'))
+
+    return LogEntry(logged,
+                    int(elapsed) if elapsed is not None else None,
+                    _text(fields.get('client')),
+                    _text(fields.get('method')),
+                    fields['url'],
+                    squid_status,
+                    hierarchy,
+                    int(size) if size is not None else None)
+
+
+def read_lines(path: str, follow: bool = False,
+               poll_interval: float = POLL_INTERVAL) -> Iterator[str]:
+    """Lines of a log file, optionally following it as it grows.
+
+    In follow mode the generator never ends by itself: it waits for new
+    lines, holds back a partially written last line, and reopens the file
+    when it is rotated (replaced or truncated). Stop it with Ctrl-C.
+
+    Args:
+        path: Log file, optionally gzipped (not followed then)
+        follow: Keep reading lines appended after the current end
+        poll_interval: Seconds between checks for new lines
+    """
+    log = open_input(path)
+    pending = ''
+
+    try:
+        while True:
+            line = log.readline()
+            if line:
+                if line.endswith('\n'):
+                    yield pending + line
+                    pending = ''
+                else:
+                    pending += line
+                continue
+
+            if not follow:
+                if pending:
+                    yield pending
+                return
+
+            # Rotated: a new file at the path, or the old one truncated
+            try:
+                current = os.stat(path)
+                opened = os.fstat(log.fileno())
+                rotated = (current.st_ino != opened.st_ino or
+                           current.st_size < log.tell())
+            except (OSError, ValueError):
+                rotated = False
+
+            if rotated:
+                log.close()
+                log = open_input(path)
+                pending = ''
+            else:
+                time.sleep(poll_interval)
+    finally:
+        log.close()
+
+
+def parse_log(lines: Iterable[str], pattern: Pattern,
+              methods: Optional[Sequence[str]] = ('GET',)) -> Iterator[LogEntry]:
+    """Entries of the lines that match the format and one of `methods` (None = all)."""
+    for line in lines:
+        entry = parse_line(pattern, line)
+        if entry and (methods is None or entry.method is None or entry.method in methods):
+            yield entry
+
+
+def capture_trace(entries: Iterable[LogEntry], name: str) -> Optional[int]:
+    """Store log entries as a new trace, keeping their logged times.
+
+    Rows are committed in batches as they come, so a followed log that is
+    stopped with Ctrl-C keeps everything read until then.
+
+    Returns:
+        ID of the new trace, or None on failure
+    """
+    jerusalem = ZoneInfo("Asia/Jerusalem")
+
+    try:
+        DBAccess.cursor.execute("INSERT INTO Traces(Name) VALUES (?)", [name])
+        trace_id = DBAccess.cursor.lastrowid
+        DBAccess.conn.commit()
+
+        writer = ResultWriter("""INSERT INTO Trace_Entry(URL, Trace_ID, Arrival_Time, URL_Hash)
+                              VALUES (?,?,?,?)""", sync=False, batch_size=IMPORT_BATCH)
+        canonical = Canonicalizer()
+        captured = 0
+        skipped = 0
+
+        try:
+            for entry in entries:
+                url = normalize_url(entry.url, 'http')
+                if url is None:
+                    skipped += 1
+                    continue
+
+                representative, value = canonical(url)
+                writer.add((representative, trace_id, entry.time, value))
+                captured += 1
+                if captured % IMPORT_BATCH == 0:
+                    print(f"Captured {captured} entries")
+        except KeyboardInterrupt:
+            print("\nCapture stopped")
+
+        writer.flush()
+        DBAccess.cursor.execute("UPDATE Traces SET Last_Update=? WHERE id=?",
+                                [datetime.now(jerusalem), trace_id])
+        DBAccess.conn.commit()
+
+    except sqlite3.DatabaseError as e:
+        print(f"Failed to capture trace: {e}")
+        return None
+
+    print(f"Captured {captured} entries into trace {trace_id}, skipped {skipped} non-HTTP URLs")
+    update_profile(trace_id)
+    return trace_id
+
+
+def _unix_time(value) -> Optional[float]:
+    try:
+        return (datetime.strptime(str(value)[:19], "%Y-%m-%d %H:%M:%S")
+                .replace(tzinfo=ZoneInfo("Asia/Jerusalem")).timestamp())
+    except ValueError:
+        return None
+
+
+def attach_statuses(run_id: int, entries: Iterable[LogEntry], slack: float = 60) -> int:
+    """Store the Squid and hierarchy status of log entries on a run's Requests.
+
+    A run's requests are matched, in order, to the log entries for the same
+    URL logged between the run's start and end (with `slack` seconds of
+    clock skew on both sides). URLs are compared by their scheme-less
+    canonical key: HTTPS URLs are sent to Squid as http:// (see
+    send_proxied_request), so Squid logs them as http:// while Requests
+    keeps the original https:// URL.
+
+    Returns:
+        int: Number of Requests rows updated
+    """
+    DBAccess.cursor.execute("SELECT Start_Time, End_Time FROM Runs WHERE id = ?", [run_id])
+    run = DBAccess.cursor.fetchone()
+    if not run:
+        print(f"Error: Run {run_id} does not exist.")
+        return 0
+
+    start, end = (_unix_time(value) for value in run)
+    if start is None:
+        print(f"Error: Run {run_id} has no valid start time.")
+        return 0
+    if end is None or end < start:
+        end = float('inf')
+
+    DBAccess.cursor.execute("SELECT id, URL FROM Requests WHERE Run_ID = ? ORDER BY id", [run_id])
+    pending: Dict[str, deque] = defaultdict(deque)
+    for request_id, url in DBAccess.cursor.fetchall():
+        pending[canonical_key(url) or url].append(request_id)
+
+    writer = ResultWriter("UPDATE Requests SET Squid_Status = ?, Hierarchy = ? WHERE id = ?",
+                          sync=False, batch_size=IMPORT_BATCH)
+    matched = 0
+
+    for entry in entries:
+        if entry.time is not None and not start - slack <= entry.time <= end + slack:
+            continue
+
+        waiting = pending.get(canonical_key(entry.url) or entry.url)
+        if waiting:
+            writer.add((entry.squid_status, entry.hierarchy, waiting.popleft()))
+            matched += 1
+
+    writer.flush()
+    print(f"Attached Squid status to {matched} requests of run {run_id}")
+    return matched
+
+
+def main():
+    sqlite3.register_adapter(datetime, lambda dt: dt.strftime("%Y-%m-%d %H:%M:%S"))
+
+    print("################ Welcome to Squid log parser ####################")
+
+    config = MyConfig()
+    default_path = config.get_key('log_file') or ''
+    path = input(f"Insert access.log path [{default_path}]: ").strip() or default_path
+    if not Path(path).is_file():
+        print(f"Error: File '{path}' not found.")
+        return
+
+    try:
+        pattern = compile_format(config.get_key('log_format') or 'squid')
+    except (ValueError, re.error) as e:
+        print(f"Error: Invalid log_format: {e}")
+        return
+
+    action = input("""Choose action:
+    1: Capture log into a new trace
+    2: Attach Squid status to a run's requests
+    """).strip()
+
+    DBAccess.open()
+    try:
+        if action == '1':
+            name = input("Insert trace name: ").strip()
+            if not name:
+                print("Error: Trace name cannot be empty.")
+                return
+
+            follow = input("Follow the log as it grows? (y/N): ").strip().lower() == 'y'
+            if follow:
+                print("Following log - press Ctrl-C to stop")
+
+            capture_trace(parse_log(read_lines(path, follow), pattern), name)
+
+        elif action == '2':
+            try:
+                run_id = int(input("Insert run ID: "))
+            except ValueError:
+                print("Error: Invalid run ID. Please enter a number.")
+                return
+
+            attach_statuses(run_id, parse_log(read_lines(path), pattern, methods=None))
+
+        else:
+            print("Invalid option.")
+    finally:
+        DBAccess.close()
+
+
+if __name__ == "__main__":
+    main()
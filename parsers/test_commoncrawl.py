@@ -0,0 +1,35 @@
+"""Tests for the BloomFilter of parsers/commoncrawl.py."""
+from parsers.commoncrawl import BloomFilter
+
+
+def test_no_false_negatives():
+    bloom = BloomFilter(10000)
+    urls = [f"https://example{i}.net/page" for i in range(10000)]
+
+    for url in urls:
+        bloom.add(url)
+
+    assert all(url in bloom for url in urls)
+
+
+def test_add_reports_repeats():
+    bloom = BloomFilter(100)
+    assert bloom.add('https://example.net/a')
+    assert not bloom.add('https://example.net/a')
+
+
+def test_false_positive_rate():
+    bloom = BloomFilter(20000, error_rate=0.01)
+    for i in range(20000):
+        bloom.add(f"https://stored{i}.net/")
+
+    false_positives = sum(f"https://other{i}.net/" in bloom for i in range(20000))
+    # Well within twice the configured rate at full capacity
+    assert false_positives < 20000 * 0.02
+
+
+def test_size_follows_capacity_and_rate():
+    # About 1.8 MB for a million URLs at 0.1%
+    bloom = BloomFilter(1000000)
+    assert 1.7e6 < len(bloom.bits) < 1.9e6
+    assert bloom.hashes == 10
@@ -0,0 +1,42 @@
+"""Tests for parsers/importer.py."""
+import gzip
+
+from parsers import importer
+
+
+def _gzipped(path, lines):
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        f.write(''.join(f"{line}\n" for line in lines))
+    return str(path)
+
+
+def _tables(database):
+    return {table: database.cursor.execute(f"SELECT * FROM {table} ORDER BY id").fetchall()
+            for table in ('Traces', 'Trace_Entry', 'URLs')}
+
+
+def test_import_trace(database, tmp_path):
+    path = _gzipped(tmp_path / 'trace.txt.gz',
+                    ['# comment', 'example.com/a', 'http://www.example.com/a/', 'ftp://x/'])
+
+    assert importer.import_file(path, name='T1') == 2
+
+    rows = database.cursor.execute("SELECT URL, Trace_ID FROM Trace_Entry").fetchall()
+    assert rows == [('https://example.com/a', 1), ('https://example.com/a', 1)]
+
+
+def test_failed_import_leaves_the_database_untouched(database, tmp_path, monkeypatch):
+    # A URLs row without a hash, so building the index backfills it
+    database.cursor.execute("INSERT INTO URLs(URL) VALUES ('https://example.com/')")
+    database.conn.commit()
+    before = _tables(database)
+
+    # Several batches are inserted before the truncated file fails to read
+    monkeypatch.setattr(importer, 'IMPORT_BATCH', 10)
+    path = tmp_path / 'trace.txt.gz'
+    _gzipped(path, [f"https://example.com/{i}" for i in range(5000)])
+    path.write_bytes(path.read_bytes()[:-200])
+
+    assert importer.import_file(str(path), name='T1') is None
+    assert database.cursor.execute("SELECT COUNT(*) FROM Trace_Entry").fetchone()[0] == 0
+    assert _tables(database) == before
@@ -0,0 +1,60 @@
+"""Tests for the access.log parsing of parsers/squid_log.py."""
+import pytest
+
+from parsers.squid_log import LogEntry, compile_format, parse_line
+
+
+def test_squid_format():
+    line = ("1700000000.123    250 10.0.0.5 TCP_MISS/200 5120 GET "
+            "http://example.com/a.html - CD_PARENT_HIT/10.0.0.2 text/html\n")
+
+    assert parse_line(compile_format('squid'), line) == LogEntry(
+        1700000000.123, 250, '10.0.0.5', 'GET', 'http://example.com/a.html',
+        'TCP_MISS/200', 'CD_PARENT_HIT/10.0.0.2', 5120)
+
+
+def test_common_format():
+    line = ('10.0.0.5 - - [14/Nov/2023:22:13:20 +0000] '
+            '"GET http://example.com/a HTTP/1.1" 200 5120 TCP_HIT:HIER_NONE')
+
+    assert parse_line(compile_format('common'), line) == LogEntry(
+        1700000000.0, None, '10.0.0.5', 'GET', 'http://example.com/a',
+        'TCP_HIT/200', 'HIER_NONE', 5120)
+
+
+def test_combined_format_with_spaces_in_quotes():
+    line = ('10.0.0.5 - alice [14/Nov/2023:22:13:20 +0000] '
+            '"GET https://example.com/b?q=1 HTTP/1.1" 304 0 '
+            '"http://referrer.test/page" "Mozilla/5.0 (X11; Linux x86_64)" '
+            'TCP_REFRESH_UNMODIFIED:FIRSTUP_PARENT')
+
+    entry = parse_line(compile_format('combined'), line)
+    assert entry.url == 'https://example.com/b?q=1'
+    assert entry.squid_status == 'TCP_REFRESH_UNMODIFIED/304'
+    assert entry.hierarchy == 'FIRSTUP_PARENT'
+    assert entry.bytes == 0
+
+
+def test_custom_format():
+    pattern = compile_format('%ts %>a %ru %Ss %<st')
+    entry = parse_line(pattern, '1700000000 10.0.0.9 http://example.com/c TCP_HIT -')
+
+    assert entry == LogEntry(1700000000.0, None, '10.0.0.9', None,
+                             'http://example.com/c', 'TCP_HIT', None, None)
+
+
+def test_unused_codes_are_skipped():
+    pattern = compile_format('%ts %{Host}>h %ru %mt')
+    entry = parse_line(pattern, '1700000000 example.com http://example.com/d text/css')
+    assert entry.url == 'http://example.com/d'
+
+
+def test_lines_that_do_not_match():
+    pattern = compile_format('squid')
+    assert parse_line(pattern, 'not an access log line') is None
+    assert parse_line(pattern, '') is None
+
+
+def test_format_needs_a_url():
+    with pytest.raises(ValueError):
+        compile_format('%ts %>a %Ss')
@@ -1,15 +1,15 @@
 import sys
 from pathlib import Path
 
-import requests
-
 # Add project root to Python path
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 from prettytable import PrettyTable
+from analysis.profile import update_profile
 from ui.repository import UIRepository
 from database.db_access import DBAccess
+from http_requests.validator import validate_urls
 
 def get_trace_id():
     # Get from user trace id to show its content
@@ -47,34 +47,35 @@ def get_urls(trace_id):
 
     return(URLs)
 
-def delete_url(URL):
+def delete_urls(trace_id, URLs):
+    """Delete all entries of the given URLs from one trace, in one statement."""
+    DBAccess.cursor.execute("CREATE TEMP TABLE IF NOT EXISTS Bad_URLs(URL TEXT PRIMARY KEY)")
+    DBAccess.cursor.execute("DELETE FROM temp.Bad_URLs")
+    DBAccess.cursor.executemany("INSERT OR IGNORE INTO temp.Bad_URLs(URL) VALUES (?)",
+                                ((URL,) for URL in URLs))
+
     DBAccess.cursor.execute("""
         DELETE FROM Trace_Entry
-        WHERE URL = ?""", [URL])
+        WHERE Trace_ID = ?
+        AND URL IN (SELECT URL FROM temp.Bad_URLs)""", [trace_id])
 
-def clean_trace(URLs):
-    ca_bundle = '/etc/ssl/certs/ca-certificates.crt'
-    count = 0
-    
-    for URL, in URLs:
-        try:
-            response = requests.get(URL, timeout=5, 
-                              verify=ca_bundle, allow_redirects=False)
-
-            if response.status_code < 300:
-                continue
-                
-        except Exception as e:
-            print(f"{URL} error: {e}")
-        
+    return DBAccess.cursor.rowcount
 
+def clean_trace(trace_id, URLs):
+    # Validate concurrently, skipping URLs validated recently
+    results = validate_urls(URL for URL, in URLs)
+    bad_urls = [URL for URL, result in results.items() if not result.ok]
+
+    for URL in bad_urls:
         print(f"Deleting {URL}")
-        delete_url(URL)
-        count += 1
-    
+
+    entries = delete_urls(trace_id, bad_urls)
     DBAccess.conn.commit()
+    update_profile(trace_id)
+
+    print(f"{entries} trace entries deleted")
 
-    return count
+    return len(bad_urls)
 
 
 ######### Main ########
@@ -87,7 +88,7 @@ trace_id = get_trace_id()
 
 URLs = get_urls(trace_id)
 
-count = clean_trace(URLs)
+count = clean_trace(trace_id, URLs)
 
 print (f"{count} URLs cleaned successfuly")
 
@@ -7,7 +7,8 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from database.db_access import DBAccess
 import random
-import requests
+from http_requests.resolver import hostname_of, pre_resolve
+from http_requests.session_pool import get_direct_session
 
 """
 This script generates random trace and its entries in the database. 
@@ -85,18 +86,34 @@ for trace_index in range(traces):
     # Randomly select a starting key ID for the entries
     ids_sample = random.sample(range(1, keys + 1), entries)
 
+    # Fetch the sampled URLs and resolve their hosts up front, dropping
+    # URLs whose host doesn't resolve before any validation request
+    urls_by_id = {}
+    for start in range(0, len(ids_sample), 500):
+        chunk = ids_sample[start:start + 500]
+        cursor.execute(f"SELECT id, URL FROM URLs WHERE id IN ({','.join('?' * len(chunk))})",
+                       chunk)
+        urls_by_id.update(cursor.fetchall())
+
+    failed_hosts = pre_resolve(urls_by_id.values())
+    ids_sample = [url_id for url_id, url in urls_by_id.items()
+                  if hostname_of(url) not in failed_hosts]
+
+    if not ids_sample:
+        print("Error: None of the sampled URLs resolves.")
+        break
+
     ca_bundle = '/etc/ssl/certs/ca-certificates.crt'
+    session = get_direct_session()
     inserted = 0
 
     # Loop to insert the entries for the current trace
     while inserted < entries:
         # Randomly select a key ID for the current entry
-        url_id = ids_sample[random.randint(0, entries - 1)]
-        cursor.execute("SELECT URL FROM URLs WHERE id=?", [url_id])
-        url = cursor.fetchone()[0]
+        url = urls_by_id[random.choice(ids_sample)]
 
         try:
-            response = requests.get(url, timeout=5, 
+            response = session.get(url, timeout=5, 
                               verify=ca_bundle, allow_redirects=False)
 
             if response.status_code < 300:
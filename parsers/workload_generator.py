@@ -0,0 +1,205 @@
+"""Synthetic workload generator for Salsa2 Simulator.
+
+Draws whole traces at once with NumPy from a popularity model, instead of
+picking, fetching and validating one entry at a time like
+trace_generator.py:
+
+* 'zipf'    - the URL of popularity rank k is drawn with probability
+              proportional to 1 / k^alpha
+* 'uniform' - every URL is equally likely
+* 'hotset'  - a hot fraction of the URLs receives a given share of the
+              requests, uniformly within the hot and the cold set
+
+URLs are read once, in one bulk query, and ranked by a seeded random
+permutation, so the same seed and parameters give the same trace. Entries
+are not validated against their origins - run trace_cleaner.py on the
+result when that matters.
+"""
+import os
+import sqlite3
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Sequence
+from zoneinfo import ZoneInfo
+
+# Add project root to Python path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from analysis.profile import update_profile
+from database.db_access import DBAccess
+from database.url_index import HashIndex, url_hash
+
+MODELS = ('zipf', 'uniform', 'hotset')
+INSERT_BATCH = 50000
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        print("numpy is not installed; the workload generator requires numpy to run.")
+        return None
+    return numpy
+
+
+def draw_ranks(np, model: str, universe: int, entries: int, rng,
+               alpha: float = 1.0, hot_fraction: float = 0.2,
+               hot_share: float = 0.8):
+    """Draw popularity ranks (0 = most popular) for a whole trace.
+
+    Args:
+        np: The numpy module
+        model: 'zipf', 'uniform' or 'hotset'
+        universe: Number of distinct URLs to draw from
+        entries: Number of entries to draw
+        rng: numpy Generator
+        alpha: Zipf exponent
+        hot_fraction: Fraction of the URLs in the hot set
+        hot_share: Fraction of the requests that go to the hot set
+
+    Returns:
+        numpy array of ranks
+    """
+    if model == 'zipf':
+        weights = np.arange(1, universe + 1, dtype=np.float64) ** -alpha
+        cdf = np.cumsum(weights)
+        cdf /= cdf[-1]
+        ranks = np.searchsorted(cdf, rng.random(entries), side='right')
+        return np.minimum(ranks, universe - 1)
+
+    if model == 'hotset':
+        hot = min(max(int(universe * hot_fraction), 1), universe)
+        ranks = rng.integers(0, hot, entries)
+        if hot < universe:
+            cold = rng.random(entries) >= hot_share
+            ranks[cold] = rng.integers(hot, universe, int(cold.sum()))
+        return ranks
+
+    return rng.integers(0, universe, entries)
+
+
+def load_urls(limit: int = 0) -> List[str]:
+    """Distinct URLs of the URLs table (the first `limit` by id), in one query.
+
+    URL variants with the same canonical key are drawn as one URL.
+    """
+    DBAccess.cursor.execute(f"""SELECT URL FROM URLs ORDER BY id
+                            {'LIMIT ?' if limit else ''}""",
+                            [limit] if limit else [])
+    rows = DBAccess.cursor.fetchall()
+
+    seen = HashIndex(len(rows))
+    return [url for (url,) in rows if seen.add(url_hash(url) or hash(url))]
+
+
+def generate_trace(name: str, urls: Sequence[str], model: str, entries: int,
+                   seed: Optional[int] = None, **model_args) -> Optional[int]:
+    """Draw a trace and insert it into Traces and Trace_Entry.
+
+    Args:
+        name: Name of the new trace
+        urls: URLs to draw from
+        model: Popularity model, see MODELS
+        entries: Number of entries
+        seed: Seed of the draw, for reproducible traces
+        **model_args: alpha, hot_fraction or hot_share for draw_ranks
+
+    Returns:
+        ID of the new trace, or None on failure
+    """
+    np = _numpy()
+    if np is None or not urls:
+        return None
+
+    rng = np.random.default_rng(seed)
+
+    # Random popularity order of the URLs, then one rank per entry
+    order = rng.permutation(len(urls))
+    ranks = draw_ranks(np, model, len(urls), entries, rng, **model_args)
+    picks = order[ranks].tolist()
+
+    try:
+        DBAccess.cursor.execute("INSERT INTO Traces(Name) VALUES (?)", [name])
+        trace_id = DBAccess.cursor.lastrowid
+
+        hashes = [url_hash(url) for url in urls]
+        for start in range(0, entries, INSERT_BATCH):
+            DBAccess.cursor.executemany(
+                "INSERT INTO Trace_Entry(URL, Trace_ID, URL_Hash) VALUES (?,?,?)",
+                ((urls[index], trace_id, hashes[index])
+                 for index in picks[start:start + INSERT_BATCH]))
+            print(f"Inserted ({min(start + INSERT_BATCH, entries)}/{entries})")
+
+        DBAccess.cursor.execute("UPDATE Traces SET Last_Update=? WHERE id=?",
+                                [datetime.now(ZoneInfo("Asia/Jerusalem")), trace_id])
+        DBAccess.conn.commit()
+        update_profile(trace_id)
+        return trace_id
+
+    except sqlite3.DatabaseError as e:
+        DBAccess.conn.rollback()
+        print(f"Failed to insert trace: {e}")
+        return None
+
+
+def _ask_float(prompt: str, default: float) -> float:
+    answer = input(f"{prompt} [{default}]: ").strip()
+    return float(answer) if answer else default
+
+
+def main():
+    sqlite3.register_adapter(datetime, lambda dt: dt.strftime("%Y-%m-%d %H:%M:%S"))
+
+    print("################ Welcome to workload generator ####################")
+
+    name = input("Insert trace name: ").strip()
+    if not name:
+        print("Error: Trace name cannot be empty.")
+        return
+
+    model = input(f"Popularity model ({', '.join(MODELS)}) [zipf]: ").strip().lower() or 'zipf'
+    if model not in MODELS:
+        print(f"Error: Unknown model '{model}'.")
+        return
+
+    try:
+        entries = int(input("Insert number of entries: "))
+        universe = int(input("Insert number of distinct URLs to draw from, or 0 for all: ") or '0')
+        model_args = {}
+        if model == 'zipf':
+            model_args['alpha'] = _ask_float("Zipf alpha", 1.0)
+        elif model == 'hotset':
+            model_args['hot_fraction'] = _ask_float("Fraction of URLs in the hot set", 0.2)
+            model_args['hot_share'] = _ask_float("Fraction of requests to the hot set", 0.8)
+        seed = input("Seed, or empty for a random one: ").strip()
+        seed = int(seed) if seed else None
+    except ValueError:
+        print("Error: Please enter valid numbers.")
+        return
+
+    if entries <= 0 or universe < 0:
+        print("Error: Number of entries must be positive.")
+        return
+
+    DBAccess.open()
+    try:
+        urls = load_urls(universe)
+        if not urls:
+            print("Error: No URLs found in URLs table. Please add URLs first.")
+            return
+
+        if seed is None:
+            seed = int.from_bytes(os.urandom(4), 'little')
+        print(f"Drawing {entries} entries over {len(urls)} URLs ({model}, seed {seed})")
+
+        trace_id = generate_trace(name, urls, model, entries, seed, **model_args)
+        if trace_id:
+            print(f"Created trace {trace_id}")
+    finally:
+        DBAccess.close()
+
+
+if __name__ == "__main__":
+    main()
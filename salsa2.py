@@ -15,7 +15,9 @@ from database.db_access import DBAccess
 from cache.cache_manager import fill_caches, show_caches
 from ui.display import show_all_runs, show_traces, show_requests
 from http_requests.request_executor import execute_single_req
-from simulation.simulator import run_trace
+from simulation.offline import run_offline_trace
+from simulation.simulator import resume_run, run_trace
+from simulation.sweep import run_sweep
 
 
 def adapt_datetime(dt):
@@ -50,12 +52,15 @@ def main():
     4: Execute single request
     5: Run entire trace
     6: Show caches
+    7: Simulate trace offline
+    8: Run parameter sweep
+    9: Resume interrupted run
     0: Exit
     """)
                 # Take last character to handle multi-digit inputs gracefully
                 opp_code = int(user_input[-1]) if user_input else -1
             except (ValueError, IndexError):
-                print("Invalid input. Please enter a number between 0-6.")
+                print("Invalid input. Please enter a number between 0-9.")
                 continue
             
             if opp_code == 1:
@@ -70,6 +75,12 @@ def main():
                 run_trace()
             elif opp_code == 6:
                 show_caches()
+            elif opp_code == 7:
+                run_offline_trace()
+            elif opp_code == 8:
+                run_sweep()
+            elif opp_code == 9:
+                resume_run()
             elif opp_code:
                 print("Invalid option, please choose a valid number.")
 
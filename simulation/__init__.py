@@ -1,4 +1,6 @@
 """Simulation module for Salsa2 Simulator."""
-from .simulator import run_trace
+from .offline import run_offline_trace, simulate
+from .simulator import resume_run, run_trace
+from .sweep import run_sweep
 
-__all__ = ['run_trace']
+__all__ = ['resume_run', 'run_offline_trace', 'run_sweep', 'run_trace', 'simulate']
@@ -0,0 +1,369 @@
+"""Offline, trace-driven cache simulation for Salsa2 Simulator.
+
+Replays a trace against modeled parent caches instead of the live Squid
+hierarchy, so an experiment takes seconds and needs no SSH resets or
+origin traffic. The trace is read as integer URL IDs from its trace file
+(see database.trace_file), and each parent is a fixed-capacity cache with
+an LRU, LFU or FIFO replacement policy.
+
+The model uses hash-style placement, not Salsa2's cost-based parent
+selection: every object lives only in parent number url_id % parents.
+URL IDs follow first appearance, so new objects are spread round-robin and
+every parent keeps a disjoint share of them. A request hits if its parent
+holds the object and misses otherwise, the object then being stored
+there. Access costs never change a decision - a hit adds its parent's
+access cost and a miss adds `miss_penalty` to the run's total cost, and
+that is all they are used for.
+"""
+import sqlite3
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+from zoneinfo import ZoneInfo
+
+from prettytable import PrettyTable
+
+from cache.registry import get_all_caches
+from config.config import MyConfig
+from database.db_access import DBAccess
+from database.trace_file import TraceFile, get_trace_file
+
+POLICIES = ('lru', 'lfu', 'fifo')
+
+
+def replay_caches(caches: Sequence, url_ids: Sequence[int], hits: bytearray) -> List[int]:
+    """Replay URL IDs against caches, each ID stored in cache url_id % caches.
+
+    Marks the hits in `hits` and returns the hit count of every cache. The
+    generic loop, for any cache with `in`, touch and insert.
+    """
+    count = len(caches)
+    parent_hits = [0] * count
+
+    for pos, url_id in enumerate(url_ids):
+        home = url_id % count
+        cache = caches[home]
+        if url_id in cache:
+            cache.touch(url_id)
+            hits[pos] = 1
+            parent_hits[home] += 1
+        else:
+            cache.insert(url_id)
+
+    return parent_hits
+
+
+class LRUCache:
+    """Evicts the least recently used object."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.entries: OrderedDict = OrderedDict()
+
+    def __contains__(self, key: int) -> bool:
+        return key in self.entries
+
+    def touch(self, key: int):
+        self.entries.move_to_end(key)
+
+    def insert(self, key: int):
+        if self.capacity <= 0:
+            return
+        if len(self.entries) >= self.capacity:
+            self.entries.popitem(last=False)
+        self.entries[key] = None
+
+    @staticmethod
+    def replay(caches: Sequence['LRUCache'], url_ids: Sequence[int],
+               hits: bytearray) -> List[int]:
+        """replay_caches, with the OrderedDict operations inlined."""
+        count = len(caches)
+        tables = [cache.entries for cache in caches]
+        moves = [table.move_to_end for table in tables]
+        evicts = [table.popitem for table in tables]
+        capacities = [cache.capacity for cache in caches]
+        parent_hits = [0] * count
+
+        for pos, url_id in enumerate(url_ids):
+            home = url_id % count
+            table = tables[home]
+            if url_id in table:
+                moves[home](url_id)
+                hits[pos] = 1
+                parent_hits[home] += 1
+            elif capacities[home] > 0:
+                if len(table) >= capacities[home]:
+                    evicts[home](False)
+                table[url_id] = None
+
+        return parent_hits
+
+
+class FIFOCache(LRUCache):
+    """Evicts the object stored first, whatever its later use."""
+
+    def touch(self, key: int):
+        pass
+
+    @staticmethod
+    def replay(caches: Sequence['FIFOCache'], url_ids: Sequence[int],
+               hits: bytearray) -> List[int]:
+        """replay_caches, with the OrderedDict operations inlined."""
+        count = len(caches)
+        tables = [cache.entries for cache in caches]
+        evicts = [table.popitem for table in tables]
+        capacities = [cache.capacity for cache in caches]
+        parent_hits = [0] * count
+
+        for pos, url_id in enumerate(url_ids):
+            home = url_id % count
+            table = tables[home]
+            if url_id in table:
+                hits[pos] = 1
+                parent_hits[home] += 1
+            elif capacities[home] > 0:
+                if len(table) >= capacities[home]:
+                    evicts[home](False)
+                table[url_id] = None
+
+        return parent_hits
+
+
+class LFUCache:
+    """Evicts the least frequently used object, oldest first among ties.
+
+    Objects are grouped in per-frequency buckets, so every operation is
+    O(1).
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.freq: Dict[int, int] = {}
+        self.buckets: Dict[int, OrderedDict] = {}
+        self.min_freq = 0
+
+    def __contains__(self, key: int) -> bool:
+        return key in self.freq
+
+    def touch(self, key: int):
+        freq = self.freq[key]
+        bucket = self.buckets[freq]
+        del bucket[key]
+
+        if not bucket:
+            del self.buckets[freq]
+            if self.min_freq == freq:
+                self.min_freq = freq + 1
+
+        self.freq[key] = freq + 1
+        self.buckets.setdefault(freq + 1, OrderedDict())[key] = None
+
+    def insert(self, key: int):
+        if self.capacity <= 0:
+            return
+
+        if len(self.freq) >= self.capacity:
+            bucket = self.buckets[self.min_freq]
+            evicted, _ = bucket.popitem(last=False)
+            if not bucket:
+                del self.buckets[self.min_freq]
+            del self.freq[evicted]
+
+        self.freq[key] = 1
+        self.buckets.setdefault(1, OrderedDict())[key] = None
+        self.min_freq = 1
+
+    replay = staticmethod(replay_caches)
+
+
+_POLICY_CLASSES = {'lru': LRUCache, 'lfu': LFUCache, 'fifo': FIFOCache}
+
+
+class ParentModel(NamedTuple):
+    """A modeled parent cache."""
+    name: str
+    access_cost: float
+    capacity: int
+
+
+class OfflineResult(NamedTuple):
+    """Outcome of an offline simulation."""
+    hits: bytearray          # 1 per request that was a hit, 0 for a miss
+    parent_hits: Dict[str, int]
+    total_cost: float
+    seconds: float
+
+    @property
+    def requests(self) -> int:
+        return len(self.hits)
+
+    @property
+    def hit_count(self) -> int:
+        return sum(self.hits)
+
+
+def simulate(url_ids: Sequence[int], parents: Sequence[ParentModel],
+             miss_penalty: float, policy: str = 'lru') -> OfflineResult:
+    """Replay interned URL IDs against modeled parents.
+
+    Args:
+        url_ids: Trace as integer URL IDs, in replay order
+        parents: Modeled parent caches
+        miss_penalty: Cost of a request no parent could serve
+        policy: Replacement policy of every parent ('lru', 'lfu', 'fifo')
+
+    Returns:
+        OfflineResult
+    """
+    cache_class = _POLICY_CLASSES[policy]
+    caches = [cache_class(parent.capacity) for parent in parents]
+
+    hits = bytearray(len(url_ids))
+    parent_hits = [0] * len(caches)
+    start = time.perf_counter()
+
+    # Objects are only ever stored in parent url_id % parents (round-robin
+    # in order of first appearance), so each request needs a single lookup
+    if caches:
+        parent_hits = cache_class.replay(caches, url_ids, hits)
+
+    hit_count = sum(parent_hits)
+    total_cost = (sum(count * parent.access_cost for count, parent in zip(parent_hits, parents))
+                  + (len(url_ids) - hit_count) * miss_penalty)
+
+    return OfflineResult(hits,
+                         {parent.name: parent_hits[i] for i, parent in enumerate(parents)},
+                         total_cost,
+                         time.perf_counter() - start)
+
+
+def parents_from_registry(capacity: Optional[int] = None,
+                          caches: Optional[Dict[str, dict]] = None) -> List[ParentModel]:
+    """Model every registered parent, with its squid.conf access cost.
+
+    Without `capacity`, capacities come from `offline_capacity_<name>`,
+    falling back to the `offline_capacity` config key (objects per parent).
+
+    Args:
+        capacity: Objects of every parent, overriding both config keys
+        caches: Caches to model instead of the registry's (name -> details)
+    """
+    config = MyConfig()
+    default = config.get_int('offline_capacity', 1000)
+
+    return [ParentModel(name,
+                        float(info['access_cost']),
+                        capacity if capacity is not None
+                        else config.get_int(f'offline_capacity_{name}', default))
+            for name, info in (caches or get_all_caches()).items()]
+
+
+def load_trace(trace_id: int, limit: int = 0) -> Tuple[TraceFile, memoryview]:
+    """A trace's file and its URL IDs in replay order, at most `limit` of
+    them (0 = all). The IDs are read in place from the memory-mapped file,
+    and are valid until the caller closes it."""
+    trace = get_trace_file(trace_id)
+    return trace, trace.slice(0, limit or None)
+
+
+def store_offline_run(run_id: int, urls: Iterable[str], result: OfflineResult,
+                      store_requests: bool = True):
+    """Write an offline result into the Runs/Requests schema.
+
+    Args:
+        run_id: Run created for the simulation
+        urls: Trace URLs, in replay order
+        result: The simulation outcome
+        store_requests: Also write one Requests row per simulated request
+    """
+    now = datetime.now(ZoneInfo("Asia/Jerusalem"))
+
+    if store_requests:
+        DBAccess.cursor.executemany(
+            """INSERT INTO Requests(
+                'Time', 'URL', 'Run_ID', 'download_bytes', 'hit', 'Trace_Pos')
+                VALUES (?,?,?,0,?,?)""",
+            ((now, url, run_id, hit, pos)
+             for pos, (url, hit) in enumerate(zip(urls, result.hits))))
+
+    DBAccess.cursor.execute("""UPDATE Runs
+        SET End_Time = ?, Total_Cost = ?, Status = 'done', Trace_Pos = ?
+        WHERE id = ?""", [now, result.total_cost, result.requests, run_id])
+
+    DBAccess.conn.commit()
+
+
+def config_policy(policy: Optional[str] = None) -> str:
+    """Validated replacement policy - `policy`, or the `offline_policy` key."""
+    policy = (policy or MyConfig().get_key('offline_policy') or 'lru').lower()
+    if policy not in POLICIES:
+        print(f"Unknown offline_policy '{policy}', using 'lru'")
+        policy = 'lru'
+    return policy
+
+
+def print_offline_result(result: OfflineResult):
+    table = PrettyTable()
+    table.field_names = ['Requests', 'Hits', 'Hit ratio', 'Total cost',
+                         'Avg cost', 'Requests/sec']
+
+    requests = result.requests
+    table.add_row([requests,
+                   result.hit_count,
+                   f"{result.hit_count / requests:.3f}" if requests else '-',
+                   f"{result.total_cost:.2f}",
+                   f"{result.total_cost / requests:.3f}" if requests else '-',
+                   int(requests / result.seconds) if result.seconds else '-'])
+    print(table)
+
+    table = PrettyTable()
+    table.field_names = ['Parent', 'Hits']
+    for name, hits in result.parent_hits.items():
+        table.add_row([name, hits])
+    print(table)
+
+
+def run_offline_trace():
+    """Simulate a user-chosen trace offline and store it as a run."""
+    # Import here to avoid circular dependency
+    from simulation.simulator import _create_run_entry, _get_run_details
+
+    result = _get_run_details()
+    if not result:
+        return
+
+    name, trace_id, limit = result
+    config = MyConfig()
+    policy = config_policy()
+
+    parents = parents_from_registry()
+    if not parents:
+        print("No parent caches found in squid.conf - nothing to simulate.")
+        return
+
+    try:
+        miss_penalty = float(config.get_key('miss_penalty') or 0)
+    except (TypeError, ValueError):
+        miss_penalty = 0.0
+
+    trace = None
+    try:
+        trace, url_ids = load_trace(trace_id, limit)
+
+        outcome = simulate(url_ids, parents, miss_penalty, policy)
+        print_offline_result(outcome)
+
+        run_id = _create_run_entry(name, trace_id, engine='offline')
+        if not run_id:
+            return
+
+        store_offline_run(run_id, trace.urls(0, len(url_ids)), outcome,
+                          config.get_key('offline_store_requests') != '0')
+        print(f"Stored as run {run_id}")
+
+    except (sqlite3.DatabaseError, OSError) as e:
+        print(f"Offline simulation failed: {e}")
+    finally:
+        if trace is not None:
+            trace.close()
@@ -0,0 +1,538 @@
+"""Trace replay engines for Salsa2 Simulator.
+
+Closed-loop engines send the next URL only when an earlier one finished,
+so the offered load depends on how fast the hierarchy answers. The
+open-loop engine sends URLs on a fixed schedule instead, and records how
+far each request fell behind its scheduled send time. The sharded engine
+spreads a closed-loop replay across worker processes.
+
+The engines only decide *when* each trace URL is sent. Measuring a request
+happens in `measure_req` (safe to run on worker threads), while storing
+the outcome - a RequestResult or a RequestFailure - is delegated to the
+`record` callback, which is always invoked on the calling thread - the
+one that owns the sqlite connection.
+"""
+import multiprocessing
+import queue
+import random
+import time
+import zlib
+from array import array
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from config.config import MyConfig
+from database.trace_file import TraceFile
+from http_requests.request_executor import RequestError, RequestResult, measure_req
+from http_requests.resilience import (
+    RequestFailure, RetryPolicy, breaker_keys, get_breaker
+)
+from http_requests.session_pool import close_sessions
+
+
+Outcome = Union[RequestResult, RequestFailure]
+
+
+def _fetch_entry(pos: int, url: str, attempt: int = 1) -> Outcome:
+    """Fetch a trace entry, tagging the outcome with its trace position.
+
+    Entries whose origin or proxy circuit is open fail fast, without
+    sending anything, as retryable failures.
+    """
+    breaker = get_breaker()
+    keys = breaker_keys(url)
+
+    if not all(breaker.allow(key) for key in keys):
+        return RequestFailure(url, pos, "circuit open", True, attempt)
+
+    try:
+        result = measure_req(url)
+    except RequestError as e:
+        print(f"Request {url} error - {e}")
+        for key in breaker_keys(url, e.answered):
+            breaker.failure(key)
+        return RequestFailure(url, pos, str(e), e.retryable, attempt)
+
+    for key in keys:
+        breaker.success(key)
+    return result._replace(trace_pos=pos, attempts=attempt)
+
+
+def replay_serial(entries: Iterable[Tuple],
+                  record: Callable[[Outcome], None],
+                  limit: int = 0) -> int:
+    """Replay URLs one at a time, each after the previous one finished.
+
+    Args:
+        entries: (trace position, URL[, attempt]) tuples, in replay order
+        record: Called with the outcome of every entry - a RequestResult
+            or a RequestFailure
+        limit: Stop after this many successful requests (0 = no limit)
+
+    Returns:
+        int: Number of successful requests
+    """
+    successfully_get = 0
+
+    for entry in entries:
+        result = _fetch_entry(*entry)
+        record(result)
+
+        # If requests succeed and there is limit,
+        # decrease limit and check if reach it
+        if isinstance(result, RequestResult):
+            successfully_get += 1
+
+            if successfully_get == limit:
+                break
+
+    return successfully_get
+
+
+def replay_concurrent(entries: Iterable[Tuple],
+                      record: Callable[[Outcome], None],
+                      limit: int = 0,
+                      concurrency: int = 8) -> int:
+    """Replay URLs keeping up to `concurrency` requests in flight.
+
+    URLs are still sent in trace order, but a new one goes out as soon as
+    any in-flight request completes. With a limit, no more requests are
+    sent than could still be needed to reach it, so the run never records
+    more than `limit` successful requests - the same as the serial engine.
+
+    Args:
+        entries: (trace position, URL[, attempt]) tuples, in replay order
+        record: Called with the outcome of every entry
+        limit: Stop after this many successful requests (0 = no limit)
+        concurrency: Maximum number of requests in flight
+
+    Returns:
+        int: Number of successful requests
+    """
+    if concurrency <= 1:
+        return replay_serial(entries, record, limit)
+
+    successfully_get = 0
+    pending = set()
+    entry_iter = iter(entries)
+    exhausted = False
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while True:
+            # Top up the in-flight window
+            while not exhausted and len(pending) < concurrency and (
+                    not limit or successfully_get + len(pending) < limit):
+                entry = next(entry_iter, None)
+                if entry is None:
+                    exhausted = True
+                    break
+                pending.add(executor.submit(_fetch_entry, *entry))
+
+            if not pending:
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                result = future.result()
+                record(result)
+                if isinstance(result, RequestResult):
+                    successfully_get += 1
+
+    return successfully_get
+
+
+SCHEDULES = ('fixed', 'poisson', 'recorded')
+
+
+def build_schedule(kind: str, rps: float, count: int,
+                   arrivals: Optional[Sequence[float]] = None,
+                   seed: Optional[int] = None) -> Iterator[float]:
+    """Send offsets, in seconds from the start, of the entries of a trace.
+
+    Offsets are generated one at a time, so no schedule is ever held for
+    the whole trace.
+
+    Args:
+        kind: 'fixed' (evenly spaced), 'poisson' (exponential gaps) or
+            'recorded' (the trace's own Arrival_Time gaps)
+        rps: Target requests per second for 'fixed' and 'poisson'
+        count: Number of entries
+        arrivals: Recorded arrival time of every entry, None if the trace
+            has none
+        seed: Seed for the 'poisson' gaps, for reproducible schedules
+
+    Returns:
+        Iterator: Non-decreasing offsets, one per entry
+
+    Raises:
+        ValueError: If a 'fixed' or 'poisson' schedule gets a rate that is
+            not positive
+    """
+    if kind == 'recorded':
+        if count and arrivals is not None:
+            return _recorded_offsets(arrivals[:count])
+
+        print("Trace has no recorded arrival times, using a fixed rate instead")
+        kind = 'fixed'
+
+    if not rps > 0:
+        raise ValueError(f"requests per second must be positive, got {rps}")
+
+    if kind == 'poisson':
+        return _poisson_offsets(count, rps, random.Random(seed))
+
+    return (index / rps for index in range(count))
+
+
+def _recorded_offsets(arrivals: Sequence[float]) -> Iterator[float]:
+    first = arrivals[0]
+    # Clamp out-of-order log lines instead of going back in time
+    latest = 0.0
+    for arrival in arrivals:
+        latest = max(latest, arrival - first)
+        yield latest
+
+
+def _poisson_offsets(count: int, rps: float, rng: random.Random) -> Iterator[float]:
+    now = 0.0
+    for _ in range(count):
+        yield now
+        now += rng.expovariate(rps)
+
+
+def _scheduled_fetch(pos: int, url: str, send_at: float) -> Outcome:
+    """Fetch a trace entry, noting how late it went out relative to send_at."""
+    lag_ms = max(int((time.monotonic() - send_at) * 1000), 0)
+    result = _fetch_entry(pos, url)
+
+    if isinstance(result, RequestResult):
+        return result._replace(lag_ms=lag_ms)
+    return result
+
+
+def replay_open_loop(entries: Iterable[Tuple[int, str, float]],
+                     record: Callable[[Outcome], None],
+                     limit: int = 0,
+                     max_workers: int = 64) -> int:
+    """Replay URLs at their scheduled times, regardless of responses.
+
+    A request's lag is measured when a worker actually starts it, so it
+    also covers time spent waiting for a free worker - if the pool is too
+    small for the offered load, the lag grows and shows it.
+
+    Args:
+        entries: (trace position, URL, offset) triples, offsets in
+            seconds from the start
+        record: Called with the outcome of every entry
+        limit: Stop after this many successful requests (0 = no limit)
+        max_workers: Threads available for requests in flight
+
+    Returns:
+        int: Number of successful requests
+    """
+    successfully_get = 0
+    pending = set()
+
+    def collect(timeout: Optional[float]):
+        nonlocal pending, successfully_get
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            result = future.result()
+            record(result)
+            if isinstance(result, RequestResult):
+                successfully_get += 1
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        start = time.monotonic()
+
+        for pos, url, offset in entries:
+            # Never send more than the limit could still use
+            while limit and pending and successfully_get + len(pending) >= limit:
+                collect(None)
+
+            if limit and successfully_get >= limit:
+                break
+
+            send_at = start + offset
+
+            # Record completed requests while waiting for the send time
+            while (delay := send_at - time.monotonic()) > 0:
+                if pending:
+                    collect(delay)
+                else:
+                    time.sleep(delay)
+
+            # Running behind schedule - still record what already finished
+            if pending:
+                collect(0)
+
+            pending.add(executor.submit(_scheduled_fetch, pos, url, send_at))
+
+        while pending:
+            collect(None)
+
+    return successfully_get
+
+
+# Results a shard worker sends to the parent at a time
+SHARD_BATCH_SIZE = 100
+# Batches a shard worker queues up before it waits for the parent
+SHARD_QUEUE_BATCHES = 10
+# Entries a shard worker replays past its oldest unfinished one at most
+SHARD_WINDOW = 1000
+
+
+def shard_of(url: str, shards: int) -> int:
+    """Stable shard of a URL, so all its repeats land in the same worker."""
+    return zlib.crc32(url.encode()) % shards
+
+
+def _shard_owners(trace: TraceFile, shards: int) -> array:
+    """Shard of every URL ID of a trace."""
+    return array('H', (shard_of(trace.url(url_id), shards) for url_id in range(trace.distinct)))
+
+
+def _shard_entries(trace: TraceFile, owners: array, shard: int,
+                   start: int) -> Iterator[Tuple[int, str]]:
+    """(trace position, URL) of a shard's entries from `start` on, read
+    from the mapped trace."""
+    for pos, url_id in enumerate(trace.slice(start), start):
+        if owners[url_id] == shard:
+            yield pos, trace.url(url_id)
+
+
+def _shard_worker(path: str, start: int, owners: array, shard: int,
+                  config_mapping: dict, concurrency: int,
+                  results: multiprocessing.Queue, stop: multiprocessing.Event):
+    """Replay one shard of a trace file in a worker process.
+
+    The worker maps the trace file itself and replays the entries from
+    `start` on that `owners` assigns to `shard`. An entry is only sent
+    once the previous entry of its URL completed - later repeats are held
+    back, in trace order, meanwhile - so repeats of a URL never overlap
+    and hit in the order of the trace. The worker runs at most
+    SHARD_WINDOW entries past its oldest unfinished one.
+
+    Sends lists of (trace position, outcome) to the parent, one for every
+    entry replayed, followed by None once the shard is done.
+    """
+    # Workers get their own config copy and connection pools - sockets
+    # inherited from the parent must not be shared
+    MyConfig().config_mapping = config_mapping
+    close_sessions(all_proxies=True)
+    concurrency = max(concurrency, 1)
+
+    batch = []
+    pending: Dict = {}
+    # URLs with an entry in flight, and their entries held back behind it
+    held: Dict[str, deque] = {}
+    # Positions not reported yet, in trace order, and those finished out of turn
+    unfinished = deque()
+    finished = set()
+    exhausted = False
+
+    try:
+        with TraceFile(path) as trace, ThreadPoolExecutor(max_workers=concurrency) as executor:
+            shard_iter = _shard_entries(trace, owners, shard, start)
+
+            while True:
+                while (not exhausted and len(pending) < concurrency
+                       and len(unfinished) < SHARD_WINDOW):
+                    entry = None if stop.is_set() else next(shard_iter, None)
+                    if entry is None:
+                        exhausted = True
+                        break
+
+                    pos, url = entry
+                    unfinished.append(pos)
+                    if url in held:
+                        held[url].append(entry)
+                    else:
+                        held[url] = deque()
+                        pending[executor.submit(_fetch_entry, *entry)] = entry
+
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    pos, url = pending.pop(future)
+                    batch.append((pos, future.result()))
+
+                    finished.add(pos)
+                    while unfinished and unfinished[0] in finished:
+                        finished.remove(unfinished.popleft())
+
+                    # The next repeat of the URL can go now
+                    if held[url] and not stop.is_set():
+                        entry = held[url].popleft()
+                        pending[executor.submit(_fetch_entry, *entry)] = entry
+                    else:
+                        del held[url]
+
+                if len(batch) >= SHARD_BATCH_SIZE:
+                    results.put(batch)
+                    batch = []
+    except KeyboardInterrupt:
+        # The parent handles Ctrl-C - just report what was measured
+        pass
+    finally:
+        results.put(batch)
+        results.put(None)
+
+
+def _stop_workers(processes: List[multiprocessing.Process],
+                  queues: List[multiprocessing.Queue], timeout: float = 5):
+    """Wait for the shard workers to exit, terminating the ones that don't."""
+    deadline = time.monotonic() + timeout
+    for process, results in zip(processes, queues):
+        while process.is_alive() and time.monotonic() < deadline:
+            # A worker blocked on its full queue exits once it is drained
+            try:
+                while True:
+                    results.get_nowait()
+            except queue.Empty:
+                pass
+            process.join(timeout=0.1)
+
+        if process.is_alive():
+            process.terminate()
+
+
+def replay_sharded(trace: TraceFile,
+                   record: Callable[[Outcome], None],
+                   limit: int = 0,
+                   workers: int = 4,
+                   concurrency: int = 8,
+                   start: int = 0) -> int:
+    """Replay a trace file across several worker processes.
+
+    Entries are split by URL hash, so every repeat of a URL is replayed by
+    the same worker, one at a time and in trace order, keeping hit/miss
+    behavior meaningful. Workers map the trace file themselves and read
+    their own entries from it, so the trace is never copied to them. Each
+    worker runs `concurrency` requests in flight with its own connection
+    pools. The parent merges the results back into trace order before
+    recording them, so Requests rows come out in the same order whatever
+    the number of workers, and the limit counts the first successful
+    requests in trace order.
+
+    The parent reads results only from the worker that owns the next
+    entry in trace order, and each worker's queue is bounded, so a worker
+    that runs ahead blocks instead of piling results up in the parent.
+
+    Args:
+        trace: The trace's memory-mapped entries
+        record: Called with the outcome of every entry, in trace order
+        limit: Stop after this many successful requests (0 = no limit)
+        workers: Number of worker processes
+        concurrency: Requests in flight in each worker
+        start: Trace position to start from, when resuming a run
+
+    Returns:
+        int: Number of successful requests
+    """
+    owners = _shard_owners(trace, workers)
+    url_ids = trace.slice(start)
+
+    queues = [multiprocessing.Queue(maxsize=SHARD_QUEUE_BATCHES) for _ in range(workers)]
+    stop = multiprocessing.Event()
+    config_mapping = dict(MyConfig().config_mapping or {})
+    processes = [
+        multiprocessing.Process(
+            target=_shard_worker,
+            args=(trace.path, start, owners, shard, config_mapping, concurrency,
+                  queues[shard], stop),
+            daemon=True)
+        for shard in range(workers)]
+
+    for process in processes:
+        process.start()
+
+    # Results arrive out of order - hold them until their turn comes
+    index = 0
+    waiting: Dict[int, Outcome] = {}
+    successfully_get = 0
+
+    try:
+        while index < len(url_ids) and not (limit and successfully_get >= limit):
+            pos = start + index
+
+            if pos not in waiting:
+                owner = owners[url_ids[index]]
+                try:
+                    batch = queues[owner].get(timeout=1)
+                except queue.Empty:
+                    if not processes[owner].is_alive():
+                        print("Replay workers exited unexpectedly")
+                        break
+                    continue
+
+                if batch is None:
+                    # The worker stopped before reaching the entry
+                    break
+
+                waiting.update(batch)
+                continue
+
+            result = waiting.pop(pos)
+            index += 1
+
+            record(result)
+            if isinstance(result, RequestResult):
+                successfully_get += 1
+    finally:
+        stop.set()
+        _stop_workers(processes, queues)
+
+    return successfully_get
+
+
+def replay_retries(deferred: List[RequestFailure],
+                   record: Callable[[Outcome], None],
+                   limit: int = 0,
+                   concurrency: int = 8,
+                   policy: Optional[RetryPolicy] = None) -> int:
+    """Retry deferred entries in rounds, once the main replay is over.
+
+    `record` is expected to append failures that should be tried again to
+    `deferred`, which is drained round by round. Each round waits for the
+    policy backoff, and for the circuits of its entries to close.
+
+    Args:
+        deferred: Failures to retry, refilled by `record`
+        record: Called with the outcome of every retried entry
+        limit: Stop after this many successful requests (0 = no limit)
+        concurrency: Maximum number of requests in flight
+        policy: Backoff between rounds (defaults to the config's)
+
+    Returns:
+        int: Number of successful requests
+    """
+    policy = policy or RetryPolicy.from_config()
+    breaker = get_breaker()
+    successfully_get = 0
+
+    while deferred and not (limit and successfully_get >= limit):
+        batch = list(deferred)
+        deferred.clear()
+
+        attempt = min(failure.attempts for failure in batch) + 1
+        reopen = min(max(breaker.reopens_in(key) for key in breaker_keys(failure.url))
+                     for failure in batch)
+        delay = max(policy.backoff(attempt), reopen)
+
+        print(f"Retrying {len(batch)} deferred requests in {delay:.1f}s")
+        time.sleep(delay)
+
+        successfully_get += replay_concurrent(
+            ((failure.trace_pos, failure.url, failure.attempts + 1) for failure in batch),
+            record,
+            limit - successfully_get if limit else 0,
+            concurrency)
+
+    return successfully_get
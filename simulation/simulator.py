@@ -1,15 +1,34 @@
 """Simulation orchestration for running traces."""
+import json
+import math
+import signal
 import sqlite3
 from datetime import datetime
+from itertools import chain, islice
 from zoneinfo import ZoneInfo
 from prettytable import PrettyTable
-from typing import Tuple, Optional
+from typing import Dict, List, Optional, Sequence, Tuple
 
 from config.config import MyConfig
 from database.db_access import DBAccess
 from cache.cache_manager import is_squid_up
-from http_requests.request_executor import execute_req
+from database.result_writer import ResultWriter
+from database.storage import Statement
+from database.trace_file import TraceFile, get_trace_file
+from http_requests.request_executor import INSERT_REQUEST, request_row
+from http_requests.resilience import (
+    INSERT_FAILURE, RequestFailure, RetryPolicy, failure_row
+)
+from metrics.histogram import RunLatency
+from simulation.replay import (
+    SCHEDULES, build_schedule, replay_concurrent, replay_open_loop, replay_retries,
+    replay_sharded
+)
 from ui.display import show_runs
+from ui.repository import UIRepository
+
+# Open-loop rate when replay_rps is missing or invalid
+DEFAULT_RPS = 10
 
 
 def _get_run_details() -> Optional[Tuple[str, int, int]]:
@@ -24,23 +43,15 @@ def _get_run_details() -> Optional[Tuple[str, int, int]]:
         return None
     
     # Fetch all rows from the "Traces" table, with their keys count
-    DBAccess.cursor.execute("""SELECT T.id ID, T.Name Name, 
-                            COUNT(K.id) Keys, T.Last_Update Last_Update 
-                    FROM Traces T, Trace_Entry K
-                    WHERE T.id = K.Trace_ID
-                    GROUP BY T.id""")
-    rows = DBAccess.cursor.fetchall()
+    rows = UIRepository.get_all_traces()
     
     if not rows:
         print("No traces found in the database. Please create a trace first.")
         return None
     
-    # Fetch column names for the table
-    column_names = [description[0] for description in DBAccess.cursor.description]
-    
     # Display the data in a table format using PrettyTable
     table = PrettyTable()
-    table.field_names = column_names
+    table.field_names = ['ID', 'Name', 'Keys', 'Last_Update']
     
     for row in rows:
         table.add_row(row)
@@ -70,20 +81,46 @@ def _get_run_details() -> Optional[Tuple[str, int, int]]:
     return (name, trace_id, limit)
 
 
-def _create_run_entry(name: str, trace_id: int) -> Optional[int]:
+def _point_caches(params: Optional[dict] = None) -> Dict[str, dict]:
+    """Registered caches, with access costs overridden by sweep parameters.
+
+    `access_cost` sets the cost of every parent, `access_cost_<name>` the
+    cost of a single one.
+    """
+    caches = {}
+
+    for name, details in (MyConfig().get_key('caches') or {}).items():
+        details = dict(details)
+        if params:
+            cost = params.get(f'access_cost_{name}', params.get('access_cost'))
+            if cost is not None:
+                details['access_cost'] = cost
+        caches[name] = details
+
+    return caches
+
+
+def _create_run_entry(name: str, trace_id: int, engine: str = 'live',
+                      params: Optional[dict] = None,
+                      sweep_id: Optional[int] = None) -> Optional[int]:
     """Create a new run entry in the Runs table.
     
     Args:
         name: Name of the run
         trace_id: ID of the trace to run
+        engine: 'live' for a replay through Squid, 'offline' for a simulated run
+        params: Sweep parameters of the run, overriding salsa2_v, miss_penalty
+            and the access costs of the configuration
+        sweep_id: ID of the sweep the run is a point of
         
     Returns:
         run_id if successful, None otherwise.
     """
     jerusalem_time = datetime.now(ZoneInfo("Asia/Jerusalem"))
     config = MyConfig()
-    salsa2_v = config.get_key('salsa2_v')
-    miss_penalty = config.get_key('miss_penalty')
+    params = params or {}
+    salsa2_v = params.get('salsa2_v', config.get_key('salsa2_v'))
+    miss_penalty = params.get('miss_penalty', config.get_key('miss_penalty'))
 
     try:
         # Create entry for the run, for generate and gets run id 
@@ -97,9 +134,13 @@ def _create_run_entry(name: str, trace_id: int) -> Optional[int]:
                 'Trace_ID',
                 'salsa_v',
                 'miss_penalty',
-                'Total_Cost')
-                VALUES(?,?,?,?,?,?,0)""", 
-                [name, jerusalem_time, jerusalem_time, trace_id, salsa2_v,miss_penalty])
+                'Total_Cost',
+                'Engine',
+                'Sweep_ID',
+                'Params')
+                VALUES(?,?,?,?,?,?,0,?,?,?)""", 
+                [name, jerusalem_time, jerusalem_time, trace_id, salsa2_v,miss_penalty, engine,
+                 sweep_id, json.dumps(params, sort_keys=True) if params else None])
         
         # Get current run id
         DBAccess.cursor.execute("SELECT MAX(id) from Runs")
@@ -110,7 +151,7 @@ def _create_run_entry(name: str, trace_id: int) -> Optional[int]:
             return None
         
         run_id = row[0]
-        caches = config.get_key('caches')
+        caches = _point_caches(params)
 
         # Update Caches table for current run
         for name, details in caches.items():
@@ -121,7 +162,8 @@ def _create_run_entry(name: str, trace_id: int) -> Optional[int]:
                     """INSERT INTO Caches('Run_ID', 'Name', 'Access_Cost')
                         VALUES(?,?,?)""", [run_id, name, cost])
         
-        # Insert cahces data for current run
+        # Committed before the run's rows go through the writer
+        DBAccess.conn.commit()
         return run_id
         
     except sqlite3.DatabaseError as e:
@@ -129,62 +171,261 @@ def _create_run_entry(name: str, trace_id: int) -> Optional[int]:
         return None
 
 
-def _update_run(run_id: int):
-    """Update the end time for a completed run.
+def _update_run(run_id: int, writers: Sequence[ResultWriter] = (),
+                latency: Optional[RunLatency] = None, status: str = 'done',
+                position: Optional[int] = None):
+    """Update the end time and status of a finished or interrupted run.
     
     Args:
         run_id: ID of the run to update
+        writers: Buffered rows of the run, flushed before the update
+        latency: Latency histograms of the run, saved with the update
+        status: 'done', or 'interrupted' for a run that can be resumed
+        position: Trace position every earlier entry was recorded up to
     """
+    for writer in writers:
+        writer.flush(wait=False)
+
+    statements = latency.statements(run_id) if latency else []
+
     jerusalem_time = datetime.now(ZoneInfo("Asia/Jerusalem"))
 
-    # Update run entry with end time
-    DBAccess.cursor.execute("""UPDATE Runs
-    SET End_Time = ?
-    WHERE id = ?""", [jerusalem_time, run_id])
+    # Update run entry with end time, after all of the run's rows
+    statements.append(Statement("""UPDATE Runs
+    SET End_Time = ?, Status = ?, Trace_Pos = COALESCE(?, Trace_Pos)
+    WHERE id = ?""", [jerusalem_time, status, position, run_id]))
+
+    DBAccess.write(statements)
+
+
+class _Progress:
+    """Contiguous replay frontier of a run.
+
+    Entries complete out of order when several are in flight, so the
+    checkpoint is the first trace position not recorded yet - every entry
+    before it is stored (or deferred for a retry).
+    """
+
+    def __init__(self, start: int = 0):
+        self.position = start
+        self._ahead = set()
+
+    def mark(self, pos: int):
+        if pos < self.position:
+            return
+
+        self._ahead.add(pos)
+        while self.position in self._ahead:
+            self._ahead.remove(self.position)
+            self.position += 1
+
+
+def _load_checkpoint(run_id: int, latency: RunLatency) -> Tuple[int, int]:
+    """Prepare an interrupted run for resuming.
+
+    Rows recorded past the checkpoint are dropped, since those entries are
+    replayed again, and the latency histograms are rebuilt from the rows
+    that are kept.
+
+    Returns:
+        (checkpoint, recorded): Trace position to resume from, and the
+        number of successful requests already recorded
+    """
+    DBAccess.cursor.execute("SELECT COALESCE(Trace_Pos, 0) FROM Runs WHERE id = ?", [run_id])
+    checkpoint = DBAccess.cursor.fetchone()[0]
+
+    DBAccess.write([
+        Statement("DELETE FROM Requests WHERE Run_ID = ? AND Trace_Pos >= ?",
+                  [run_id, checkpoint]),
+        Statement("DELETE FROM Request_Failures WHERE Run_ID = ? AND Trace_Pos >= ?",
+                  [run_id, checkpoint])])
+
+    DBAccess.cursor.execute("""SELECT hit, elapsed_ms, attempts
+                            FROM Requests
+                            WHERE Run_ID = ?""", [run_id])
+    recorded = 0
+    for hit, elapsed_ms, attempts in DBAccess.cursor.fetchall():
+        recorded += 1
+        if (attempts or 1) == 1 and elapsed_ms is not None:
+            latency.add(hit, elapsed_ms)
+
+    return checkpoint, recorded
+
+
+def _replay(trace: TraceFile, record, limit: int, start: int = 0) -> int:
+    """Replay the trace with the engine selected in the config.
+
+    `replay_mode='open'` sends entries on the `replay_schedule` schedule
+    ('fixed' or 'poisson' at `replay_rps`, or the trace's 'recorded'
+    arrival times). `replay_mode='process'` splits the trace across
+    `replay_workers` processes. Otherwise requests are replayed
+    closed-loop, serially or with up to `replay_concurrency` requests in
+    flight.
+
+    Args:
+        trace: The trace's memory-mapped entries and arrival times,
+            streamed in replay order
+        record: Called with the outcome of every entry
+        limit: Maximum number of requests to execute (0 = no limit)
+        start: Trace position to start from, when resuming a run
+
+    Returns:
+        int: Number of successful requests
+    """
+    config = MyConfig()
+    concurrency = config.get_int('replay_concurrency', 1)
+    mode = config.get_key('replay_mode')
+
+    if mode == 'process':
+        workers = max(config.get_int('replay_workers', 4), 1)
+        print(f"Sharded replay: {workers} processes x {concurrency} requests in flight")
+        return replay_sharded(trace, record, limit, workers, concurrency, start)
+
+    if mode != 'open':
+        return replay_concurrent(trace.positions(start), record, limit, concurrency)
+
+    kind = config.get_key('replay_schedule') or 'fixed'
+    if kind not in SCHEDULES:
+        print(f"Unknown replay_schedule '{kind}', using 'fixed'")
+        kind = 'fixed'
+
+    value = config.get_key('replay_rps') or DEFAULT_RPS
+    try:
+        rps = float(value)
+    except ValueError:
+        rps = 0.0
+    # Also rejects nan and inf
+    if not 0 < rps < math.inf:
+        print(f"Invalid replay_rps '{value}', using {DEFAULT_RPS} requests/sec")
+        rps = float(DEFAULT_RPS)
+
+    seed = config.get_key('replay_seed')
+    try:
+        seed = int(seed) if seed else None
+    except ValueError:
+        print(f"Invalid replay_seed '{seed}', using an unseeded schedule")
+        seed = None
 
-    DBAccess.conn.commit()
+    schedule = build_schedule(kind, rps, len(trace), trace.arrivals, seed)
+    print(f"Open-loop replay: {kind} schedule" +
+          ("" if kind == 'recorded' else f" at {rps} requests/sec"))
 
-def _remove_url(url): pass
-    # DBAccess.cursor.execute("DELETE FROM Trace_Entry WHERE URL = ?",[url])
-    # print(f"Remove: {url}")
+    # A resumed run keeps the schedule's spacing, starting right away
+    offsets = islice(schedule, start, None)
+    first = next(offsets, 0.0)
+    entries = ((pos, url, offset - first)
+               for (pos, url), offset in zip(trace.positions(start), chain([first], offsets)))
+    return replay_open_loop(entries, record, limit, max(concurrency, 1))
 
 
-def _execute_requests(run_id: int, trace_id: int, limit: int) -> bool:
+def _execute_requests(run_id: int, trace_id: int, limit: int, resume: bool = False) -> bool:
     """Execute all requests for the trace.
     
+    Entries that fail in a retryable way, or whose circuit is open, are
+    deferred and retried in rounds after the main replay. Failures that
+    are final are stored in Request_Failures, outside the run's latency
+    statistics, and so are requests that only succeeded on a retry.
+    
+    The run's checkpoint (Runs.Trace_Pos) is committed together with every
+    batch of rows. On Ctrl-C or SIGTERM the rows are flushed, deferred
+    entries are stored as failures and the run is marked 'interrupted',
+    so resume_run can continue it from the checkpoint.
+    
     Args:
         run_id: ID of the current run
         trace_id: ID of the trace to execute
         limit: Maximum number of requests to execute (0 = no limit)
+        resume: Continue the run from its checkpoint
         
     Returns:
         True if successful, False otherwise.
     """
+    trace = None
     try:
-        # Get all trace's URLs
-        DBAccess.cursor.execute("SELECT URL FROM Trace_Entry WHERE Trace_ID = ?", [trace_id])
-        rows = DBAccess.cursor.fetchall()
-        successfully_get = 0
-        total = limit if limit else len(rows)
-
-        # Run on all trace URLs
-        for (url,) in rows:
-            # If requests succeed and there is limit,
-            # decrease limit and check if reach it
-            if execute_req(url, run_id):
-                successfully_get += 1
-                print(f"Get ({successfully_get}/{total})")
-                
-                if successfully_get == limit: break
-            else:
-                _remove_url(url)
-
-        _update_run(run_id)
+        # Trace's URLs, streamed from its memory-mapped trace file
+        trace = get_trace_file(trace_id)
+        total = limit if limit else len(trace)
+        latency = RunLatency()
+        start, recorded = 0, 0
+
+        if resume:
+            start, recorded = _load_checkpoint(run_id, latency)
+            print(f"Resuming run {run_id} at trace position {start}")
+        else:
+            DBAccess.write([Statement("""UPDATE Runs
+                SET Status = 'running', Trace_Pos = 0, Request_Limit = ?
+                WHERE id = ?""", [limit, run_id])])
+
+        progress = _Progress(start)
+        failures = ResultWriter(INSERT_FAILURE)
+        policy = RetryPolicy.from_config()
+        deferred: List[RequestFailure] = []
+
+        def checkpoint():
+            # Failures before the checkpoint must be stored along with it
+            statements = []
+            if failures.rows:
+                statements.append(Statement(failures.sql, failures.rows, True))
+                failures.rows = []
+            statements.append(Statement("UPDATE Runs SET Trace_Pos = ? WHERE id = ?",
+                                        [progress.position, run_id]))
+            return statements
+
+        writer = ResultWriter(INSERT_REQUEST, checkpoint=checkpoint)
+
+        def record(outcome):
+            nonlocal recorded
+
+            if isinstance(outcome, RequestFailure):
+                if policy.should_retry(outcome):
+                    deferred.append(outcome)
+                else:
+                    failures.add(failure_row(outcome, run_id))
+                progress.mark(outcome.trace_pos)
+                return
+
+            progress.mark(outcome.trace_pos)
+            writer.add(request_row(outcome, run_id))
+            if outcome.attempts == 1:
+                latency.add(outcome.hit, outcome.elapsed_ms)
+            recorded += 1
+            print(f"Get ({recorded}/{total})")
+
+        def terminate(signum, frame):
+            raise KeyboardInterrupt
+
+        previous_handler = signal.signal(signal.SIGTERM, terminate)
+        try:
+            if not (limit and recorded >= limit):
+                _replay(trace, record, limit - recorded if limit else 0, start)
+
+            if deferred and not (limit and recorded >= limit):
+                replay_retries(deferred, record, limit - recorded if limit else 0,
+                               MyConfig().get_int('replay_concurrency', 1), policy)
+        except KeyboardInterrupt:
+            # Keep what was already measured, and what still awaited a retry
+            print(f"\nTrace interrupted after {recorded} requests")
+            for failure in deferred:
+                failures.add(failure_row(failure, run_id))
+            _update_run(run_id, (writer, failures), latency, 'interrupted', progress.position)
+            print(f"Run {run_id} can be resumed from trace position {progress.position}")
+            return False
+        finally:
+            signal.signal(signal.SIGTERM, previous_handler)
+
+        # Reaching the limit leaves deferred entries without a retry, but the
+        # checkpoint is already past them
+        for failure in deferred:
+            failures.add(failure_row(failure, run_id))
+        _update_run(run_id, (writer, failures), latency, 'done', progress.position)
         return True
         
-    except sqlite3.DatabaseError as e:
+    except (sqlite3.DatabaseError, OSError) as e:
         print(f"Failed to execute requests: {e}")
         return False
+    finally:
+        if trace is not None:
+            trace.close()
 
 def _print_results(run_id: int):
     """Print the results of the run.
@@ -231,3 +472,53 @@ def run_trace():
         
     except sqlite3.DatabaseError as e:
         print(f"Trace failed: {e}")
+
+
+def resume_run():
+    """Continue an interrupted live run from its last checkpoint, under the same run ID."""
+    DBAccess.cursor.execute("""SELECT R.id, R.Name, R.Trace_ID, T.Name, R.Status,
+                            COALESCE(R.Trace_Pos, 0), COALESCE(R.Request_Limit, 0)
+                            FROM Runs R
+                            JOIN Traces T ON T.id = R.Trace_ID
+                            WHERE COALESCE(R.Engine, 'live') = 'live'
+                            AND R.Status IN ('running', 'interrupted')
+                            ORDER BY R.id""")
+    runs = DBAccess.cursor.fetchall()
+
+    if not runs:
+        print("No interrupted runs to resume")
+        return
+
+    table = PrettyTable()
+    table.field_names = ['ID', 'Name', 'Trace', 'Status', 'Position', 'Limit']
+    for run_id, name, _, trace_name, status, position, limit in runs:
+        table.add_row([run_id, name, trace_name, status, position, limit or '-'])
+    print(table)
+
+    try:
+        run_id = int(input("Insert run ID to resume: "))
+    except ValueError:
+        print("Error: Invalid run ID. Please enter a number.")
+        return
+
+    run = next((run for run in runs if run[0] == run_id), None)
+    if not run:
+        print(f"Error: Run {run_id} cannot be resumed.")
+        return
+
+    # Check if squid works properly on all servers
+    if not is_squid_up():
+        print("Error: Squid Down")
+        return
+
+    _, _, trace_id, _, _, _, limit = run
+
+    try:
+        if not _execute_requests(run_id, trace_id, limit, resume=True):
+            print(f"Trace failed")
+            return
+
+        _print_results(run_id)
+
+    except sqlite3.DatabaseError as e:
+        print(f"Trace failed: {e}")
@@ -0,0 +1,405 @@
+"""Parameter sweeps for Salsa2 Simulator.
+
+A sweep runs every combination of a parameter grid over one or more
+traces, each point as its own run tagged with `Runs.Sweep_ID` and its
+parameters in `Runs.Params` (JSON), so results can be pivoted afterwards.
+
+Offline sweeps simulate the points in a process pool of `sweep_workers`
+processes - every worker maps the traces' files once, at start-up. Live
+sweeps run the points one after another through the Squid hierarchy,
+rewriting the local squid.conf, reconfiguring Squid and resetting the
+parent caches before each point.
+"""
+import itertools
+import json
+import math
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Sequence
+from zoneinfo import ZoneInfo
+
+from prettytable import PrettyTable
+
+from config.config import MyConfig
+from database.db_access import DBAccess
+from database.trace_file import TraceFile
+from simulation.offline import (
+    POLICIES, OfflineResult, config_policy, load_trace, parents_from_registry, simulate,
+    store_offline_run
+)
+from simulation.simulator import _create_run_entry, _execute_requests, _point_caches
+
+# Parameters a grid may vary, besides access_cost_<name> for a single parent
+SWEEP_PARAMS = ('miss_penalty', 'access_cost', 'salsa2_v',
+                'offline_capacity', 'offline_policy')
+OFFLINE_ONLY = ('offline_capacity', 'offline_policy')
+# Parameters whose values must be whole numbers - all others but
+# offline_policy take any number
+INTEGER_PARAMS = ('salsa2_v', 'offline_capacity')
+# The offline model has no Salsa2 - a grid over it would only repeat points
+LIVE_ONLY = ('salsa2_v',)
+ENGINES = ('offline', 'live')
+
+
+class SweepPoint(NamedTuple):
+    """One run of a sweep: a trace and the parameters to run it with."""
+    trace_id: int
+    params: Dict[str, object]
+
+
+def _value(text: str):
+    """Grid values are numbers where they parse as one."""
+    for kind in (int, float):
+        try:
+            return kind(text)
+        except ValueError:
+            pass
+    return text
+
+
+def _check_value(key: str, value):
+    """Raise ValueError unless a grid value fits its parameter."""
+    if key == 'offline_policy':
+        if value not in POLICIES:
+            raise ValueError(f"offline_policy must be one of {', '.join(POLICIES)}, "
+                             f"got '{value}'")
+    elif key in INTEGER_PARAMS:
+        if not isinstance(value, int) or value < 0:
+            raise ValueError(f"{key} must be a whole number, got '{value}'")
+    elif not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f"{key} must be a number, got '{value}'")
+
+
+def parse_grid(text: str) -> Dict[str, List[object]]:
+    """Parse a grid like "miss_penalty=5,10,20; access_cost=1,2".
+
+    Raises:
+        ValueError: If a parameter is unknown, has no values or a value
+            that does not fit it
+    """
+    grid = {}
+
+    for part in text.split(';'):
+        if not part.strip():
+            continue
+        if '=' not in part:
+            raise ValueError(f"Expected <parameter>=<values>, got '{part.strip()}'")
+
+        key, values = part.split('=', 1)
+        key = key.strip()
+        if key not in SWEEP_PARAMS and not key.startswith('access_cost_'):
+            raise ValueError(f"Unknown sweep parameter '{key}'")
+
+        grid[key] = [_value(value.strip()) for value in values.split(',') if value.strip()]
+        if not grid[key]:
+            raise ValueError(f"No values for '{key}'")
+        if key == 'offline_policy':
+            grid[key] = [str(value).lower() for value in grid[key]]
+        for value in grid[key]:
+            _check_value(key, value)
+
+    return grid
+
+
+def expand_grid(grid: Dict[str, List[object]], trace_ids: Sequence[int]) -> List[SweepPoint]:
+    """Every combination of the grid's values, for every trace."""
+    keys = list(grid)
+    combos = [dict(zip(keys, values))
+              for values in itertools.product(*(grid[key] for key in keys))]
+
+    return [SweepPoint(trace_id, params) for trace_id in trace_ids for params in combos]
+
+
+def _create_sweep(name: str, engine: str, trace_ids: Sequence[int],
+                  grid: Dict[str, List[object]]) -> Optional[int]:
+    try:
+        DBAccess.cursor.execute(
+            """INSERT INTO Sweeps('Name', 'Start_Time', 'Engine', 'Trace_IDs', 'Grid')
+                VALUES(?,?,?,?,?)""",
+            [name, datetime.now(ZoneInfo("Asia/Jerusalem")), engine,
+             json.dumps(list(trace_ids)), json.dumps(grid)])
+        DBAccess.conn.commit()
+        return DBAccess.cursor.lastrowid
+
+    except sqlite3.DatabaseError as e:
+        print(f"Failed to create sweep: {e}")
+        return None
+
+
+def _finish_sweep(sweep_id: int):
+    DBAccess.cursor.execute("UPDATE Sweeps SET End_Time = ? WHERE id = ?",
+                            [datetime.now(ZoneInfo("Asia/Jerusalem")), sweep_id])
+    DBAccess.conn.commit()
+
+
+# URL IDs of the traces of an offline sweep, mapped once in every pool worker
+_traces: Dict[int, Sequence[int]] = {}
+
+
+def _init_worker(paths: Dict[int, str], limit: int):
+    global _traces
+    _traces = {trace_id: TraceFile(path).slice(0, limit or None)
+               for trace_id, path in paths.items()}
+
+
+def _simulate_point(trace_id: int, parents, miss_penalty: float,
+                    policy: str) -> OfflineResult:
+    return simulate(_traces[trace_id], parents, miss_penalty, policy)
+
+
+def run_offline_sweep(sweep_id: int, name: str, points: Sequence[SweepPoint],
+                      limit: int = 0) -> int:
+    """Simulate the sweep's points in a process pool and store each as a run.
+
+    Args:
+        sweep_id: ID of the sweep
+        name: Sweep name, the prefix of its run names
+        points: Points to run
+        limit: Maximum number of requests per trace (0 = no limit)
+
+    Returns:
+        int: Number of runs stored
+    """
+    config = MyConfig()
+    workers = max(config.get_int('sweep_workers', os.cpu_count() or 1), 1)
+    store_requests = config.get_key('offline_store_requests') != '0'
+
+    try:
+        default_penalty = float(config.get_key('miss_penalty') or 0)
+    except (TypeError, ValueError):
+        default_penalty = 0.0
+
+    # Workers map the trace files themselves - the IDs are never copied
+    traces = {trace_id: load_trace(trace_id, limit)
+              for trace_id in sorted({point.trace_id for point in points})}
+    paths = {trace_id: trace.path for trace_id, (trace, _) in traces.items()}
+
+    print(f"Simulating {len(points)} points in {workers} processes...")
+    stored = 0
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(paths, limit)) as executor:
+            pending = {}
+            for index, point in enumerate(points):
+                parents = parents_from_registry(point.params.get('offline_capacity'),
+                                                _point_caches(point.params))
+                future = executor.submit(_simulate_point,
+                                         point.trace_id,
+                                         parents,
+                                         float(point.params.get('miss_penalty', default_penalty)),
+                                         config_policy(point.params.get('offline_policy')))
+                pending[future] = index
+
+            # Runs are written by this process only, as points complete
+            for future in as_completed(pending):
+                index = pending[future]
+                point = points[index]
+                result = future.result()
+
+                run_id = _create_run_entry(f"{name} {index + 1}/{len(points)}",
+                                           point.trace_id, engine='offline',
+                                           params=point.params, sweep_id=sweep_id)
+                if not run_id:
+                    continue
+
+                trace, url_ids = traces[point.trace_id]
+                store_offline_run(run_id, trace.urls(0, len(url_ids)), result, store_requests)
+                stored += 1
+                print(f"Point ({stored}/{len(points)}) stored as run {run_id}")
+    finally:
+        for trace, _ in traces.values():
+            trace.close()
+
+    return stored
+
+
+def run_live_sweep(sweep_id: int, name: str, points: Sequence[SweepPoint],
+                   limit: int = 0) -> int:
+    """Replay the sweep's points one by one through the Squid hierarchy.
+
+    Before each point the local squid.conf is rewritten with the point's
+    parameters, Squid is reconfigured and all parent caches are reset. The
+    original squid.conf is restored when the sweep ends or fails.
+
+    Args:
+        sweep_id: ID of the sweep
+        name: Sweep name, the prefix of its run names
+        points: Points to run
+        limit: Maximum number of requests per run (0 = no limit)
+
+    Returns:
+        int: Number of runs completed
+    """
+    # Import here to avoid circular dependency
+    from cache.cache_manager import (
+        is_squid_up, reconfigure_squid, reset_all_caches, restore_squid_conf,
+        write_squid_conf
+    )
+    from http_requests.session_pool import close_sessions
+
+    original = None
+    completed = 0
+
+    try:
+        for index, point in enumerate(points):
+            progress = f"[{index + 1}/{len(points)}]"
+            print(f"{progress} {json.dumps(point.params)} on trace {point.trace_id}")
+
+            previous = write_squid_conf(point.params)
+            if original is None:
+                original = previous
+
+            if not reconfigure_squid():
+                break
+
+            results = reset_all_caches()
+            if any(status != 'ok' for _, _, status in results):
+                print(f"{progress} Cache reset failed, stopping the sweep")
+                break
+
+            # The child's connections did not survive the reconfigure
+            close_sessions()
+            if not is_squid_up():
+                print(f"{progress} Squid down, stopping the sweep")
+                break
+
+            run_id = _create_run_entry(f"{name} {index + 1}/{len(points)}",
+                                       point.trace_id, params=point.params,
+                                       sweep_id=sweep_id)
+            if not run_id or not _execute_requests(run_id, point.trace_id, limit):
+                print(f"{progress} Run failed, stopping the sweep")
+                break
+
+            completed += 1
+
+    except OSError as e:
+        print(f"Failed to update squid.conf: {e}")
+
+    finally:
+        if original is not None:
+            print("Restoring squid.conf...")
+            restore_squid_conf(original)
+            reconfigure_squid()
+
+    return completed
+
+
+def show_sweep(sweep_id: int):
+    """Print the runs of a sweep, one row per point."""
+    DBAccess.cursor.execute("""SELECT R.id, R.Trace_ID, R.Params, R.Total_Cost,
+                                   COUNT(REQ.id), SUM(REQ.hit)
+                            FROM Runs R LEFT JOIN Requests REQ ON REQ.Run_ID = R.id
+                            WHERE R.Sweep_ID = ?
+                            GROUP BY R.id
+                            ORDER BY R.id""", [sweep_id])
+    rows = DBAccess.cursor.fetchall()
+
+    if not rows:
+        print("No runs found for this sweep.")
+        return
+
+    params = [json.loads(row[2] or '{}') for row in rows]
+    keys = sorted({key for point in params for key in point})
+
+    table = PrettyTable()
+    table.field_names = ['Run ID', 'Trace', *keys, 'Requests', 'Hits', 'Total cost']
+
+    for (run_id, trace_id, _, total_cost, requests, hits), point in zip(rows, params):
+        table.add_row([run_id, trace_id, *(point.get(key, '') for key in keys),
+                       requests, hits, total_cost])
+
+    print(table)
+
+
+def _get_sweep_details():
+    """Get the sweep name, engine, traces, grid and limit from user input."""
+    name = input("Insert sweep name: ").strip()
+    if not name:
+        print("Error: Sweep name cannot be empty. Please try again.")
+        return None
+
+    engine = input("Engine, offline or live [offline]: ").strip().lower() or 'offline'
+    if engine not in ENGINES:
+        print(f"Error: Unknown engine '{engine}'.")
+        return None
+
+    try:
+        trace_ids = [int(part) for part in
+                     input("Trace IDs (comma separated): ").split(',') if part.strip()]
+    except ValueError:
+        print("Error: Please enter valid numbers for trace IDs.")
+        return None
+
+    DBAccess.cursor.execute("SELECT id FROM Traces")
+    existing = {row[0] for row in DBAccess.cursor.fetchall()}
+    missing = [trace_id for trace_id in trace_ids if trace_id not in existing]
+    if not trace_ids or missing:
+        print(f"Error: Trace IDs not found: {missing or 'none given'}")
+        return None
+
+    try:
+        grid = parse_grid(input(
+            "Parameter grid, e.g. miss_penalty=5,10,20; access_cost=1,2: "))
+    except ValueError as e:
+        print(f"Error: {e}")
+        return None
+
+    if not grid:
+        print("Error: The grid is empty.")
+        return None
+
+    if engine == 'live' and any(key in grid for key in OFFLINE_ONLY):
+        print(f"Error: {', '.join(OFFLINE_ONLY)} only apply to offline sweeps.")
+        return None
+
+    if engine == 'offline' and any(key in grid for key in LIVE_ONLY):
+        print(f"Error: {', '.join(LIVE_ONLY)} only applies to live sweeps.")
+        return None
+
+    try:
+        limit = int(input("Insert limit of requests per run, or 0 to not limit: "))
+    except ValueError:
+        print("Error: Please enter a valid number for limit.")
+        return None
+
+    return name, engine, trace_ids, grid, max(limit, 0)
+
+
+def run_sweep():
+    """Run a parameter sweep chosen by the user and show its results."""
+    details = _get_sweep_details()
+    if not details:
+        return
+
+    name, engine, trace_ids, grid, limit = details
+    points = expand_grid(grid, trace_ids)
+    print(f"{len(points)} points to run")
+
+    if engine == 'live':
+        conf_file = MyConfig().get_key('conf_file')
+        answer = input(f"Live sweeps rewrite {conf_file} and reset all caches "
+                       f"before every point. Continue? (y/n): ")
+        if answer.strip().lower() != 'y':
+            return
+
+    sweep_id = _create_sweep(name, engine, trace_ids, grid)
+    if not sweep_id:
+        return
+
+    try:
+        if engine == 'offline':
+            done = run_offline_sweep(sweep_id, name, points, limit)
+        else:
+            done = run_live_sweep(sweep_id, name, points, limit)
+
+        _finish_sweep(sweep_id)
+        print(f"Sweep {sweep_id}: {done}/{len(points)} points done")
+        show_sweep(sweep_id)
+
+    except KeyboardInterrupt:
+        print(f"\nSweep {sweep_id} interrupted")
+    except sqlite3.DatabaseError as e:
+        print(f"Sweep failed: {e}")
@@ -0,0 +1,54 @@
+"""Tests for the open-loop schedules of simulation/replay.py."""
+import math
+
+import pytest
+
+from simulation.replay import build_schedule
+
+
+@pytest.mark.parametrize('kind', ['fixed', 'poisson'])
+@pytest.mark.parametrize('rps', [0, -5, float('nan')])
+def test_rate_must_be_positive(kind, rps):
+    with pytest.raises(ValueError):
+        build_schedule(kind, rps, 10)
+
+
+def test_fixed_is_evenly_spaced():
+    assert list(build_schedule('fixed', 4, 5)) == [0, 0.25, 0.5, 0.75, 1.0]
+
+
+def test_fractional_rate():
+    assert list(build_schedule('fixed', 0.5, 3)) == [0, 2, 4]
+
+
+def test_poisson_is_reproducible_with_a_seed():
+    first = list(build_schedule('poisson', 100, 1000, seed=42))
+    second = list(build_schedule('poisson', 100, 1000, seed=42))
+
+    assert first == second
+    assert first[0] == 0
+    assert all(a <= b for a, b in zip(first, first[1:]))
+    # 999 gaps averaging 1/100 s
+    assert math.isclose(first[-1], 9.99, rel_tol=0.15)
+
+
+def test_recorded_follows_the_arrival_gaps():
+    arrivals = [100.0, 100.5, 102.0, 101.0, 103.0]
+    # The out-of-order arrival is clamped, not sent earlier
+    assert list(build_schedule('recorded', 0, 5, arrivals)) == [0, 0.5, 2, 2, 3]
+
+
+def test_recorded_stops_at_count():
+    assert list(build_schedule('recorded', 0, 2, [5.0, 6.0, 7.0])) == [0, 1]
+
+
+def test_recorded_without_arrivals_falls_back_to_fixed():
+    assert list(build_schedule('recorded', 2, 3, None)) == [0, 0.5, 1.0]
+
+    with pytest.raises(ValueError):
+        build_schedule('recorded', 0, 3, None)
+
+
+def test_empty_trace():
+    assert list(build_schedule('fixed', 10, 0)) == []
+    assert list(build_schedule('poisson', 10, 0, seed=1)) == []
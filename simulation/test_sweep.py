@@ -0,0 +1,40 @@
+"""Tests for the grid parsing of simulation/sweep.py."""
+import pytest
+
+from simulation.sweep import expand_grid, parse_grid
+
+
+def test_parse_grid():
+    grid = parse_grid("miss_penalty=5, 10.5; access_cost_p1=1,2; "
+                      "offline_capacity=0,100; offline_policy=LRU,lfu; salsa2_v=1,2;")
+
+    assert grid == {'miss_penalty': [5, 10.5], 'access_cost_p1': [1, 2],
+                    'offline_capacity': [0, 100], 'offline_policy': ['lru', 'lfu'],
+                    'salsa2_v': [1, 2]}
+
+
+@pytest.mark.parametrize('text', [
+    'miss_penalty=abc',
+    'access_cost=1,x',
+    'access_cost_p1=nan',
+    'offline_capacity=x',
+    'offline_capacity=1.5',
+    'offline_capacity=-1',
+    'salsa2_v=2.0',
+    'offline_policy=arc',
+    'unknown=1',
+    'miss_penalty=',
+    'miss_penalty',
+])
+def test_parse_grid_rejects(text):
+    with pytest.raises(ValueError):
+        parse_grid(text)
+
+
+def test_expand_grid():
+    points = expand_grid({'miss_penalty': [5, 10], 'access_cost': [1]}, [1, 2])
+
+    assert len(points) == 4
+    assert points[0].trace_id == 1 and points[-1].trace_id == 2
+    assert [point.params for point in points[:2]] == [
+        {'miss_penalty': 5, 'access_cost': 1}, {'miss_penalty': 10, 'access_cost': 1}]
@@ -2,13 +2,89 @@
 from prettytable import PrettyTable
 from ui.repository import UIRepository
 
+# URLs listed by default in a trace's grouped view
+URL_COUNTS_TOP = 20
+
 
 def show_run(run_id: int):
     """Display details of a specific run."""
     if run_id:
+        print_latency(run_id)
+        print_optimal_share(run_id)
         requests = UIRepository.get_run_requests(run_id)
         print_requests(requests)
 
+
+def print_latency(run_id: int):
+    """Display the saved HIT/MISS latency percentiles of a run."""
+    latency = UIRepository.get_run_latency([run_id])
+    if not latency:
+        return
+
+    table = PrettyTable()
+    table.field_names = ['Status', 'Requests', 'p50 (ms)', 'p90 (ms)',
+                         'p99 (ms)', 'p99.9 (ms)', 'Max (ms)']
+
+    for status in ('HIT', 'MISS'):
+        summary = latency.get((run_id, status))
+        if summary:
+            table.add_row([status, *summary])
+
+    print(table)
+
+
+def _percent(value: float, optimal: float) -> str:
+    return f"{100 * value / optimal:.1f}%" if optimal else '-'
+
+
+def print_optimal_share(run_id: int):
+    """Display how close a run came to its trace's optimal baselines.
+
+    Hit ratio is compared as run/optimal and average cost as optimal/run,
+    so 100% means the run matched the baseline. Only 'belady' bounds the
+    run - 'partitioned' is a reference a run can go beyond.
+    """
+    totals = UIRepository.get_run_totals(run_id)
+    if not totals or not totals[1]:
+        return
+
+    trace_id, requests, hits, total_cost = totals
+    baselines = UIRepository.get_trace_optimal(trace_id)
+    if not baselines:
+        return
+
+    hit_ratio = (hits or 0) / requests
+    avg_cost = (total_cost or 0) / requests
+
+    table = PrettyTable()
+    table.field_names = ['Baseline', 'Capacity/parent', 'Miss Cost', 'Optimal hit ratio',
+                         '% of optimal hits', 'Optimal avg cost', '% of optimal cost']
+
+    for variant, capacity, opt_requests, opt_hits, opt_cost, miss_penalty in baselines:
+        opt_ratio = opt_hits / opt_requests if opt_requests else 0
+        opt_avg = opt_cost / opt_requests if opt_requests else 0
+
+        table.add_row([variant,
+                       capacity,
+                       miss_penalty,
+                       f"{opt_ratio:.3f}",
+                       _percent(hit_ratio, opt_ratio),
+                       f"{opt_avg:.3f}",
+                       _percent(opt_avg, avg_cost)])
+
+    print(table)
+    if any(row[0] == 'partitioned' for row in baselines):
+        print("'partitioned' is per-parent MIN with the simulator's placement, "
+              "not a bound - runs can exceed 100% of it")
+
+
+def _format_percentiles(summary) -> str:
+    """Compact 'p50/p90/p99/p99.9/max' cell, or '-' without data."""
+    if not summary:
+        return '-'
+
+    return '/'.join(str(value) for value in summary[1:])
+
 def show_all_runs():
     if show_runs():
         try:
@@ -51,7 +127,8 @@ def display_runs_table(runs):
     Display runs data in a formatted PrettyTable.
     
     Creates and prints a table with run details including ID, name, version,
-    costs, and performance metrics.
+    costs, and performance metrics, with the latency percentiles saved for
+    each run.
     
     Args:
         runs: Iterable of run tuples from the database containing:
@@ -69,7 +146,11 @@ def display_runs_table(runs):
         'Trace',
         'Requests',
         'Avg time (ms)',
-        'Avg size (bytes)']
+        'Avg size (bytes)',
+        'HIT p50/p90/p99/p99.9/max (ms)',
+        'MISS p50/p90/p99/p99.9/max (ms)']
+
+    latency = UIRepository.get_run_latency([run[0] for run in runs])
     
     # Process each run
     for (run_id, 
@@ -97,7 +178,9 @@ def display_runs_table(runs):
                trace_name, 
                requests_count,
                avg_time_int,
-               avg_size_int)
+               avg_size_int,
+               _format_percentiles(latency.get((run_id, 'HIT'))),
+               _format_percentiles(latency.get((run_id, 'MISS'))))
 
         table.add_row(row)
     
@@ -134,16 +217,33 @@ def show_keys(trace_id):
     """
     Fetches and displays URLs associated with a specific Trace ID.
     
+    The grouped view lists the most requested URLs from the trace's
+    profile counts (Trace_URL_Counts), so it never groups the trace's
+    entries again.
+    
     Args:
         trace_id: The ID of the trace to fetch URLs for
     """
     group_by = input("Group by URLs? (y/n)")
-    rows = UIRepository.get_trace_entries(trace_id, group_by_url=group_by.upper() == 'Y')
     
     # Determine column names based on group_by preference
     if group_by.upper() == 'Y':
+        try:
+            top = int(input(f"Show the N most requested URLs, or 0 for all [{URL_COUNTS_TOP}]: ")
+                      or URL_COUNTS_TOP)
+        except ValueError:
+            print("Error: Please enter a valid number.")
+            return
+
+        # Import here to avoid circular dependency
+        from analysis.profile import update_profile
+
+        # Counts of entries added since the last profile are folded in first
+        update_profile(trace_id)
+        rows = UIRepository.get_trace_url_counts(trace_id, max(top, 0))
         column_names = ['URL', 'Count']
     else:
+        rows = UIRepository.get_trace_entries(trace_id)
         column_names = ['URL']
 
     # Display the data in a table format using PrettyTable
@@ -163,15 +263,32 @@ def show_traces():
     Allows the user to view details of a specific trace.
     """
     rows = UIRepository.get_all_traces()
+    stats = UIRepository.get_trace_stats()
     
     # Display the data in a table format using PrettyTable
     table = PrettyTable()
-    table.field_names = ['ID', 'Name', 'Keys', 'Last Update']
+    table.field_names = ['ID', 'Name', 'Keys', 'Distinct', 'One-hit %', 'Zipf alpha',
+                         'Working set', 'Last Update']
     
-    for row in rows:
-        table.add_row(row)
+    stale = False
+    for trace_id, name, keys, last_update in rows:
+        profile = stats.get(trace_id)
+        if profile:
+            entries, distinct, one_hit, alpha, ws_mean, ws_max, changed = profile
+            # Profiles of traces changed since are marked, and refreshed on demand
+            mark = '*' if changed else ''
+            stale = stale or changed
+            table.add_row([trace_id, name, keys, f"{distinct}{mark}",
+                           f"{100 * one_hit / distinct:.1f}" if distinct else '-',
+                           f"{alpha:.2f}" if alpha is not None else '-',
+                           f"{ws_mean:.0f}" if ws_mean is not None else ws_max,
+                           last_update])
+        else:
+            table.add_row([trace_id, name, keys, '-', '-', '-', '-', last_update])
     
     print(table)
+    if stale:
+        print("* Trace changed since it was profiled")
 
     # Get from user trace id to show its content
     try:
@@ -183,13 +300,153 @@ def show_traces():
         print("Error: Please enter a valid number for trace ID.")
         return
 
-    if trace_id:
+    if not trace_id:
+        return
+
+    try:
+        option = int(input("""Choose what to show:
+    1: Trace URLs
+    2: Optimal (Belady) baselines
+    3: Hit-ratio curve
+    4: Trace profile
+    """))
+    except ValueError:
+        print("Error: Please enter a valid option.")
+        return
+
+    if option == 1:
         show_keys(trace_id)
+    elif option == 2:
+        show_optimal(trace_id)
+    elif option == 3:
+        show_mrc(trace_id)
+    elif option == 4:
+        show_profile(trace_id)
+    else:
+        print("Invalid option.")
+
+
+def show_optimal(trace_id: int):
+    """Display the optimal baselines of a trace, and offer to compute them."""
+    baselines = UIRepository.get_trace_optimal(trace_id)
+    if baselines:
+        table = PrettyTable()
+        table.field_names = ['Baseline', 'Capacity/parent', 'Requests', 'Hits',
+                             'Cost', 'Miss Cost']
+        for row in baselines:
+            table.add_row(row)
+        print(table)
+
+    answer = input("Compute optimal (Belady) baselines for this trace? (y/n) ")
+    if answer.strip().upper() != 'Y':
+        return
+
+    try:
+        capacities = [int(part) for part in
+                      input("Capacities in objects per parent (comma separated): ").split(',')
+                      if part.strip()]
+    except ValueError:
+        print("Error: Please enter valid numbers for capacities.")
+        return
+
+    if not capacities or min(capacities) <= 0:
+        print("Error: Capacities must be positive numbers.")
+        return
+
+    # Import here to avoid circular dependency
+    from analysis.optimal import compute_trace_optimal
+
+    compute_trace_optimal(trace_id, capacities)
+
+
+def _format_bytes(size: int) -> str:
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def print_mrc(curve):
+    """Display a miss-ratio curve at every power-of-two cache size."""
+    table = PrettyTable()
+    unit = 'objects' if curve.kind == 'objects' else 'bytes'
+    table.field_names = [f'Cache size ({unit})', 'Miss ratio', 'Hit ratio']
+
+    if not curve.points:
+        print("No URL of the trace is requested twice - every request misses.")
+        return
+
+    # From the power of two below the smallest distance up to the largest
+    largest = curve.points[-1][0]
+    size = 1 << (curve.points[0][0].bit_length() - 1)
+    while True:
+        size = min(size, largest)
+        miss_ratio = curve.miss_ratio(size)
+        table.add_row([size if unit == 'objects' else _format_bytes(size),
+                       f"{miss_ratio:.3f}",
+                       f"{1 - miss_ratio:.3f}"])
+        if size >= largest:
+            break
+        size *= 2
+
+    title = 'Byte-weighted LRU miss-ratio curve' if unit == 'bytes' else 'LRU miss-ratio curve'
+    cold = curve.cold / curve.total if curve.total else 0
+    print(f"{title} - {curve.requests} requests, cold miss ratio {cold:.3f}")
+    print(table)
+
+
+def show_mrc(trace_id: int):
+    """Display the cached hit-ratio curves of a trace, computing them if needed."""
+    # Import here to avoid circular dependency
+    from analysis.mrc import compute_trace_curves, load_curves
+
+    curves = load_curves(trace_id)
+    length = UIRepository.get_trace_length(trace_id)
+
+    if curves and curves[0].requests != length:
+        print("The trace changed since its curves were computed.")
+        curves = []
+
+    if not curves:
+        print("Computing stack distances...")
+        curves = compute_trace_curves(trace_id)
+
+    for curve in curves:
+        print_mrc(curve)
+
+
+def show_profile(trace_id: int):
+    """Display the profile of a trace, updating it with entries added since."""
+    # Import here to avoid circular dependency
+    from analysis.profile import update_profile
+
+    profile = update_profile(trace_id)
+    if profile is None:
+        print("The trace has no entries.")
+        return
+
+    table = PrettyTable()
+    table.field_names = ['Entries', 'Distinct', 'One-hit wonders', 'Zipf alpha',
+                         f'Working set ({profile.window} entries)', 'Max working set']
+    table.add_row([profile.entries, profile.distinct,
+                   f"{profile.one_hit} ({100 * profile.one_hit_fraction:.1f}%)",
+                   f"{profile.alpha:.3f}" if profile.alpha is not None else '-',
+                   f"{profile.ws_mean:.1f}" if profile.ws_mean is not None else '-',
+                   profile.ws_max])
+    print(table)
+
+    table = PrettyTable()
+    table.field_names = ['Rank', 'URL', 'Requests', 'Share %']
+    table.max_width['URL'] = 80
+    for rank, (url, count) in enumerate(profile.top, start=1):
+        table.add_row([rank, url, count, f"{100 * count / profile.entries:.2f}"])
+    print(table)
 
 
 def print_requests(requests: list):
     table = PrettyTable()
-    table.field_names = ['id', 'URL', 'Elapsed (ms)', 'Download Bytes']
+    table.field_names = ['id', 'URL', 'Elapsed (ms)', 'Download Bytes',
+                         'Connect (ms)', 'TTFB (ms)', 'Transfer (ms)', 'Total (ms)']
     table.max_width['URL'] = 80
     
     for request in requests:
@@ -1,9 +1,11 @@
 """Data access layer for UI display functions.
 
 This module handles all database queries for the UI layer,
-following the separation of concerns principle.
+following the separation of concerns principle. Queries run on the
+calling thread's read-only connection, so they see what is committed
+and never wait for, or hold up, the writes of a running trace.
 """
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 from database.db_access import DBAccess
 # cache registry functions are imported locally in methods to avoid name shadowing
 
@@ -21,7 +23,7 @@ class UIRepository:
             List of tuples: (run_id, name, start_time, end_time, salsa_v, miss_penalty, trace_name)
         """
 
-        DBAccess.cursor.execute(f"""
+        cursor = DBAccess.reader().execute(f"""
             SELECT 
                 RUN.id, 
                 RUN.Name, 
@@ -44,7 +46,7 @@ class UIRepository:
             ) caches
             WHERE RUN.id = ? AND REQ.run_id = ?""", [run_id, run_id, run_id])
 
-        return DBAccess.cursor.fetchall()
+        return cursor.fetchall()
     
     @staticmethod
     def get_runs(limit) -> List[Tuple]:
@@ -58,7 +60,9 @@ class UIRepository:
                            cache_count, request_count, total_elapsed_ms, trace_name)
         """
 
-        DBAccess.cursor.execute(f"""
+        # The latest runs are picked first, so only their requests and
+        # caches are aggregated (through covering indexes), not all of them
+        cursor = DBAccess.reader().execute(f"""
             SELECT 
                 RUN.id, 
                 RUN.Name, 
@@ -66,30 +70,87 @@ class UIRepository:
                 RUN.End_Time, 
                 RUN.salsa_v,
                 RUN.miss_penalty, 
-                caches.count,
-                caches.cost,
+                (SELECT COUNT(*) FROM Caches WHERE Run_ID = RUN.id),
+                (SELECT COUNT(DISTINCT Access_Cost) FROM Caches WHERE Run_ID = RUN.id),
                 COUNT(*),
                 AVG(REQ.elapsed_ms),
                 AVG(REQ.download_bytes),
-                T.Name
-            FROM Runs RUN JOIN Traces T ON RUN.Trace_ID = T.id
+                RUN.Trace_Name
+            FROM (
+                SELECT R.*, T.Name Trace_Name
+                FROM Runs R JOIN Traces T ON R.Trace_ID = T.id
+                WHERE EXISTS (SELECT 1 FROM Requests WHERE Run_ID = R.id)
+                ORDER BY R.id DESC
+                LIMIT ?
+            ) RUN
             JOIN Requests REQ ON REQ.run_id = RUN.id
-            LEFT JOIN (
-                SELECT Run_ID, COUNT(*) count, COUNT(DISTINCT Access_Cost) cost
-                FROM Caches
-                GROUP BY Run_ID
-            ) caches ON caches.Run_ID = RUN.id
             GROUP BY RUN.id
-            ORDER BY RUN.id DESC
-            LIMIT ?""", [limit])
+            ORDER BY RUN.id DESC""", [limit])
 
-        result = DBAccess.cursor.fetchall()
+        result = cursor.fetchall()
 
         if result:
             result.reverse()
         
         return result
     
+    @staticmethod
+    def get_run_latency(run_ids: List[int]) -> Dict[Tuple[int, str], Tuple]:
+        """Get saved latency percentiles of runs, per cache status.
+        
+        Args:
+            run_ids: The run IDs
+        
+        Returns:
+            Dict of (run_id, status) -> (count, p50, p90, p99, p999, max)
+        """
+        if not run_ids:
+            return {}
+
+        placeholders = ','.join('?' * len(run_ids))
+        cursor = DBAccess.reader().execute(f"""
+            SELECT Run_ID, Status, Count, p50, p90, p99, p999, Max
+            FROM Run_Latency
+            WHERE Run_ID IN ({placeholders})""", list(run_ids))
+
+        return {(row[0], row[1]): row[2:] for row in cursor.fetchall()}
+    
+    @staticmethod
+    def get_trace_optimal(trace_id: int) -> List[Tuple]:
+        """Get the stored optimal baselines of a trace.
+        
+        Args:
+            trace_id: The trace ID
+        
+        Returns:
+            List of tuples: (variant, capacity, requests, hits, cost, miss_penalty)
+        """
+        cursor = DBAccess.reader().execute("""
+            SELECT Variant, Capacity, Requests, Hits, Cost, Miss_Penalty
+            FROM Trace_Optimal
+            WHERE Trace_ID = ?
+            ORDER BY Capacity, Variant""", [trace_id])
+
+        return cursor.fetchall()
+
+    @staticmethod
+    def get_run_totals(run_id: int) -> Optional[Tuple]:
+        """Get the hit and cost totals of a run.
+        
+        Args:
+            run_id: The run ID
+        
+        Returns:
+            Tuple (trace_id, requests, hits, total_cost), or None if not found
+        """
+        cursor = DBAccess.reader().execute("""
+            SELECT RUN.Trace_ID, COUNT(REQ.id), SUM(REQ.hit), RUN.Total_Cost
+            FROM Runs RUN LEFT JOIN Requests REQ ON REQ.Run_ID = RUN.id
+            WHERE RUN.id = ?
+            GROUP BY RUN.id""", [run_id])
+
+        return cursor.fetchone()
+
     @staticmethod
     def get_run_requests(run_id: int) -> List[Tuple]:
         """Get all requests for a specific run.
@@ -98,58 +159,117 @@ class UIRepository:
             run_id: The run ID
             
         Returns:
-            List of tuples: (request_id, time, url)
+            List of tuples: (request_id, url, elapsed_ms, download_bytes,
+                             connect_ms, ttfb_ms, transfer_ms, total_ms)
         """
         
-        DBAccess.cursor.execute("""
-            SELECT id, URL, elapsed_ms, download_bytes
+        cursor = DBAccess.reader().execute("""
+            SELECT id, URL, elapsed_ms, download_bytes,
+                   connect_ms, ttfb_ms, transfer_ms, total_ms
             FROM Requests
             WHERE run_id = ?
             ORDER BY id ASC""", [run_id])
 
-        return DBAccess.cursor.fetchall()
+        return cursor.fetchall()
     
     @staticmethod
     def get_all_traces() -> List[Tuple]:
         """Get all traces with entry counts.
         
+        Entries of traces whose profile covers their last entry come from
+        Trace_Stats; only the other traces are counted.
+        
         Returns:
             List of tuples: (trace_id, name, key_count, last_update)
         """
-        DBAccess.cursor.execute("""
-            SELECT T.id, T.Name, COUNT(K.id), T.Last_Update
-            FROM Traces T
-            JOIN Trace_Entry K ON T.id = K.Trace_ID
-            GROUP BY T.id
+        cursor = DBAccess.reader().execute("""
+            WITH Latest AS (
+                SELECT T.id, T.Name, T.Last_Update,
+                       (SELECT MAX(K.id) FROM Trace_Entry K WHERE K.Trace_ID = T.id) Max_ID
+                FROM Traces T)
+            SELECT L.id, L.Name,
+                   CASE WHEN S.Max_ID = L.Max_ID THEN S.Entries
+                        ELSE (SELECT COUNT(*) FROM Trace_Entry K WHERE K.Trace_ID = L.id)
+                   END,
+                   L.Last_Update
+            FROM Latest L
+            LEFT JOIN Trace_Stats S ON S.Trace_ID = L.id
+            WHERE L.Max_ID IS NOT NULL
+            ORDER BY L.id
         """)
-        return DBAccess.cursor.fetchall()
+        return cursor.fetchall()
+    
+    @staticmethod
+    def get_trace_stats() -> Dict[int, Tuple]:
+        """Get the stored profiles of all profiled traces.
+        
+        A profile is stale when the trace's last entry is not the one it
+        covers - entries were appended, or the last ones deleted, since.
+        
+        Returns:
+            dict: trace_id -> (entries, distinct, one_hit, alpha, ws_mean, ws_max, stale)
+        """
+        cursor = DBAccess.reader().execute("""
+            SELECT S.Trace_ID, S.Entries, S.Distinct_URLs, S.One_Hit, S.Alpha,
+                   CASE WHEN S.WS_Windows THEN 1.0 * S.WS_Sum / S.WS_Windows END, S.WS_Max,
+                   S.Max_ID IS NOT (SELECT MAX(K.id) FROM Trace_Entry K
+                                    WHERE K.Trace_ID = S.Trace_ID)
+            FROM Trace_Stats S
+        """)
+        return {row[0]: row[1:] for row in cursor.fetchall()}
+    
+    @staticmethod
+    def get_trace_url_counts(trace_id: int, limit: int = 0) -> List[Tuple]:
+        """Get the most requested URLs of a profiled trace.
+        
+        URL variants with the same canonical key are counted together.
+        
+        Args:
+            trace_id: The trace ID
+            limit: Number of URLs to return (0 = all)
+            
+        Returns:
+            List of tuples: (url, count), most requested first
+        """
+        cursor = DBAccess.reader().execute("""
+            SELECT URL, Count
+            FROM Trace_URL_Counts
+            WHERE Trace_ID = ?
+            ORDER BY Count DESC
+            LIMIT ?""", [trace_id, limit or -1])
+        return cursor.fetchall()
+    
+    @staticmethod
+    def get_trace_length(trace_id: int) -> int:
+        """Get the number of entries of a trace.
+        
+        Args:
+            trace_id: The trace ID
+        
+        Returns:
+            int: Number of Trace_Entry rows of the trace
+        """
+        cursor = DBAccess.reader().execute("SELECT COUNT(*) FROM Trace_Entry WHERE Trace_ID = ?",
+                                           [trace_id])
+        return cursor.fetchone()[0]
     
     @staticmethod
-    def get_trace_entries(trace_id: int, group_by_url: bool = False) -> List[Tuple]:
+    def get_trace_entries(trace_id: int) -> List[Tuple]:
         """Get entries for a specific trace.
         
         Args:
             trace_id: The trace ID
-            group_by_url: If True, group by URL and show count; else show individual entries
             
         Returns:
-            List of tuples with URL data
+            List of tuples: (url,), in trace order
         """
-        if group_by_url:
-            DBAccess.cursor.execute("""
-                SELECT URL, COUNT(id) as count
-                FROM Trace_Entry
-                WHERE Trace_ID = ?
-                GROUP BY URL
-                ORDER BY COUNT(id)
-            """, [trace_id])
-        else:
-            DBAccess.cursor.execute("""
-                SELECT URL
-                FROM Trace_Entry
-                WHERE Trace_ID = ?
-            """, [trace_id])
-        return DBAccess.cursor.fetchall()
+        cursor = DBAccess.reader().execute("""
+            SELECT URL
+            FROM Trace_Entry
+            WHERE Trace_ID = ?
+            ORDER BY id
+        """, [trace_id])
+        return cursor.fetchall()
 
     
     @staticmethod
@@ -160,27 +280,29 @@ class UIRepository:
             count: Number of recent requests to fetch
             
         Returns:
-            List of tuples: (url, elapsed_ms)
+            List of tuples: (request_id, url, elapsed_ms, download_bytes,
+                             connect_ms, ttfb_ms, transfer_ms, total_ms)
         """
-        DBAccess.cursor.execute("""
-            SELECT id, URL, elapsed_ms, download_bytes
+        cursor = DBAccess.reader().execute("""
+            SELECT id, URL, elapsed_ms, download_bytes,
+                   connect_ms, ttfb_ms, transfer_ms, total_ms
             FROM Requests
             ORDER BY id DESC
             LIMIT ?
         """, [count])
-        rows = DBAccess.cursor.fetchall()
+        rows = cursor.fetchall()
         rows.reverse()  # Reverse to get chronological order
 
         return rows
 
     @staticmethod
     def get_caches(run_id):
-        DBAccess.cursor.execute(
+        cursor = DBAccess.reader().execute(
             """SELECT Name, Access_Cost
             FROM Caches
             WHERE Run_ID = ?""", [run_id]
         )
 
-        results = DBAccess.cursor.fetchall()
+        results = cursor.fetchall()
 
         return results
\ No newline at end of file